@@ -0,0 +1,220 @@
+from itertools import compress, groupby, islice
+
+from app.db.columns import EXACT, View, and_, is_number
+from app.db.query import MISSING, QueryError, compile_query, order_key, sort_order
+
+ACCUMULATORS = ('$count', '$sum', '$avg', '$min', '$max')
+# comparisons with a number that run over a column's numbers
+VECTOR_OPS = ('$eq', '$lt', '$lte', '$gt', '$gte')
+
+
+def field_ref(value) -> str | None:
+    """Field named by a `"$field"` reference, None for a constant."""
+    if isinstance(value, str) and len(value) > 1 and value.startswith('$'):
+        return value[1:]
+    return None
+
+
+def parse_group(spec) -> list[tuple[str, str, object]]:
+    """`(output field, accumulator, argument)` of every accumulator of a `$group` spec."""
+    if not isinstance(spec, dict) or '_id' not in spec:
+        raise QueryError('$group expects an _id')
+    if isinstance(spec['_id'], (dict, list)):
+        raise QueryError('$group _id must be a "$field" or a constant')
+    accumulators = []
+    for name, accumulator in spec.items():
+        if name == '_id':
+            continue
+        if not isinstance(accumulator, dict) or len(accumulator) != 1:
+            raise QueryError(f'{name} expects one accumulator')
+        (op, arg), = accumulator.items()
+        if op not in ACCUMULATORS:
+            raise QueryError(f'Unknown accumulator: {op}')
+        if op == '$count':
+            if arg != {}:
+                raise QueryError('$count expects {}')
+        elif op == '$sum' and is_number(arg):
+            pass
+        elif field_ref(arg) is None:
+            raise QueryError(f'{op} expects a "$field"')
+        accumulators.append((name, op, arg))
+    return accumulators
+
+
+def parse_pipeline(pipeline) -> list[tuple[str, object]]:
+    """Check a pipeline and return its stages as `(stage, spec)` pairs.
+
+    `{"$match": query}` keeps the documents matching a filter document.
+    `{"$group": {"_id": "$field", "out": {"$sum": "$field"}, ...}}` makes
+    one document per distinct value of `_id` (null or a constant for a
+    single group) with the accumulators `$count` (of `{}`), `$sum` (of a
+    field or a number), `$avg`, `$min` and `$max`. `$sum` and `$avg`
+    ignore values that aren't numbers, `$min` and `$max` missing and null
+    ones. `{"$sort": {"field": 1 or -1, ...}}` and `{"$limit": n}`.
+    """
+    if not isinstance(pipeline, list):
+        raise QueryError('A pipeline must be a list of stages')
+    stages = []
+    for stage in pipeline:
+        if not isinstance(stage, dict) or len(stage) != 1:
+            raise QueryError('A stage must be an object with one key')
+        (name, spec), = stage.items()
+        match name:
+            case '$match':
+                compile_query(spec)
+            case '$group':
+                parse_group(spec)
+            case '$sort':
+                sort_order(spec)
+            case '$limit':
+                if not isinstance(spec, int) or isinstance(spec, bool) or spec < 0:
+                    raise QueryError('$limit expects a non-negative integer')
+            case _:
+                raise QueryError(f'Unknown stage: {name}')
+        stages.append((name, spec))
+    return stages
+
+
+def vector_terms(query: dict | None) -> tuple[list[tuple[str, str, object]], bool]:
+    """Conditions of `query` comparing a field to a number, and whether they are all of it."""
+    terms, covered = [], True
+    for key, spec in (query or {}).items():
+        if key.startswith('$'):
+            covered = False
+            continue
+        if isinstance(spec, dict) and spec and all(op.startswith('$') for op in spec):
+            ops = spec.items()
+        else:
+            ops = [('$eq', spec)]
+        for op, value in ops:
+            if op in VECTOR_OPS and is_number(value) and not (isinstance(value, int) and abs(value) > EXACT):
+                terms.append((key, op, value))
+            else:
+                covered = False
+    return terms, covered
+
+
+def column_fields(stages: list[tuple[str, object]]) -> set[str]:
+    """Fields read column-wise, by the stages up to the first `$group` or `$sort`."""
+    fields = set()
+    for name, spec in stages:
+        if name == '$match':
+            fields.update(field for field, _, _ in vector_terms(spec)[0])
+        elif name == '$group':
+            refs = [spec['_id']] + [arg for _, _, arg in parse_group(spec)]
+            fields.update(field for field in map(field_ref, refs) if field is not None)
+            break
+        elif name == '$sort':
+            break
+    return fields
+
+
+def match(view: View, selection: bytearray, query: dict | None) -> bytearray:
+    """Comparisons with numbers are ANDed into `selection` column by
+    column; the rest of the query, if any, runs on the selected docs."""
+    terms, covered = vector_terms(query)
+    for field, op, value in terms:
+        mask = view.column(field).compare(op, value, len(selection))
+        if mask is None:
+            covered = False
+        else:
+            selection = and_(selection, mask)
+    if covered:
+        return selection
+    predicate, doc = compile_query(query), view.doc
+    return bytearray(selected and predicate(doc(row)) for row, selected in zip(view.rows, selection))
+
+
+def limit(selection: bytearray, n: int) -> bytearray:
+    """`selection` with only its first `n` rows still selected."""
+    if n == 0:
+        return bytearray(len(selection))
+    last = next(islice(compress(range(len(selection)), selection), n - 1, None), None)
+    if last is None:
+        return selection
+    return selection[:last + 1] + bytearray(len(selection) - last - 1)
+
+
+def accumulate(view: View, op: str, arg, members: list[int]):
+    if op == '$count':
+        return len(members)
+    if op == '$sum' and is_number(arg):
+        return arg * len(members)
+    column = view.column(field_ref(arg))
+    values = column.values.__getitem__
+    numbers = list(compress(map(values, members), map(column.numeric.__getitem__, members)))
+    match op:
+        case '$sum':
+            return sum(numbers)
+        case '$avg':
+            return sum(numbers) / len(numbers) if numbers else None
+    if column.numbers_only:
+        if not numbers:
+            return None
+        return min(numbers) if op == '$min' else max(numbers)
+    present = [value for value in map(values, members) if value is not MISSING and value is not None]
+    if not present:
+        return None
+    return min(present, key=order_key) if op == '$min' else max(present, key=order_key)
+
+
+def group(view: View, selection: bytearray, spec: dict) -> list[dict]:
+    """Rows are grouped by sorting the selected positions on the
+    dictionary codes of the `_id` column, accumulators reduce each
+    group's slice of the columns."""
+    accumulators = parse_group(spec)
+    positions = list(compress(range(len(selection)), selection))
+    key = field_ref(spec['_id'])
+    if key is None:
+        groups = [(spec['_id'], positions)] if positions else []
+    else:
+        column = view.column(key)
+        code = column.encoded().__getitem__
+        groups = [(column.dictionary[value], list(members))
+                  for value, members in groupby(sorted(positions, key=code), code)]
+    docs = []
+    for value, members in groups:
+        doc = {'_id': value}
+        for name, op, arg in accumulators:
+            doc[name] = accumulate(view, op, arg, members)
+        docs.append(doc)
+    return docs
+
+
+def sort(docs: list, spec: dict) -> list:
+    key, reverse = sort_order(spec)
+    return sorted(docs, key=key, reverse=reverse)
+
+
+def run_pipeline(view: View, stages: list[tuple[str, object]]) -> list[dict]:
+    """Run `stages` over the live rows of `view`.
+
+    Up to the first `$group` or `$sort` the stages narrow a mask of the
+    selected rows, from there on they work on the list of documents
+    those produced.
+    """
+    selection, docs = view.live, None
+    for name, spec in stages:
+        if docs is None:
+            match name:
+                case '$match':
+                    selection = match(view, selection, spec)
+                case '$limit':
+                    selection = limit(selection, spec)
+                case '$group':
+                    docs = group(view, selection, spec)
+                case '$sort':
+                    docs = sort(view.docs(selection), spec)
+            continue
+        match name:
+            case '$match':
+                predicate = compile_query(spec)
+                docs = [doc for doc in docs if predicate(doc)]
+            case '$limit':
+                docs = docs[:spec]
+            case '$group':
+                rows = View(docs, doc=lambda doc: doc)
+                docs = group(rows, rows.live, spec)
+            case '$sort':
+                docs = sort(docs, spec)
+    return view.docs(selection) if docs is None else docs
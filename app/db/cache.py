@@ -0,0 +1,149 @@
+import json
+import pickle
+from collections import OrderedDict
+from typing import Iterable, Iterator
+
+from app.db.query import compile_query, conjuncts
+
+ANY = '*'
+
+
+class Entry:
+    __slots__ = ('rows', 'ids', 'predicate', 'field', 'size')
+
+    def __init__(self, rows: list[dict], predicate, field: str, size: int) -> None:
+        self.rows = rows
+        self.ids = {row['_id'] for row in rows}
+        self.predicate = predicate
+        self.field = field
+        self.size = size
+
+
+class QueryCache:
+    """`find` results keyed by normalized query, limit and sort.
+
+    A result is only cached when no commit changed data while it was
+    computed, i.e. `collection.version` is the same before and after.
+    A writing commit bumps the version and drops the entries it may
+    change: those holding a changed `_id` and those whose query matches
+    an inserted doc. An entry is filed under one top-level field every
+    match must have, so only entries filed under a field of an inserted
+    doc (or under `ANY`) run their predicate.
+
+    Results reflect committed data only, so they can serve transactions
+    that read the latest committed state, or a snapshot taken at the
+    current version, and wrote nothing; see `usable`. Least recently
+    used entries are evicted past `max_bytes`.
+    """
+
+    def __init__(self, collection, max_bytes: int, max_rows: int) -> None:
+        self.collection = collection
+        self.lock = collection.version_lock
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.entries: OrderedDict[tuple, Entry] = OrderedDict()
+        self.by_id: dict[int, set[tuple]] = {}
+        self.by_field: dict[str, set[tuple]] = {}
+        self.bytes = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'bypassed': 0,
+            'invalidations': 0,
+            'evictions': 0,
+        }
+
+    @staticmethod
+    def key(query: dict | None, limit: int | None, sort: dict | None = None) -> tuple:
+        return (json.dumps(query or {}, sort_keys=True, default=str), -1 if limit is None else limit,
+                json.dumps(sort) if sort else '')
+
+    def usable(self, t) -> bool:
+        if self.max_bytes <= 0 or not t.cacheable or t.rollback_actions or \
+                t.snapshot not in (None, self.collection.version):
+            self.stats['bypassed'] += 1
+            return False
+        return True
+
+    def get(self, key: tuple) -> list[dict] | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry.rows
+
+    def fill(self, key: tuple, version: int, query: dict | None, rows: Iterable[dict]) -> Iterator[dict]:
+        """Pass `rows` through and cache them once they are all consumed."""
+        kept = []
+        for row in rows:
+            if kept is not None:
+                kept.append(row)
+                if len(kept) > self.max_rows:
+                    kept = None
+            yield row
+        if kept is not None:
+            self.put(key, version, query, kept)
+
+    def put(self, key: tuple, version: int, query: dict | None, rows: list[dict]) -> None:
+        size = len(pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        fields = sorted({field.split('.')[0] for field in conjuncts(query)})
+        entry = Entry(rows, compile_query(query), fields[0] if fields else ANY, size)
+        with self.lock:
+            if version != self.collection.version or key in self.entries:
+                return
+            self.entries[key] = entry
+            self.bytes += size
+            for _id in entry.ids:
+                self.by_id.setdefault(_id, set()).add(key)
+            self.by_field.setdefault(entry.field, set()).add(key)
+            while self.bytes > self.max_bytes:
+                self.drop(next(iter(self.entries)))
+                self.stats['evictions'] += 1
+
+    def drop(self, key: tuple) -> None:
+        """Remove an entry. Called with `lock` held."""
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+        for _id in entry.ids:
+            keys = self.by_id[_id]
+            keys.discard(key)
+            if not keys:
+                del self.by_id[_id]
+        keys = self.by_field[entry.field]
+        keys.discard(key)
+        if not keys:
+            del self.by_field[entry.field]
+
+    def invalidate(self, ops: list[tuple]) -> None:
+        """Drop the entries a commit's `ops` may change. Called with `lock` held."""
+        affected = set()
+        for op in ops:
+            affected.update(self.by_id.get(op[1], ()))
+        docs = [op[3] for op in ops if op[0] == 'insert']
+        candidates = set(self.by_field.get(ANY, ()))
+        for doc in docs:
+            if isinstance(doc, dict):
+                for field in doc:
+                    candidates.update(self.by_field.get(field, ()))
+        for key in candidates - affected:
+            predicate = self.entries[key].predicate
+            if any(predicate(doc) for doc in docs):
+                affected.add(key)
+        for key in affected:
+            self.drop(key)
+        self.stats['invalidations'] += len(affected)
+
+    def clear(self) -> None:
+        with self.lock:
+            for key in list(self.entries):
+                self.drop(key)
+
+    def describe(self) -> dict:
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), bytes=self.bytes, max_bytes=self.max_bytes,
+                        version=self.collection.version)
@@ -0,0 +1,98 @@
+import itertools
+import threading
+from collections import deque
+from typing import Callable
+
+from app.db.exeptions import ChangeStreamException
+
+
+class ChangeLog:
+    """The last `size` committed changes, for change streams.
+
+    Every writing commit appends one change per document it inserted,
+    updated or deleted: `{position, version, op, _id, name, doc}`, where
+    `position` numbers the changes from 1 on, `version` is the commit's
+    sequence number and `doc` is the deleted doc for a delete.
+
+    Subscribers read at their own pace from the position they got to,
+    commits never wait for them. One that falls so far behind that the
+    changes past its position were dropped gets `ChangeStreamException`
+    and has to read the data again. Callbacks given to `subscribe` are
+    called after each append, on the committing thread, so they must be
+    quick and must not raise.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.events: deque[dict] = deque(maxlen=max(size, 0))
+        # position of the last change
+        self.position = 0
+        self.lock = threading.Lock()
+        self.subscribers: list[Callable[[], None]] = []
+        self.stats = {
+            'published': 0,
+            'reads': 0,
+            'expired': 0,
+        }
+
+    def publish(self, ts: int, actions: list, ops: list[tuple]) -> None:
+        """Append the changes of the commit `ts`. Called with `version_lock` held."""
+        if self.size <= 0:
+            return
+        inserted = {op[1] for op in ops if op[0] == 'insert'}
+        deleted = {op[1] for op in ops if op[0] == 'delete'}
+        # the versions this commit expired that an earlier one made visible
+        expired = {record._id: record for action, record in actions if action == 'add' and record.created_ts != ts}
+        events = []
+        for op in ops:
+            if op[0] == 'insert':
+                events.append(('update' if op[1] in deleted else 'insert', op[1], op[2], op[3]))
+            elif op[1] not in inserted:
+                record = expired.get(op[1])
+                events.append(('delete', op[1], record and record.name, record and record.doc))
+        with self.lock:
+            for kind, _id, name, doc in events:
+                self.position += 1
+                self.events.append({'position': self.position, 'version': ts, 'op': kind,
+                                    '_id': _id, 'name': name, 'doc': doc})
+            self.stats['published'] += len(events)
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            callback()
+
+    def read(self, after: int | None, predicate=None, limit: int = 1000) -> tuple[list[dict], int]:
+        """Changes past position `after` matching `predicate`, out of the next `limit`,
+        and the position to read on from. None reads from the next change on."""
+        if self.size <= 0:
+            raise ChangeStreamException('Change streams are off')
+        with self.lock:
+            position = self.position
+            if after is None:
+                return [], position
+            if after > position:
+                raise ChangeStreamException(f'Position {after} is past the last change {position}')
+            oldest = position - len(self.events)
+            if after < oldest:
+                self.stats['expired'] += 1
+                raise ChangeStreamException(f'Position {after} is no longer in the change log, '
+                                            f'it starts after {oldest}')
+            batch = list(itertools.islice(self.events, after - oldest, after - oldest + limit))
+            self.stats['reads'] += 1
+        if batch:
+            after = batch[-1]['position']
+        if predicate is not None:
+            batch = [event for event in batch if predicate(event['doc'] or {})]
+        return batch, after
+
+    def subscribe(self, callback: Callable[[], None]) -> None:
+        with self.lock:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[], None]) -> None:
+        with self.lock:
+            self.subscribers.remove(callback)
+
+    def describe(self) -> dict:
+        with self.lock:
+            return dict(self.stats, size=self.size, position=self.position, changes=len(self.events),
+                        subscribers=len(self.subscribers))
@@ -0,0 +1,207 @@
+import logging
+import os
+import pickle
+import threading
+import time
+
+from app.db.collection import Collection
+from app.db.segment import Segment
+from app.db.store import RecordStore
+from app.db.wal import WriteAheadLog
+from app.utils import metrics
+from app.utils.fs import write_atomic
+
+logger = logging.getLogger("database")
+
+SECONDS = {kind: metrics.registry.histogram('database_checkpoint_seconds', 'Checkpoint duration.', kind=kind)
+           for kind in ('full', 'delta')}
+
+
+class Checkpointer:
+    """Incremental checkpoints of the committed state.
+
+    A checkpoint is a full image (`<lsn>.seg`, see `Segment`) followed by
+    deltas (`<lsn>.delta`) holding only the `_id`s committed since the
+    previous checkpoint. `MANIFEST` names the current chain and the lsn it covers,
+    with the index definitions; every file is written to a temp file and
+    renamed into place.
+
+    Commits are held back only while the dirty set is swapped and the WAL
+    is rotated. Records are read afterwards while writers keep going, so
+    an `_id` may be saved with changes newer than the checkpoint lsn; WAL
+    replay rewrites the full state of every `_id` it touches, which makes
+    this harmless.
+
+    Pickled full images (`<lsn>.full`) and the old `db.pickle` dump are
+    still read; `migrate` is set so that the caller writes a segment.
+    """
+    MANIFEST = 'MANIFEST'
+
+    def __init__(self, collection: Collection, wal: WriteAheadLog, directory: str, legacy_filename: str | None = None,
+                 interval_s: float = 60, wal_bytes: int = 64 << 20, max_deltas: int = 8, retain: int = 2) -> None:
+        self.collection = collection
+        self.wal = wal
+        self.directory = directory
+        self.legacy_filename = legacy_filename
+        self.interval_s = interval_s
+        self.wal_bytes = wal_bytes
+        self.max_deltas = max_deltas
+        self.retain = max(retain, 1)
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.manifest = {'lsn': 0, 'full': None, 'deltas': [], 'indexes': []}
+        self.migrate = False
+        self.stats = {
+            'checkpoints': 0,
+            'last_kind': None,
+            'last_lsn': 0,
+            'last_records': 0,
+            'last_bytes': 0,
+            'last_duration_s': 0.0,
+            'total_bytes': 0,
+        }
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def read(path: str):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def load(self) -> tuple[RecordStore, int, int]:
+        """Open the current checkpoint, returns the store, its lsn and `next_doc`."""
+        try:
+            self.manifest = Checkpointer.read(self.path(self.MANIFEST))
+        except FileNotFoundError:
+            return self.load_legacy()
+
+        record_class = self.collection.record_class
+        full = self.path(self.manifest['full'])
+        if Segment.is_segment(full):
+            base = Segment(full, record_class)
+            store, next_doc = self.collection.new_store(base=base), base.next_doc
+        else:
+            logger.info(f'Migrating {full} to a segment')
+            self.migrate = True
+            records = (record_class.from_dict(record) for record in Checkpointer.read(full))
+            store, next_doc = self.collection.new_store(records), 0
+        for name in self.manifest['deltas']:
+            for _id, record in Checkpointer.read(self.path(name)).items():
+                for version in list(store.chain(_id)):
+                    store.remove(version)
+                if isinstance(record, dict):
+                    record = record_class.from_dict(record)
+                if record is not None:
+                    store.append(record)
+        return store, self.manifest['lsn'], next_doc
+
+    def load_legacy(self) -> tuple[RecordStore, int, int]:
+        if not self.legacy_filename:
+            return self.collection.new_store(), 0, 0
+        try:
+            data = Checkpointer.read(self.legacy_filename)
+        except pickle.UnpicklingError:
+            logger.critical('UnpicklingError', exc_info=True)
+            return self.collection.new_store(), 0, 0
+        except FileNotFoundError:
+            logger.warning('Database files not found!')
+            return self.collection.new_store(), 0, 0
+        if isinstance(data, list):
+            data = {'lsn': 0, 'records': data}
+        logger.info(f'Migrating {self.legacy_filename} to a segment')
+        self.migrate = True
+        records = [self.collection.record_class.from_dict(dict(record, created_id=0, expired_id=0))
+                   for record in data['records']]
+        return self.collection.new_store(records), data['lsn'], 0
+
+    def run(self, full: bool = False) -> dict:
+        with self.lock:
+            started = time.monotonic()
+            full = full or self.manifest['full'] is None or len(self.manifest['deltas']) >= self.max_deltas
+            with self.wal.pause():
+                dirty = self.collection.take_dirty()
+                lsn = self.wal.rotate()
+            if not full and not dirty:
+                return dict(self.stats)
+            try:
+                if full:
+                    kind, ids = 'full', sorted(self.collection.records.ids())
+                else:
+                    kind, ids = 'delta', dirty
+                written, records = self.write(lsn, kind, ids)
+            except Exception:
+                self.collection.mark_dirty(dirty)
+                raise
+            self.wal.purge(lsn)
+            if full:
+                self.migrate = False
+                self.expire()
+
+            duration = time.monotonic() - started
+            self.stats['checkpoints'] += 1
+            self.stats['last_kind'] = kind
+            self.stats['last_lsn'] = lsn
+            self.stats['last_records'] = records
+            self.stats['last_bytes'] = written
+            self.stats['last_duration_s'] = duration
+            self.stats['total_bytes'] += written
+            SECONDS[kind].observe(duration)
+            logger.info('Checkpoint %s at lsn %s: %s records, %s bytes in %.3fs', kind, lsn, records, written, duration)
+            return dict(self.stats)
+
+    def write(self, lsn: int, kind: str, ids) -> tuple[int, int]:
+        if kind == 'full':
+            name = f'{lsn:020d}.seg'
+            count = 0
+
+            def committed():
+                nonlocal count
+                for _id in ids:
+                    record = self.collection.committed_version(_id)
+                    if record is not None:
+                        count += 1
+                        yield record
+
+            written = Segment.write(self.path(name), committed(), lsn, self.collection.next_doc)
+            manifest = {'lsn': lsn, 'full': name, 'deltas': [], 'indexes': self.collection.index_specs()}
+        else:
+            name = f'{lsn:020d}.delta'
+            snapshot = {_id: self.collection.committed_version(_id) for _id in ids}
+            data = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+            write_atomic(self.path(name), data)
+            written, count = len(data), len(snapshot)
+            manifest = {'lsn': lsn, 'full': self.manifest['full'], 'deltas': self.manifest['deltas'] + [name],
+                        'indexes': self.collection.index_specs()}
+        manifest_data = pickle.dumps(manifest, protocol=pickle.HIGHEST_PROTOCOL)
+        write_atomic(self.path(self.MANIFEST), manifest_data)
+        self.manifest = manifest
+        return written + len(manifest_data), count
+
+    def expire(self) -> None:
+        """Keep the `retain` most recent full checkpoints and the deltas built on them."""
+        fulls = sorted(name for name in os.listdir(self.directory) if name.endswith(('.seg', '.full')))
+        if len(fulls) <= self.retain:
+            return
+        oldest = fulls[-self.retain]
+        # scan workers map the segment the store was loaded from by name
+        base = self.collection.records.base
+        in_use = os.path.basename(base.path) if base is not None else None
+        for name in os.listdir(self.directory):
+            if name.endswith(('.seg', '.full', '.delta', '.tmp')) and name < oldest and name != in_use:
+                os.remove(self.path(name))
+
+    def daemon(self) -> None:
+        last = time.monotonic()
+        while not self.closed.wait(1):
+            if time.monotonic() - last < self.interval_s and self.wal.segment_bytes < self.wal_bytes:
+                continue
+            try:
+                self.run()
+            except Exception:
+                logger.critical('Checkpoint failed', exc_info=True)
+            last = time.monotonic()
+
+    def close(self) -> None:
+        self.closed.set()
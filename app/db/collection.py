@@ -1,26 +1,229 @@
 # import logging
 import threading
+from collections import Counter, deque
+from contextlib import nullcontext
 
+from app.db.index import Index, IndexType, make_index
 from app.db.lock_manager import LockManager
+from app.db.query import Plan, make_plan
+from app.db.record import PENDING, BaseRecord, record_class
+from app.db.partition import make_store
+from app.db.wal import WriteAheadLog
 
 
 class Collection:
-    def __init__(self, next_doc=0):
+    def __init__(self, next_doc=0, compact=False, lock_timeout_s=5, partitions=1):
         self.lock = threading.Lock()
+        self.identity_lock = threading.Lock()
+        self.record_class = record_class(compact)
         self.next_id = 0
         self.next_doc = next_doc
         self.active_ids = set()
-        self.records = []
-        self.locks = LockManager()
+        # snapshots of the running snapshot transactions, with their counts
+        self.snapshots: Counter[int] = Counter()
+        # the same for transactions validated at commit, and the commits they validate against
+        self.validating: Counter[int] = Counter()
+        self.commit_log: deque[tuple[int, frozenset, list]] = deque()
+        self.validation_lock = threading.Lock()
+        self.partitions = partitions
+        self.records = self.new_store()
+        self.locks = LockManager(timeout_s=lock_timeout_s)
+        self.indexes: dict[str, Index] = {}
+        self.wal: WriteAheadLog | None = None
+        self.dirty: set[int] = set()
+        self.garbage: deque[BaseRecord] = deque()
+        # commit sequence number of the last commit that changed data
+        self.version = 0
+        self.version_lock = threading.Lock()
+        # committed versions still current, and expired ones not vacuumed yet; changed under `version_lock`
+        self.live = 0
+        self.dead = 0
+        self.cache = None
+        self.columns = None
+        self.changes = None
+
+    def new_store(self, records=(), base=None):
+        return make_store(self.partitions, records, base)
 
     def begin(self, transaction_type):
-        self.lock.acquire()
-        self.next_id += 1
-        self.active_ids.add(self.next_id)
-        self.lock.release()
-        return transaction_type(self, self.next_id)
+        with self.lock:
+            self.next_id += 1
+            t = transaction_type(self, self.next_id)
+            self.active_ids.add(t.id)
+            if t.snapshot is not None:
+                self.snapshots[t.snapshot] += 1
+            if t.read_point is not None:
+                self.snapshots[t.read_point] += 1
+            if t.validates:
+                self.validating[t.snapshot] += 1
+        return t
+
+    def end(self, t) -> None:
+        with self.lock:
+            self.active_ids.discard(t.id)
+            if t.snapshot is not None:
+                self.unpin(t.snapshot)
+            if t.read_point is not None:
+                self.unpin(t.read_point)
+                t.read_point = None
+            if t.validates:
+                self.validating[t.snapshot] -= 1
+                if not self.validating[t.snapshot]:
+                    del self.validating[t.snapshot]
+
+    def read_latest(self, t) -> None:
+        """Move the read point of `t` to the last commit, for a new statement."""
+        with self.lock:
+            if t.read_point is None or t.read_point == self.version:
+                return
+            self.unpin(t.read_point)
+            t.read_point = self.version
+            self.snapshots[t.read_point] += 1
+
+    def unpin(self, snapshot: int) -> None:
+        """Called with `lock` held."""
+        self.snapshots[snapshot] -= 1
+        if not self.snapshots[snapshot]:
+            del self.snapshots[snapshot]
+
+    def horizon(self) -> int:
+        """Versions expired at or before this commit sequence number are invisible to everyone."""
+        with self.lock:
+            return min(self.snapshots, default=self.version)
 
     def identity(self):
-        self.lock.acquire()
-        self.next_doc += 1
-        return self.next_doc
+        with self.identity_lock:
+            self.next_doc += 1
+            return self.next_doc
+
+    def identity_range(self, count: int) -> range:
+        with self.identity_lock:
+            start = self.next_doc + 1
+            self.next_doc += count
+            return range(start, start + count)
+
+    @staticmethod
+    def is_committed(record) -> bool:
+        return record.created_ts != PENDING and record.expired_ts == PENDING
+
+    def committed_version(self, _id: int) -> BaseRecord | None:
+        for record in list(self.records.peek(_id)):
+            if self.is_committed(record):
+                return record.copy(created_id=0, expired_id=0, created_ts=0, expired_ts=PENDING)
+        return None
+
+    def mark_dirty(self, ids) -> None:
+        self.dirty.update(ids)
+
+    def take_dirty(self) -> set[int]:
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def committed(self, actions: list, ops: list[tuple]) -> None:
+        """Make a commit visible: stamp the versions it wrote and expired with
+        the next commit sequence number, then publish that as `version`.
+
+        A commit that changed nothing only wrote versions it expired itself,
+        invisible at any sequence number, and doesn't take a new one.
+        """
+        with self.version_lock:
+            ts = self.version + 1 if ops else self.version
+            live = dead = 0
+            for action, record in actions:
+                # a version is created before it is expired, so `created_ts == ts` marks this commit's own
+                if action == 'delete':
+                    record.created_ts = ts
+                    live += record.expired_id == 0
+                elif action == 'add':
+                    record.expired_ts = ts
+                    live -= record.created_ts != ts
+                    dead += 1
+            self.version = ts
+            self.live += live
+            self.dead += dead
+            if ops:
+                self.log_commit(ts, ops, actions)
+                if self.cache is not None:
+                    self.cache.invalidate(ops)
+                if self.columns is not None:
+                    self.columns.apply(actions)
+                if self.changes is not None:
+                    self.changes.publish(ts, actions, ops)
+
+    def reclaimed(self, count: int) -> None:
+        """`count` dead versions were removed."""
+        with self.version_lock:
+            self.dead -= count
+
+    def log_commit(self, ts: int, ops: list[tuple], actions: list) -> None:
+        """Keep the `_id`s and versions a commit wrote and expired while a
+        validating transaction may need them. Called with `version_lock` held."""
+        with self.lock:
+            oldest = min(self.validating, default=None)
+        log = self.commit_log
+        if oldest is None:
+            log.clear()
+            return
+        log.append((ts, frozenset(op[1] for op in ops), [record for _, record in actions]))
+        while log[0][0] <= oldest:
+            log.popleft()
+
+    def commits_since(self, snapshot: int) -> list[tuple[int, frozenset, list]]:
+        with self.version_lock:
+            return [entry for entry in self.commit_log if entry[0] > snapshot]
+
+    def committing(self):
+        return self.wal.transaction() if self.wal is not None else nullcontext()
+
+    def create_index(self, name: str, field: str, index_type: IndexType) -> Index:
+        """Index definitions go to the WAL and the checkpoint MANIFEST, see `index_specs`;
+        the indexes are rebuilt when the data is loaded."""
+        with self.lock:
+            if name in self.indexes:
+                raise ValueError(f'Index {name} already exists')
+            index = make_index(name, field, index_type, lambda _id: self.records.peek(_id))
+            # published before the backfill so concurrent inserts are indexed too
+            self.indexes = dict(self.indexes, **{name: index})
+        try:
+            self.log_schema({'create_index': index.spec()})
+        except BaseException:
+            with self.lock:
+                self.indexes = {key: value for key, value in self.indexes.items() if value is not index}
+            raise
+        for record in self.records:
+            index.add(record)
+        return index
+
+    def drop_index(self, name: str) -> None:
+        if name not in self.indexes:
+            raise KeyError(f'Index {name} not found')
+        self.log_schema({'drop_index': name})
+        with self.lock:
+            if name not in self.indexes:
+                raise KeyError(f'Index {name} not found')
+            self.indexes = {key: index for key, index in self.indexes.items() if key != name}
+
+    def index_specs(self) -> list[dict]:
+        return [index.spec() for index in self.indexes.values()]
+
+    def log_schema(self, entry: dict) -> None:
+        """Append an index change to the WAL. Replaying one is idempotent,
+        a checkpoint may already hold its effect."""
+        if self.wal is not None:
+            with self.committing():
+                self.wal.append(entry)
+
+    def plan(self, query: dict | None) -> Plan:
+        return make_plan(query, self.indexes.values())
+
+    def index_record(self, record) -> None:
+        for index in self.indexes.values():
+            index.add(record)
+
+    def index_records(self, records: list) -> None:
+        for index in self.indexes.values():
+            index.add_many(records)
+
+    def unindex_record(self, record) -> None:
+        for index in self.indexes.values():
+            index.remove(record)
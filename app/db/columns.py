@@ -0,0 +1,329 @@
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from app.db.query import MISSING, resolve, sort_key, split_path
+
+# ints past this are not exact as doubles
+EXACT = 2 ** 53
+NUMBER_TYPES = frozenset({int, float})
+# values of these types group by their own hash and equality, as long as bools don't meet numbers
+SCALAR_TYPES = frozenset({int, float, bool, str, type(None), type(MISSING)})
+
+
+def and_(a: bytes, b: bytes) -> bytearray:
+    """Slot-wise AND of two 0/1 masks of the same length."""
+    n = len(a)
+    return bytearray((int.from_bytes(a, 'little') & int.from_bytes(b, 'little')).to_bytes(n, 'little'))
+
+
+def record_doc(record):
+    return None if record is None else record.doc
+
+
+def is_number(value) -> bool:
+    return type(value) in NUMBER_TYPES
+
+
+def group_key(value):
+    """Hashable key under which equal values group together, MISSING groups with null."""
+    if value is MISSING:
+        return (0,)
+    key = sort_key(value)
+    return key if key is not None else (4, repr(value))
+
+
+class Column:
+    """Values of one field, one per slot.
+
+    `values` holds them as they are (MISSING where absent) and `numeric`
+    is set for the slots holding a number (bools aren't). Two encodings
+    are built on first use and kept up to date from then on: `numbers`,
+    the values as doubles, so comparisons with a number run over an
+    array, and `codes`, dictionary-encoding the values for grouping. A
+    column that grows while it is read is appended to and encoded under
+    `lock`.
+    """
+
+    def __init__(self, field: str, lock=None) -> None:
+        self.field = field
+        self.lock = lock
+        self.path = split_path(field)
+        self.values = []
+        self.numeric = bytearray()
+        # every value present is a number or null
+        self.numbers_only = True
+        self.numbers: array | None = None
+        # every number is exact as a double, so `numbers` can be compared
+        self.exact = True
+        self.codes: array | None = None
+        self.keys: dict = {}
+        self.dictionary: list = []
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def append(self, doc) -> None:
+        value = MISSING if doc is None else resolve(doc, self.path)
+        self.values.append(value)
+        number = is_number(value)
+        self.numeric.append(number)
+        if not number and value is not MISSING and value is not None:
+            self.numbers_only = False
+        if self.numbers is not None:
+            self.numbers.append(self.as_double(value) if number else 0.0)
+        if self.codes is not None:
+            self.codes.append(self.encode(value))
+
+    def extend(self, docs) -> None:
+        """Append many docs, each pass over them runs in bulk."""
+        docs = list(docs)
+        if self.numbers is not None or self.codes is not None:
+            for doc in docs:
+                self.append(doc)
+            return
+        path = self.path
+        try:
+            if len(path) != 1:
+                raise AttributeError
+            key = path[0]
+            values = [doc.get(key, MISSING) for doc in docs]
+        except AttributeError:
+            values = [MISSING if doc is None else resolve(doc, path) for doc in docs]
+        numeric = bytearray(map(NUMBER_TYPES.__contains__, map(type, values)))
+        if len(values) - sum(numeric) - values.count(None) - values.count(MISSING):
+            self.numbers_only = False
+        self.values.extend(values)
+        self.numeric.extend(numeric)
+
+    def as_double(self, value) -> float:
+        if type(value) is int and abs(value) > EXACT:
+            self.exact = False
+            return 0.0
+        return value
+
+    def doubles(self) -> array:
+        with self.lock or nullcontext():
+            if self.numbers is None:
+                self.numbers = array('d', [self.as_double(value) if flag else 0.0
+                                           for value, flag in zip(self.values, self.numeric)])
+            return self.numbers
+
+    def encode(self, value) -> int:
+        key = group_key(value)
+        code = self.keys.get(key)
+        if code is None:
+            code = self.keys[key] = len(self.dictionary)
+            self.dictionary.append(None if value is MISSING else value)
+        return code
+
+    def encoded(self) -> array:
+        with self.lock or nullcontext():
+            if self.codes is None:
+                values = self.values
+                types = set(map(type, values))
+                if types <= SCALAR_TYPES and not (bool in types and types & NUMBER_TYPES):
+                    codes = {value: self.encode(value) for value in dict.fromkeys(values)}
+                    self.codes = array('q', map(codes.__getitem__, values))
+                else:
+                    self.codes = array('q', map(self.encode, values))
+            return self.codes
+
+    def compare(self, op: str, value, n: int) -> bytearray | None:
+        """Mask of the first `n` slots, set where the number compares to the number
+        `value` by `op`. None if some number in the column isn't exact as a double."""
+        numbers = self.doubles()
+        if not self.exact:
+            return None
+        bound = float(value)
+        test = {'$eq': bound.__eq__, '$lt': bound.__gt__, '$lte': bound.__ge__,
+                '$gt': bound.__lt__, '$gte': bound.__le__}[op]
+        return and_(bytearray(map(test, numbers[:n])), self.numeric[:n])
+
+
+class View:
+    """Rows an aggregation runs over, with the columns of their fields.
+
+    `rows` are records or docs, `doc` gets the doc of a row. Columns not
+    given are built from the rows on first use. `live` marks the rows
+    visible to the aggregation.
+    """
+
+    def __init__(self, rows: list, doc=record_doc, columns: dict | None = None,
+                 live: bytearray | None = None) -> None:
+        self.rows = rows
+        self.doc = doc
+        self.columns = dict(columns or {})
+        self.live = bytearray(b'\x01') * len(rows) if live is None else live
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def column(self, field: str) -> Column:
+        column = self.columns.get(field)
+        if column is None:
+            column = self.columns[field] = Column(field)
+            column.extend(map(self.doc, self.rows))
+        return column
+
+    def docs(self, selection: bytes) -> list:
+        return [self.doc(row) for row, selected in zip(self.rows, selection) if selected]
+
+
+class ColumnCache:
+    """Columns of the committed documents, for aggregations.
+
+    Built lazily by the first aggregation that can use it, from the
+    versions committed at `collection.version`. Each slot holds one
+    version and `live` marks the slots still visible. A writing commit
+    updates it in place: the versions it expired get their `live` bit
+    cleared and the versions it made visible are appended as new slots,
+    to every column kept. Once dead slots outnumber live ones it is
+    dropped and built again on next use. At most `max_fields` columns
+    are kept, least recently used ones are dropped first.
+
+    Like the query cache it serves transactions that read the latest
+    committed state, or a snapshot taken at the current version, and
+    wrote nothing; see `usable`.
+    """
+
+    def __init__(self, collection, max_fields: int) -> None:
+        self.collection = collection
+        self.lock = collection.version_lock
+        self.max_fields = max_fields
+        self.records: list = []
+        self.live = bytearray()
+        self.columns: OrderedDict[str, Column] = OrderedDict()
+        # _id -> slot of its committed version
+        self.slots: dict[int, int] = {}
+        self.built = False
+        # commits made while the cache is built, applied once it is
+        self.pending: list | None = None
+        self.build_lock = threading.Lock()
+        self.dead = 0
+        self.stats = {
+            'builds': 0,
+            'hits': 0,
+            'bypassed': 0,
+            'appended': 0,
+            'expired': 0,
+            'columns_built': 0,
+            'columns_evicted': 0,
+        }
+
+    def usable(self, t) -> bool:
+        if self.max_fields <= 0 or not t.cacheable or t.rollback_actions or \
+                t.snapshot not in (None, self.collection.version):
+            self.stats['bypassed'] += 1
+            return False
+        return True
+
+    def view(self, t, fields) -> View | None:
+        """The committed documents with the columns of `fields`, None if `t` can't use them."""
+        if not self.usable(t):
+            return None
+        self.build()
+        columns = {field: self.column(field) for field in fields}
+        with self.lock:
+            if not self.built or t.snapshot not in (None, self.collection.version) or \
+                    any(self.columns.get(field) is not column for field, column in columns.items()):
+                self.stats['bypassed'] += 1
+                return None
+            n = len(self.records)
+            rows, live = self.records[:n], self.live[:n]
+            self.stats['hits'] += 1
+        return View(rows, columns=columns, live=live)
+
+    def build(self) -> None:
+        with self.build_lock:
+            with self.lock:
+                if self.built:
+                    return
+                version = self.collection.version
+                self.pending = []
+            try:
+                records = [record for record in self.collection.records
+                           if record.created_ts <= version < record.expired_ts]
+            except BaseException:
+                with self.lock:
+                    self.pending = None
+                raise
+            with self.lock:
+                pending, self.pending = self.pending, None
+                self.records, self.live = records, bytearray(b'\x01') * len(records)
+                self.slots = {record._id: slot for slot, record in enumerate(records)}
+                self.columns.clear()
+                self.dead = 0
+                self.built = True
+                for actions in pending:
+                    self.apply(actions)
+                self.stats['builds'] += 1
+
+    def column(self, field: str) -> Column:
+        with self.lock:
+            column = self.columns.get(field)
+            if column is not None:
+                self.columns.move_to_end(field)
+                return column
+            source = self.records
+            records = source[:]
+        column = Column(field, self.lock)
+        column.extend(record.doc if record is not None else None for record in records)
+        with self.lock:
+            if field in self.columns:
+                return self.columns[field]
+            if self.records is not source:
+                # dropped meanwhile, `view` bypasses the cache
+                return column
+            column.extend(record.doc if record is not None else None for record in self.records[len(records):])
+            self.columns[field] = column
+            self.stats['columns_built'] += 1
+            while len(self.columns) > self.max_fields:
+                self.columns.popitem(last=False)
+                self.stats['columns_evicted'] += 1
+        return column
+
+    def apply(self, actions: list) -> None:
+        """Update the slots for a writing commit's actions. Called with `lock` held."""
+        if self.pending is not None:
+            self.pending.append(list(actions))
+            return
+        if not self.built:
+            return
+        for action, record in actions:
+            if action == 'add':
+                slot = self.slots.get(record._id)
+                if slot is not None and self.records[slot] is record:
+                    del self.slots[record._id]
+                    self.records[slot] = None
+                    self.live[slot] = 0
+                    self.dead += 1
+                    self.stats['expired'] += 1
+        for action, record in actions:
+            if action == 'delete' and self.collection.is_committed(record):
+                doc = record.doc
+                self.slots[record._id] = len(self.records)
+                self.records.append(record)
+                self.live.append(1)
+                for column in self.columns.values():
+                    column.append(doc)
+                self.stats['appended'] += 1
+        if self.dead > 1024 and self.dead > len(self.records) - self.dead:
+            self.drop()
+
+    def drop(self) -> None:
+        """Forget everything, the next aggregation builds the cache again. Called with `lock` held."""
+        self.built = False
+        self.records, self.live, self.slots = [], bytearray(), {}
+        self.columns = OrderedDict()
+        self.dead = 0
+
+    def clear(self) -> None:
+        with self.lock:
+            self.drop()
+
+    def describe(self) -> dict:
+        with self.lock:
+            return dict(self.stats, built=self.built, slots=len(self.records), dead=self.dead,
+                        columns=list(self.columns), max_fields=self.max_fields)
@@ -0,0 +1,52 @@
+import pytest
+
+from app.db.db import Database
+from app.settings import settings
+from app.utils.meta_singleton import MetaSingleton
+from bench.concurrency import free_port, start_server
+
+
+def open_database() -> Database:
+    MetaSingleton._instances.pop(Database, None)
+    return Database()
+
+
+def stop(db: Database) -> None:
+    """Stop the background threads of `db` without the closing checkpoint, as if the process died."""
+    db.reaper.close()
+    db.vacuum.close()
+    db.checkpointer.close()
+    if db.scan_pool is not None:
+        db.scan_pool.close()
+    MetaSingleton._instances.pop(Database, None)
+
+
+def crash(db: Database) -> Database:
+    """Open the data directory of `db` again as after a crash, without a closing checkpoint."""
+    stop(db)
+    db.wal.close()
+    return open_database()
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A `Database` of its own in an empty directory, without the query cache
+    so that every read runs its plan."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, 'QUERY_CACHE_BYTES', 0)
+    yield open_database()
+    # the last one opened, see `crash`
+    db = MetaSingleton._instances.get(Database)
+    if db is not None:
+        stop(db)
+        db.wal.close()
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    """Port of a server of its own, shared by the tests of a module."""
+    port = free_port()
+    process = start_server(port, str(tmp_path_factory.mktemp('server')))
+    yield port
+    process.kill()
+    process.wait()
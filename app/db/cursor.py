@@ -0,0 +1,35 @@
+import threading
+
+
+class Cursor:
+    """Position of a paged read inside a transaction.
+
+    Pages are fetched by keyset on `_id`: each one resumes after
+    `last_id`, so the server keeps no result set between pages.
+    """
+
+    def __init__(self, c_id: int, transaction_id: int, query: dict, batch_size: int, limit: int = -1) -> None:
+        self.id = c_id
+        self.transaction_id = transaction_id
+        self.query = query
+        self.batch_size = batch_size
+        self.remaining = limit
+        self.last_id = 0
+        self.done = False
+        self.lock = threading.Lock()
+
+    def take(self) -> int:
+        if self.remaining is None or self.remaining < 0:
+            return self.batch_size
+        return min(self.batch_size, self.remaining)
+
+    def advance(self, batch: list) -> None:
+        if batch:
+            self.last_id = batch[-1]._id
+        if self.remaining is not None and self.remaining >= 0:
+            self.remaining -= len(batch)
+        self.done = len(batch) < self.batch_size or self.remaining == 0
+
+    def describe(self) -> dict:
+        return {'cursor_id': self.id, 'transaction_id': self.transaction_id, 'last_id': self.last_id,
+                'batch_size': self.batch_size, 'done': self.done}
@@ -1,99 +1,225 @@
+import heapq
+import itertools
 import logging
-import pickle
+import os
 import threading
 import time
-from typing import Dict
+from contextlib import contextmanager
+from operator import attrgetter
+from typing import Dict, Iterator
 
+from app.db.aggregate import column_fields, parse_pipeline, run_pipeline
+from app.db.cache import QueryCache
+from app.db.changes import ChangeLog
+from app.db.checkpoint import Checkpointer
 from app.db.collection import Collection
+from app.db.columns import ColumnCache, View
+from app.db.cursor import Cursor
+from app.db.exeptions import TransactionTimeoutException
+from app.db.index import Index, IndexType
+from app.db.partition import ScanPool
+from app.db.profiler import Profiler, SlowQueryLog, current
+from app.db.query import compile_projection, conjuncts, dispatcher, sort_order
+from app.db.reaper import Reaper
+from app.db.record import BaseRecord
+from app.db.vacuum import Vacuum
+from app.db.wal import WriteAheadLog
 from app.db.transaction import (ReadUncommittedTransaction,
                                 ReadCommittedTransaction,
                                 RepeatableReadTransaction,
-                                SerializableTransaction, Transaction, TransactionType)
+                                SerializableTransaction, ReadOnlyTransaction, OptimisticTransaction,
+                                Transaction, TransactionType)
+from app.settings import settings
+from app.utils import metrics
 from app.utils.meta_singleton import MetaSingleton
 
 logger = logging.getLogger("database")
 
 
-def predicate(p: str):
-    match p:
-        case "$eq":
-            return lambda field, value: field == value
-        case "$ne":
-            return lambda field, value: field != value
-        case "$lt":
-            return lambda field, value: field < value
-        case "$lte":
-            return lambda field, value: field <= value
-        case "$gt":
-            return lambda field, value: field > value
-        case "$gte":
-            return lambda field, value: field >= value
-        case _:
-            return None
-            # return lambda field, value: True
+def op_seconds(op: str) -> metrics.Histogram:
+    return metrics.registry.histogram('database_op_seconds', 'Engine operation latency in seconds.', op=op)
+
+
+FIND_SECONDS = op_seconds('find')
+SCANNED = metrics.registry.counter('database_records_scanned_total', 'Record versions looked at by reads.')
+RETURNED = metrics.registry.counter('database_records_returned_total', 'Records returned by reads.')
 
 
 class Database(metaclass=MetaSingleton):
-    FILENAME = 'data/db.pickle'
+    FILENAME = os.path.join(settings.DATA_DIR, 'db.pickle')
 
     def __init__(self) -> None:
-        self.collection: Collection = Collection()
+        self.collection: Collection = Collection(compact=settings.COMPACT_RECORDS,
+                                                 lock_timeout_s=settings.LOCK_TIMEOUT_S,
+                                                 partitions=settings.PARTITIONS)
+        self.wal = WriteAheadLog(settings.WAL_DIR, sync_mode=settings.WAL_SYNC_MODE,
+                                 sync_interval_ms=settings.WAL_SYNC_INTERVAL_MS)
+        self.checkpointer = Checkpointer(self.collection, self.wal, settings.CHECKPOINT_DIR,
+                                         legacy_filename=Database.FILENAME,
+                                         interval_s=settings.CHECKPOINT_INTERVAL_S,
+                                         wal_bytes=settings.CHECKPOINT_WAL_BYTES,
+                                         max_deltas=settings.CHECKPOINT_MAX_DELTAS,
+                                         retain=settings.CHECKPOINT_RETAIN)
         self.load_from_fs()
+        self.wal.open()
+        self.collection.wal = self.wal
+        self.cache = QueryCache(self.collection, max_bytes=settings.QUERY_CACHE_BYTES,
+                                max_rows=settings.QUERY_CACHE_MAX_ROWS)
+        self.collection.cache = self.cache
+        self.columns = ColumnCache(self.collection, max_fields=settings.COLUMN_CACHE_FIELDS)
+        self.collection.columns = self.columns
+        self.changes = ChangeLog(settings.CHANGE_LOG_SIZE)
+        self.collection.changes = self.changes
+        self.profiler = Profiler(self.collection.locks)
+        self.slow_queries = SlowQueryLog(settings.SLOW_QUERY_MS, settings.SLOW_QUERY_LOG_SIZE)
+        self.profiler.hooks.append(self.slow_queries)
+        self.scan_pool = ScanPool(settings.PARTITIONS, workers=min(settings.SCAN_WORKERS, settings.PARTITIONS)) \
+            if settings.PARTITIONS > 1 else None
+        if self.checkpointer.migrate:
+            self.checkpoint(full=True)
         self.transactions: Dict[int, Transaction] = {}
-        thread = threading.Thread(target=self.dump_daemon, daemon=True)
+        self.transactions_lock = threading.Lock()
+        self.cursors: Dict[int, Cursor] = {}
+        self.cursor_ids = itertools.count(1)
+        thread = threading.Thread(target=self.checkpointer.daemon, daemon=True)
         thread.start()
-        logger.info(f'Database inited')
+        self.vacuum = Vacuum(self.collection, budget=settings.VACUUM_BUDGET, interval_s=settings.VACUUM_INTERVAL_S)
+        threading.Thread(target=self.vacuum.daemon, daemon=True).start()
+        self.reaper = Reaper(self, idle_s=settings.TRANSACTION_IDLE_TIMEOUT_S, interval_s=settings.REAPER_INTERVAL_S)
+        threading.Thread(target=self.reaper.daemon, daemon=True).start()
+        logger.info('Database inited')
 
-    @staticmethod
-    def read() -> list:
-        try:
-            with open(Database.FILENAME, "rb") as f:
-                data = pickle.load(f)
-        except pickle.UnpicklingError:
-            logger.critical('UnpicklingError', exc_info=True)
-            data = []
-        except FileNotFoundError:
-            logger.warning('Database files not found!')
-            data = []
-        return data
+    def checkpoint(self, full: bool = False) -> dict:
+        return self.checkpointer.run(full=full)
+
+    def close(self) -> None:
+        if self.scan_pool is not None:
+            self.scan_pool.close()
+        self.reaper.close()
+        self.vacuum.close()
+        self.checkpointer.close()
+        self.checkpoint()
+        self.wal.close()
+
+    def stats(self) -> dict:
+        """Engine state and counters; latencies are in `metrics.registry`."""
+        return {
+            'versions': {'live': self.collection.live, 'dead': self.collection.dead},
+            'active_transactions': len(self.collection.active_ids),
+            'commit_version': self.collection.version,
+            'oldest_snapshot': self.collection.horizon(),
+            'reaper': dict(self.reaper.stats),
+            'open_cursors': len(self.cursors),
+            'locks': self.collection.locks.describe(),
+            'checkpoint': dict(self.checkpointer.stats),
+            'vacuum': dict(self.vacuum.stats),
+            'cache': self.cache.describe(),
+            'columns': self.columns.describe(),
+            'slow_queries': self.slow_queries.describe(),
+            'changes': self.changes.describe(),
+        }
+
+    def apply(self, entry: dict) -> None:
+        records = self.collection.records
+        for op in entry['ops']:
+            _id = op[1]
+            for record in [record for record in records.chain(_id) if record.expired_id == 0]:
+                records.remove(record)
+            if op[0] == 'insert':
+                records.append(self.collection.record_class(_id, op[2], op[3]))
+        self.collection.mark_dirty(op[1] for op in entry['ops'])
+
+    def load_from_fs(self):
+        self.collection.records, lsn, next_doc = self.checkpointer.load()
+        logger.info('Read dump from filesystem')
+        indexes = {spec['name']: spec for spec in self.checkpointer.manifest.get('indexes', [])}
+        replayed = 0
+        for _, entry in self.wal.replay(after=lsn):
+            if 'create_index' in entry:
+                indexes[entry['create_index']['name']] = entry['create_index']
+            elif 'drop_index' in entry:
+                indexes.pop(entry['drop_index'], None)
+            else:
+                self.apply(entry)
+            replayed += 1
+        self.collection.next_doc = max(next_doc, self.collection.records.max_id() + 1)
+        self.collection.live = len(self.collection.records)
+        logger.info('Replayed %s WAL entries', replayed)
+        for spec in indexes.values():
+            self.collection.create_index(spec['name'], spec['field'], IndexType(spec['type']))
+        if indexes:
+            logger.info('Rebuilt %s indexes', len(indexes))
+
+    def claim(self, transaction_id: int) -> Transaction:
+        """The open transaction `transaction_id`, kept from the reaper until `release`d."""
+        with self.transactions_lock:
+            t = self.transactions.get(transaction_id)
+            if t is None:
+                raise KeyError(f'Transaction: {transaction_id} not found')
+            if t.deadline is not None and time.monotonic() >= t.deadline:
+                raise TransactionTimeoutException(f'Transaction: {transaction_id} timed out')
+            t.busy += 1
+        return t
+
+    def release(self, t: Transaction) -> None:
+        with self.transactions_lock:
+            t.busy -= 1
+            t.last_used = time.monotonic()
 
     @staticmethod
-    def write(data: list) -> None:
+    @contextmanager
+    def stepping(t: Transaction) -> Iterator[Transaction]:
+        """Run one step of an operation on `t`, failing if it has ended."""
+        with t.mutex:
+            if t.finished:
+                raise KeyError(f'Transaction: {t.id} not found')
+            yield t
+
+    @contextmanager
+    def using(self, transaction_id: int) -> Iterator[Transaction]:
+        """The open transaction `transaction_id`, kept from the reaper while in use
+        and from commit and rollback until the operation is done."""
+        t = self.claim(transaction_id)
         try:
-            with open(Database.FILENAME, "wb") as f:
-                pickle.dump(data, f)
-        except pickle.PicklingError:
-            logger.critical('PicklingError', exc_info=True)
+            with self.stepping(t):
+                yield t
+        finally:
+            self.release(t)
 
-    @staticmethod
-    def delete_transaction_id(snapshot):
-        for record in snapshot:
-            record['created_id'] = 0
-        return snapshot
-
-    def dump(self):
-        snapshot = list.copy(self.collection.records)
-        snapshot = Database.delete_transaction_id(snapshot)
-        return snapshot
-
-    def dump_to_fs(self) -> None:
-        logger.info(f'Dumping to filesystem')
-        Database.write(self.dump())
-
-    def dump_daemon(self):
-        while True:
-            time.sleep(1 * 60)
-            self.dump_to_fs()
-            break
+    def reading(self, transaction_id: int, rows: Iterator) -> Iterator:
+        """Pass `rows` through, keeping the transaction in use until they run
+        out or are closed. Each row is produced as a step of its own, so a
+        transaction ended meanwhile fails the next one instead of reading on."""
+        t = self.claim(transaction_id)
+        try:
+            while True:
+                with self.stepping(t):
+                    row = next(rows, StopIteration)
+                if row is StopIteration:
+                    return
+                yield row
+        finally:
+            with t.mutex:
+                close = getattr(rows, 'close', None)
+                if close is not None:
+                    close()
+            self.release(t)
 
-    def load_from_fs(self):
-        self.collection.records = Database.read()
-        max_i = max([record['_id'] for record in self.collection.records] + [0])
-        self.collection.next_doc = max_i + 1
-        print(self.collection.records)
-        logger.info(f'Read dump from filesystem')
+    def finish(self, transaction_id: int) -> Transaction:
+        """Remove the transaction so that no new operation can start on it,
+        once the step running on it, if any, is done."""
+        with self.transactions_lock:
+            t = self.transactions.pop(transaction_id, None)
+        if t is None:
+            raise KeyError(f'Transaction: {transaction_id} not found')
+        with t.mutex:
+            t.finished = True
+        return t
 
-    def begin_transaction(self, transaction_type: str) -> int:
+    @metrics.timed(op_seconds('begin'))
+    def begin_transaction(self, transaction_type: str, timeout_s: float | None = None) -> int:
+        """Begin a transaction, rolled back by the reaper after `timeout_s`
+        (TRANSACTION_TIMEOUT_S by default, 0 for never)."""
         match transaction_type:
             case TransactionType.read_uncommitted:
                 t = self.collection.begin(ReadUncommittedTransaction)
@@ -103,52 +229,429 @@ class Database(metaclass=MetaSingleton):
                 t = self.collection.begin(RepeatableReadTransaction)
             case TransactionType.serializable:
                 t = self.collection.begin(SerializableTransaction)
+            case TransactionType.read_only:
+                t = self.collection.begin(ReadOnlyTransaction)
+            case TransactionType.optimistic:
+                t = self.collection.begin(OptimisticTransaction)
             case _:
                 t = self.collection.begin(ReadUncommittedTransaction)
 
-        self.transactions[t.id] = t
+        timeout_s = settings.TRANSACTION_TIMEOUT_S if timeout_s is None else timeout_s
+        if timeout_s:
+            t.deadline = time.monotonic() + timeout_s
+        with self.transactions_lock:
+            self.transactions[t.id] = t
 
         return t.id
 
+    @metrics.timed(op_seconds('commit'))
     def commit(self, transaction_id: int) -> None:
-        t: Transaction = self.transactions[transaction_id]
-        t.commit()
+        t = self.finish(transaction_id)
+        try:
+            if t.deadline is not None and time.monotonic() >= t.deadline:
+                t.rollback()
+                raise TransactionTimeoutException(f'Transaction: {transaction_id} timed out')
+            t.commit()
+        finally:
+            self.close_cursors(transaction_id)
 
-    def insert(self, transaction_id: int, name: str, doc: dict) -> None:
+    @metrics.timed(op_seconds('rollback'))
+    def rollback(self, transaction_id: int) -> None:
+        t = self.finish(transaction_id)
         try:
-            transaction = self.transactions[transaction_id]
+            t.rollback()
+        finally:
+            self.close_cursors(transaction_id)
+
+    @metrics.timed(op_seconds('insert'))
+    def insert(self, transaction_id: int, name: str, doc: dict) -> None:
+        with self.using(transaction_id) as transaction:
             transaction.add_record(name=name, doc=doc)
-        except KeyError:
-            logger.critical(f'Transaction: {transaction_id} not found', exc_info=True)
-
-    def find(self, transaction_id: int, limit: int, field: str | None, p: str | None, value: str | None) -> list[dict]:
-        f = predicate(p)
-        t: Transaction = self.transactions[transaction_id]
-        target = [rec for rec in t.collection.records if not field or f(str(rec.doc[field]), value)]
-        limit = len(target) if limit == -1 else max(len(target), limit)
-        return target[:limit]
-
-    def update(self, transaction_id: int, limit: int, field: str | None, p: str | None, value: str | None,
-               new_doc: dict) -> None:
-        t: Transaction = self.transactions[transaction_id]
-        target = self.find(
-            transaction_id=transaction_id,
-            limit=limit,
-            field=field,
-            p=p,
-            value=value
-        )
-        for record in target:
-            t.update_record(_id=record["_id"], name=record["name"], doc=new_doc)
-
-    def delete(self, transaction_id: int, limit: int, field: str | None, p: str | None, value: str | None):
-        t: Transaction = self.transactions[transaction_id]
-        target = self.find(
-            transaction_id=transaction_id,
-            limit=limit,
-            field=field,
-            p=p,
-            value=value
-        )
-        for record in target:
-            t.delete_record_id(_id=record["_id"])
+
+    @metrics.timed(op_seconds('insert_many'))
+    def insert_many(self, transaction_id: int, items: list[tuple[str, dict]]) -> list[int]:
+        with self.using(transaction_id) as t:
+            return t.add_records(items)
+
+    def create_index(self, name: str, field: str, index_type: IndexType) -> dict:
+        return self.collection.create_index(name, field, index_type).describe()
+
+    def drop_index(self, name: str) -> None:
+        self.collection.drop_index(name)
+
+    def indexes(self) -> list[dict]:
+        return [index.describe() for index in self.collection.indexes.values()]
+
+    def find(self, transaction_id: int, query: dict | None, limit: int | None = -1, sort: dict | None = None,
+             projection: list[str] | None = None) -> Iterator[dict]:
+        """Rows of the visible records matching `query`, see `iterate`.
+
+        With a `projection` of doc fields a row is `{_id, name, doc}`, its
+        doc holding only those fields.
+        """
+        started = time.perf_counter()
+        profile = self.profiler.start('find', transaction_id, [query], limit, sort)
+        try:
+            rows = self.profiler.call(profile, self.rows, transaction_id, query, limit, sort)
+        except Exception as e:
+            self.profiler.finish(profile, e)
+            raise
+        if projection is not None:
+            project = compile_projection(projection)
+            rows = ({'_id': row['_id'], 'name': row['name'], 'doc': project(row['doc'])} for row in rows)
+        rows = self.profiler.rows(profile, metrics.timed_rows(FIND_SECONDS, started, rows))
+        return self.reading(transaction_id, rows)
+
+    def rows(self, transaction_id: int, query: dict | None, limit: int | None = -1,
+             sort: dict | None = None) -> Iterator[dict]:
+        with self.using(transaction_id) as t:
+            if not self.cache.usable(t):
+                return (record.to_dict() for record in self.iterate(transaction_id, query, limit, sort=sort))
+            key = self.cache.key(query, limit, sort)
+            rows = self.cache.get(key)
+            if rows is not None:
+                profile = current()
+                if profile is not None:
+                    profile.cache_hit = True
+                return iter(rows)
+            version = self.collection.version if t.snapshot is None else t.snapshot
+            records = self.iterate(transaction_id, query, limit, sort=sort)
+            return self.cache.fill(key, version, query, (record.to_dict() for record in records))
+
+    def explain(self, transaction_id: int, query: dict | None, limit: int | None = -1, sort: dict | None = None,
+                op: str = 'find') -> dict:
+        """The plan a find, update or delete of `query` would run, with estimates of its cost.
+
+        Nothing is run and no lock is taken. `candidates` counts the
+        versions the plan would look at, `matches` extrapolates the share
+        of the first EXPLAIN_SAMPLE of them matching `query`, `scanned` is
+        how far a limit lets the scan get before it stops and `locks` the
+        record locks it would take.
+        """
+        with self.using(transaction_id) as t:
+            plan = t.collection.plan(query)
+            records = t.collection.records
+            candidates = len(records) if plan.index is None else sum(1 for _ in plan.candidates(records))
+            sample = list(itertools.islice(plan.candidates(records), settings.EXPLAIN_SAMPLE))
+            selectivity = sum(1 for record in sample if plan.predicate(record.doc)) / len(sample) if sample else 0.0
+            matches = round(selectivity * candidates)
+            limited = limit is not None and limit >= 0
+            rows = min(matches, limit) if limited else matches
+
+            order = None
+            if op == 'find' and sort:
+                index = self.sort_index(plan, sort) if limited and limit > 0 else None
+                if index is not None:
+                    order = {'type': 'index', 'index': index.name}
+                else:
+                    order = {'type': 'heap' if limited else 'sort'}
+            if not limited or (order is not None and order['type'] != 'index'):
+                scanned = candidates
+            elif limit == 0:
+                scanned = 0
+            else:
+                scanned = min(candidates, -(-limit // selectivity)) if selectivity else candidates
+
+            if op != 'find':
+                locks = {'mode': 'exclusive', 'estimated': rows}
+            elif isinstance(t, SerializableTransaction):
+                locks = {'mode': 'shared', 'estimated': matches if order and order['type'] != 'index' else rows}
+            else:
+                locks = None
+            return {
+                'op': op,
+                'plan': plan.describe(),
+                'sort': order,
+                'parallel': op == 'find' and self.parallel(plan, records, -1 if order else limit, None),
+                'locks': locks,
+                'estimates': {
+                    'candidates': candidates,
+                    'scanned': int(scanned),
+                    'selectivity': round(selectivity, 4),
+                    'matches': matches,
+                    'rows': rows,
+                    'sample': len(sample),
+                },
+            }
+
+    @metrics.timed(op_seconds('aggregate'))
+    def aggregate(self, transaction_id: int, pipeline: list[dict]) -> list[dict]:
+        """Run an aggregation pipeline, see `parse_pipeline`.
+
+        Transactions that can use the column cache run it over the cached
+        columns, the others over the records they see. A leading `$match`
+        is run as a find when it can use an index, or when reads take locks
+        or are validated, so that only the matching records are read.
+        """
+        stages = parse_pipeline(pipeline)
+        with self.using(transaction_id) as t:
+            view = self.columns.view(t, column_fields(stages))
+            if view is None:
+                query = None
+                if stages and stages[0][0] == '$match' and \
+                        (not t.cacheable or self.collection.plan(stages[0][1]).index is not None):
+                    query, stages = stages[0][1], stages[1:]
+                view = View(self.select(transaction_id, query), doc=attrgetter('doc'))
+            return run_pipeline(view, stages)
+
+    def select(self, transaction_id: int, query: dict | None, limit: int | None = -1) -> list[BaseRecord]:
+        return list(self.iterate(transaction_id, query, limit))
+
+    def iterate(self, transaction_id: int, query: dict | None, limit: int | None = -1,
+                after: int | None = None, sort: dict | None = None) -> Iterator[BaseRecord]:
+        """Visible records matching `query`, at most `limit` of them (-1 or None for all).
+
+        Records are produced lazily as the scan finds them. With `after`,
+        they come in `_id` order starting past that `_id`; with `sort`, in
+        that order, see `sort_records`.
+        """
+        with self.using(transaction_id) as t:
+            plan = t.collection.plan(query)
+            t.reads(plan.predicate)
+            profile = current()
+            if profile is not None:
+                profile.plans.append(plan.describe())
+            records = t.collection.records
+            if sort:
+                return iter(self.sort_records(t, plan, records, limit, sort))
+            if self.parallel(plan, records, limit, after):
+                return self.matching(t, plan.predicate, self.parallel_candidates(plan, records), limit)
+            candidates = plan.candidates(records) if after is None else plan.ordered(records, after)
+            return self.matching(t, plan.predicate, candidates, limit)
+
+    def sort_records(self, t: Transaction, plan, records, limit: int | None, sort: dict) -> list[BaseRecord]:
+        """Matches in `sort` order, ties in `_id` order.
+
+        With a limit only that many are kept while scanning, in a heap,
+        or an ordered index on a single sort field is walked until the
+        limit is reached, see `sort_index`.
+        """
+        order, reverse = sort_order(sort)
+
+        def key(record) -> tuple:
+            # sorted in reverse, ties still come in `_id` order
+            return order(record.doc), -record._id if reverse else record._id
+
+        if limit == 0:
+            return []
+        if limit is not None and limit > 0:
+            index = self.sort_index(plan, sort)
+            if index is not None:
+                return self.walk_index(t, plan, records, index, sort, limit, key, reverse)
+        if self.parallel(plan, records, -1, None):
+            candidates = self.parallel_candidates(plan, records)
+        else:
+            candidates = plan.candidates(records)
+        matches = self.matching(t, plan.predicate, candidates, -1)
+        if limit is None or limit < 0:
+            return sorted(matches, key=key, reverse=reverse)
+        return (heapq.nlargest if reverse else heapq.nsmallest)(limit, matches, key=key)
+
+    def sort_index(self, plan, sort: dict) -> Index | None:
+        """Ordered index on the one sort field, unless the query is planned on another index.
+
+        Docs without the field aren't indexed and sort before the others,
+        so ascending the index is only used when the query needs the field.
+        """
+        if len(sort) != 1:
+            return None
+        (field, direction), = sort.items()
+        if plan.index is not None and plan.index.field != field:
+            return None
+        if direction == 1 and field not in conjuncts(plan.query):
+            return None
+        for index in self.collection.indexes.values():
+            if index.type == IndexType.ordered and index.field == field:
+                return index
+        return None
+
+    def walk_index(self, t: Transaction, plan, records, index: Index, sort: dict, limit: int, key,
+                   reverse: bool) -> list[BaseRecord]:
+        """The first `limit` matches walking `index` key by key in `sort` order."""
+        (field, direction), = sort.items()
+        terms = conjuncts(plan.query)
+        conditions = {op: value for op, value in terms.get(field, {}).items() if index.supports(op)}
+        found = []
+        for index_key, ids in index.walk(conditions, reverse=direction == -1):
+            # an `_id` is in the bucket of every key its versions had, the visible one counts once
+            batch = [record for record in self.matching(t, plan.predicate, records.versions(ids), -1)
+                     if index.key(record) == index_key]
+            found.extend(sorted(batch, key=key, reverse=reverse))
+            if len(found) >= limit:
+                return found[:limit]
+        if field not in terms:
+            # descending, docs without the field come last
+            missing = (record for record in self.matching(t, plan.predicate, plan.candidates(records), -1)
+                       if index.key(record) is None)
+            found.extend(heapq.nlargest(limit - len(found), missing, key=key))
+        return found
+
+    def parallel(self, plan, records, limit: int | None, after: int | None) -> bool:
+        """Whether a scan is worth splitting across the scan workers."""
+        return self.scan_pool is not None and plan.index is None and after is None and limit in (-1, None) \
+            and records.base is not None and len(records.base) >= settings.PARALLEL_SCAN_MIN_RECORDS
+
+    def parallel_candidates(self, plan, records) -> Iterator[BaseRecord]:
+        """Chained versions, then the base records the scan workers matched.
+
+        If the pool fails, the base is scanned here instead; the pool is
+        started again on the next parallel scan.
+        """
+        base = records.base
+        try:
+            futures = self.scan_pool.submit(base, plan.query)
+        except Exception:
+            logger.warning('Parallel scan failed to start, scanning serially', exc_info=True)
+            self.scan_pool.close()
+            futures = None
+        try:
+            yield from records.chained()
+            matched = None
+            if futures is not None:
+                try:
+                    matched = [future.result() for future in futures]
+                except Exception:
+                    logger.warning('Parallel scan failed, scanning serially', exc_info=True)
+                    self.scan_pool.close()
+            if matched is None:
+                for i in range(len(base)):
+                    if not records.shadowed(base[i]):
+                        yield base.decode(i)
+                return
+            for ids in matched:
+                for _id in ids:
+                    if not records.shadowed(_id):
+                        yield base.get(_id)
+        finally:
+            for future in futures or ():
+                future.cancel()
+
+    @staticmethod
+    def matching(t: Transaction, matches, candidates, limit: int | None) -> Iterator[BaseRecord]:
+        if limit == 0:
+            return
+        profile = current()
+        scanned = found = 0
+        try:
+            for rec in candidates:
+                scanned += 1
+                if matches(rec.doc) and t.is_visible(rec):
+                    found += 1
+                    yield rec
+                    if found == limit:
+                        return
+        finally:
+            SCANNED.inc(scanned)
+            RETURNED.inc(found)
+            if profile is not None:
+                profile.scanned += scanned
+                profile.visible += found
+
+    def open_cursor(self, transaction_id: int, query: dict | None, limit: int | None = -1,
+                    batch_size: int | None = None) -> int:
+        # registered as a step, so a commit or rollback ending the transaction meanwhile closes it
+        with self.using(transaction_id) as t:
+            t.collection.plan(query)
+            cursor = Cursor(next(self.cursor_ids), transaction_id, query,
+                            batch_size or settings.CURSOR_BATCH_SIZE, limit)
+            self.cursors[cursor.id] = cursor
+        return cursor.id
+
+    def next_batch(self, cursor_id: int) -> dict:
+        cursor = self.cursors[cursor_id]
+        batch = []
+        with cursor.lock:
+            if not cursor.done:
+                with self.using(cursor.transaction_id):
+                    batch = list(self.iterate(cursor.transaction_id, cursor.query, cursor.take(),
+                                              after=cursor.last_id))
+                cursor.advance(batch)
+        return {'cursor_id': cursor.id, 'batch': [record.to_dict() for record in batch], 'done': cursor.done}
+
+    def close_cursor(self, cursor_id: int) -> None:
+        del self.cursors[cursor_id]
+
+    def close_cursors(self, transaction_id: int) -> None:
+        for cursor in list(self.cursors.values()):
+            if cursor.transaction_id == transaction_id:
+                self.cursors.pop(cursor.id, None)
+
+    @metrics.timed(op_seconds('get'))
+    def fetch_by_id(self, transaction_id: int, _id: int) -> dict | None:
+        with self.using(transaction_id) as t:
+            record = t.fetch_by_id(_id)
+            return record.to_dict() if record is not None else None
+
+    @metrics.timed(op_seconds('update'))
+    def update(self, transaction_id: int, query: dict | None, limit: int | None, new_doc: dict) -> int:
+        with self.profiler.profiling('update', transaction_id, [query], limit) as profile:
+            profile.changed = self.write(transaction_id, [(query, limit, new_doc)])
+            return profile.changed
+
+    @metrics.timed(op_seconds('delete'))
+    def delete(self, transaction_id: int, query: dict | None, limit: int | None) -> int:
+        with self.profiler.profiling('delete', transaction_id, [query], limit) as profile:
+            profile.changed = self.write(transaction_id, [(query, limit, None)])
+            return profile.changed
+
+    @metrics.timed(op_seconds('bulk_write'))
+    def bulk_write(self, transaction_id: int, ops: list[tuple[dict | None, int | None, dict | None]]) -> int:
+        with self.profiler.profiling('bulk_write', transaction_id, [query for query, _, _ in ops]) as profile:
+            profile.changed = self.write(transaction_id, ops)
+            return profile.changed
+
+    def write(self, transaction_id: int, ops: list[tuple[dict | None, int | None, dict | None]]) -> int:
+        """Apply `(query, limit, new_doc)` operations in one pass, a None `new_doc` deletes.
+
+        A record belongs to the first operation whose query it matches,
+        unless that operation's limit is used up. Returns the number of
+        records changed.
+        """
+        with self.using(transaction_id) as t:
+            plans = [t.collection.plan(query) for query, _, _ in ops]
+            for plan in plans:
+                t.reads(plan.predicate)
+            remaining = [-1 if limit is None else limit for _, limit, _ in ops]
+            records = t.collection.records
+            if all(plan.index is not None for plan in plans):
+                ids = set()
+                for plan in plans:
+                    ids.update(plan.index.lookup(plan.conditions))
+                candidates = records.versions(sorted(ids))
+            else:
+                candidates = iter(records)
+
+            targets = []
+            scanned = 0
+            dispatch = dispatcher([plan.query for plan in plans])
+            for rec in candidates:
+                if not any(remaining):
+                    break
+                scanned += 1
+                doc = rec.doc
+                for i in dispatch(doc):
+                    plan = plans[i]
+                    if remaining[i] != 0 and plan.predicate(doc):
+                        if t.is_visible(rec):
+                            targets.append((rec, ops[i][2]))
+                            remaining[i] -= 1
+                        break
+
+            items, ids = [], []
+            changed = 0
+            for rec, new_doc in targets:
+                # no longer there to change if it was expired meanwhile
+                if not t.delete_record_id(_id=rec._id):
+                    continue
+                changed += 1
+                if new_doc is not None:
+                    items.append((rec.name, new_doc))
+                    ids.append(rec._id)
+            if items:
+                t.add_records(items, ids)
+            profile = current()
+            if profile is not None:
+                profile.plans.extend(plan.describe() for plan in plans)
+                profile.scanned += scanned
+                profile.visible += len(targets)
+            return changed
@@ -1,2 +1,22 @@
 class RollbackException(Exception):
     pass
+
+
+class LockTimeoutException(RollbackException):
+    pass
+
+
+class DeadlockException(RollbackException):
+    pass
+
+
+class TransactionTimeoutException(RollbackException):
+    pass
+
+
+class ReadOnlyException(Exception):
+    pass
+
+
+class ChangeStreamException(Exception):
+    pass
@@ -0,0 +1,193 @@
+import bisect
+from enum import Enum
+from typing import Callable, Iterable, Iterator
+
+from app.db.query import MISSING, resolve, sort_key, split_path
+from app.utils.rwlock import RWLock
+
+
+# bucket for documents and lists, which have no order
+UNORDERED = (9,)
+
+
+class IndexType(str, Enum):
+    hash = 'hash'
+    ordered = 'ordered'
+
+
+class Index:
+    """Secondary index on a single doc field.
+
+    Buckets map a key to the `_id`s having at least one version with that
+    key, visible or not. Callers resolve the version chains and re-check
+    the predicate and MVCC visibility on every candidate.
+    `field` may be a dotted path. Keys are the typed `query.sort_key` of
+    the value; docs without the field are skipped and documents or lists
+    share the `UNORDERED` bucket.
+
+    `versions` returns the versions left in an `_id`'s chain; a removed
+    version only drops its `_id` from the bucket when none of them has
+    the same key. Adding is idempotent, so a record may be indexed twice.
+    """
+    predicates: tuple = ()
+
+    def __init__(self, name: str, field: str, versions: Callable[[int], Iterable]) -> None:
+        self.name = name
+        self.field = field
+        self.path = split_path(field)
+        self.versions = versions
+        self.lock = RWLock()
+        self.buckets: dict[tuple, set[int]] = {}
+
+    def key(self, record) -> tuple | None:
+        value = resolve(record.doc, self.path)
+        if value is MISSING:
+            return None
+        return sort_key(value) or UNORDERED
+
+    def supports(self, p: str | None) -> bool:
+        return p in self.predicates
+
+    def add(self, record) -> None:
+        key = self.key(record)
+        if key is None:
+            return
+        with self.lock.write():
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = set()
+                self.on_new_key(key)
+            bucket.add(record._id)
+
+    def add_many(self, records: Iterable) -> None:
+        keyed = [(key, record._id) for record in records if (key := self.key(record)) is not None]
+        with self.lock.write():
+            for key, _id in keyed:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = set()
+                    self.on_new_key(key)
+                bucket.add(_id)
+
+    def remove(self, record) -> None:
+        key = self.key(record)
+        if key is None:
+            return
+        with self.lock.write():
+            bucket = self.buckets.get(key)
+            if bucket is None or any(self.key(version) == key for version in self.versions(record._id)):
+                return
+            bucket.discard(record._id)
+            if not bucket:
+                del self.buckets[key]
+                self.on_drop_key(key)
+
+    def lookup(self, conditions: dict) -> list[int]:
+        """`_id`s whose key may satisfy every `{operator: value}` in `conditions`."""
+        with self.lock.read():
+            ids = set()
+            for key in self.matching_keys(conditions):
+                ids.update(self.buckets[key])
+            return list(ids)
+
+    def describe(self) -> dict:
+        return {'name': self.name, 'field': self.field, 'type': self.type, 'keys': len(self.buckets)}
+
+    def spec(self) -> dict:
+        """Definition saved by the WAL and checkpoints, see `make_index`."""
+        return {'name': self.name, 'field': self.field, 'type': self.type.value}
+
+    def on_new_key(self, key: tuple) -> None:
+        pass
+
+    def on_drop_key(self, key: tuple) -> None:
+        pass
+
+    def matching_keys(self, conditions: dict):
+        raise NotImplementedError
+
+    def equal_keys(self, conditions: dict) -> list[tuple] | None:
+        if '$eq' in conditions:
+            values = [conditions['$eq']]
+        elif '$in' in conditions:
+            values = conditions['$in']
+        else:
+            return None
+        keys = {sort_key(value) or UNORDERED for value in values}
+        return [key for key in keys if key in self.buckets]
+
+
+class HashIndex(Index):
+    type = IndexType.hash
+    predicates = ('$eq', '$ne', '$in')
+
+    def matching_keys(self, conditions: dict):
+        keys = self.equal_keys(conditions)
+        if keys is not None:
+            return keys
+        if '$ne' in conditions:
+            # documents and lists share a bucket without being equal, so it is never excluded
+            excluded = sort_key(conditions['$ne'])
+            return [key for key in self.buckets if key != excluded or key == UNORDERED]
+        return []
+
+
+class OrderedIndex(Index):
+    type = IndexType.ordered
+    predicates = ('$eq', '$in', '$lt', '$lte', '$gt', '$gte')
+
+    def __init__(self, name: str, field: str, versions: Callable[[int], Iterable]) -> None:
+        super().__init__(name, field, versions)
+        self.keys: list[tuple] = []
+
+    def on_new_key(self, key: tuple) -> None:
+        bisect.insort(self.keys, key)
+
+    def on_drop_key(self, key: tuple) -> None:
+        del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def matching_keys(self, conditions: dict):
+        keys = self.equal_keys(conditions)
+        if keys is not None:
+            return keys
+        lo, hi, kind = 0, len(self.keys), None
+        for p, value in conditions.items():
+            bound = sort_key(value)
+            if bound is None or kind not in (None, bound[0]):
+                return []
+            kind = bound[0]
+            match p:
+                case '$lt':
+                    hi = min(hi, bisect.bisect_left(self.keys, bound))
+                case '$lte':
+                    hi = min(hi, bisect.bisect_right(self.keys, bound))
+                case '$gt':
+                    lo = max(lo, bisect.bisect_right(self.keys, bound))
+                case '$gte':
+                    lo = max(lo, bisect.bisect_left(self.keys, bound))
+        if kind is None:
+            return []
+        # ranges never cross into values of another type
+        lo = max(lo, bisect.bisect_left(self.keys, (kind,)))
+        hi = min(hi, bisect.bisect_left(self.keys, (kind + 1,)))
+        return self.keys[lo:hi]
+
+    def walk(self, conditions: dict, reverse: bool = False) -> Iterator[tuple[tuple, list[int]]]:
+        """Keys matching `conditions`, all of them without any, in order with their `_id`s."""
+        with self.lock.read():
+            keys = sorted(self.matching_keys(conditions)) if conditions else list(self.keys)
+        for key in reversed(keys) if reverse else keys:
+            with self.lock.read():
+                ids = sorted(self.buckets.get(key, ()))
+            if ids:
+                yield key, ids
+
+
+def make_index(name: str, field: str, index_type: IndexType, versions: Callable[[int], Iterable]) -> Index:
+    match index_type:
+        case IndexType.hash:
+            return HashIndex(name, field, versions)
+        case IndexType.ordered:
+            return OrderedIndex(name, field, versions)
+        case _:
+            raise ValueError(f'Unknown index type: {index_type}')
@@ -1,16 +1,158 @@
 import threading
+import time
+from collections import deque
+from enum import Enum
+
+from app.db.exeptions import DeadlockException, LockTimeoutException
+from app.utils import metrics
+
+WAIT_SECONDS = metrics.registry.histogram('database_lock_wait_seconds', 'Time spent waiting for record locks.')
+
+
+class LockMode(str, Enum):
+    shared = 'shared'
+    exclusive = 'exclusive'
+
+
+def compatible(a: LockMode, b: LockMode) -> bool:
+    return a is LockMode.shared and b is LockMode.shared
+
+
+class LockEntry:
+    def __init__(self, lock: threading.Lock) -> None:
+        self.holders: dict[int, LockMode] = {}
+        self.waiters: deque[list] = deque()
+        self.cond = threading.Condition(lock)
 
 
 class LockManager:
-    def __init__(self):
+    """Record locks keyed by `_id`, held until the owning transaction ends.
+
+    A request that conflicts with the holders, or queues behind an earlier
+    waiter, waits up to `timeout_s`. Before waiting, the wait-for graph is
+    searched for a path back to the requester, which fails right away
+    with `DeadlockException` if one is found.
+    """
+
+    def __init__(self, timeout_s: float = 5) -> None:
         self.lock = threading.Lock()
-        self.locks = []
+        self.timeout_s = timeout_s
+        self.table: dict[int, LockEntry] = {}
+        self.owned: dict[int, set[int]] = {}
+        self.waiting: dict[int, tuple[int, LockMode]] = {}
+        self.stats = {
+            'acquired': 0,
+            'waits': 0,
+            'wait_time_s': 0.0,
+            'max_wait_s': 0.0,
+            'timeouts': 0,
+            'deadlocks': 0,
+        }
+
+    def grantable(self, entry: LockEntry, t_id: int, mode: LockMode, request=None) -> bool:
+        for holder, held in entry.holders.items():
+            if holder != t_id and not compatible(held, mode):
+                return False
+        if t_id in entry.holders:
+            return True
+        for waiter in entry.waiters:
+            if waiter is request:
+                break
+            return False
+        return True
+
+    def blockers(self, t_id: int) -> set[int]:
+        key, mode = self.waiting[t_id]
+        entry = self.table[key]
+        blocking = {holder for holder, held in entry.holders.items()
+                    if holder != t_id and not compatible(held, mode)}
+        for waiter in entry.waiters:
+            if waiter[0] == t_id:
+                break
+            blocking.add(waiter[0])
+        return blocking
+
+    def deadlocked(self, t_id: int) -> bool:
+        stack, seen = list(self.blockers(t_id)), set()
+        while stack:
+            other = stack.pop()
+            if other == t_id:
+                return True
+            if other in seen or other not in self.waiting:
+                continue
+            seen.add(other)
+            stack.extend(self.blockers(other))
+        return False
+
+    def acquire(self, t_id: int, key: int, mode: LockMode = LockMode.exclusive, timeout_s: float | None = None) -> None:
+        with self.lock:
+            entry = self.table.get(key)
+            if entry is None:
+                entry = self.table[key] = LockEntry(self.lock)
+            held = entry.holders.get(t_id)
+            if held is LockMode.exclusive or held is mode:
+                return
+            if not self.grantable(entry, t_id, mode):
+                try:
+                    self.wait(entry, t_id, key, mode, self.timeout_s if timeout_s is None else timeout_s)
+                except Exception:
+                    if not entry.holders and not entry.waiters:
+                        del self.table[key]
+                    raise
+            entry.holders[t_id] = mode
+            self.owned.setdefault(t_id, set()).add(key)
+            self.stats['acquired'] += 1
+
+    def wait(self, entry: LockEntry, t_id: int, key: int, mode: LockMode, timeout_s: float) -> None:
+        """Queue the request and wait until it can be granted. Called with `lock` held."""
+        request = [t_id, mode]
+        if t_id in entry.holders:
+            entry.waiters.appendleft(request)
+        else:
+            entry.waiters.append(request)
+        self.waiting[t_id] = (key, mode)
+        started = time.monotonic()
+        deadline = started + timeout_s
+        try:
+            if self.deadlocked(t_id):
+                self.stats['deadlocks'] += 1
+                raise DeadlockException(f'Deadlock: transaction {t_id} waiting for record {key}.')
+            while not self.grantable(entry, t_id, mode, request):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise LockTimeoutException(f'Lock wait timeout: transaction {t_id} waiting for record {key}.')
+                entry.cond.wait(remaining)
+        finally:
+            entry.waiters.remove(request)
+            del self.waiting[t_id]
+            waited = time.monotonic() - started
+            WAIT_SECONDS.observe(waited)
+            self.stats['waits'] += 1
+            self.stats['wait_time_s'] += waited
+            self.stats['max_wait_s'] = max(self.stats['max_wait_s'], waited)
+            entry.cond.notify_all()
+
+    def release_all(self, t_id: int) -> None:
+        with self.lock:
+            for key in self.owned.pop(t_id, ()):
+                entry = self.table.get(key)
+                if entry is None:
+                    continue
+                entry.holders.pop(t_id, None)
+                if entry.holders or entry.waiters:
+                    entry.cond.notify_all()
+                else:
+                    del self.table[key]
+
+    def holds(self, t_id: int, key: int) -> LockMode | None:
+        entry = self.table.get(key)
+        return entry.holders.get(t_id) if entry is not None else None
 
-    def add(self, transaction, key):
-        self.lock.acquire()
-        if not self.exists(transaction, key):
-            self.locks.append([transaction, key])
-        self.lock.release()
+    def held(self, t_id: int) -> int:
+        """Number of record locks `t_id` holds."""
+        return len(self.owned.get(t_id, ()))
 
-    def exists(self, transaction, key):
-        return any(lock[0] is transaction and lock[1] == key for lock in self.locks)
+    def describe(self) -> dict:
+        with self.lock:
+            return dict(self.stats, keys=len(self.table), transactions=len(self.owned), waiting=len(self.waiting))
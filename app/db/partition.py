@@ -0,0 +1,133 @@
+import heapq
+import multiprocessing
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+from app.db.query import compile_query
+from app.db.record import BaseRecord
+from app.db.segment import Segment
+from app.db.store import RecordStore, walk
+
+
+class PartitionedStore:
+    """`RecordStore` split into `count` partitions by `_id` hash.
+
+    Every partition has its own chains, lock stripes and order, point
+    operations go straight to the owning partition. Partitions share the
+    base segment, each one only serving its own `_id`s from it.
+    """
+
+    def __init__(self, count: int, records: Iterable[BaseRecord] = (), base: Segment | None = None) -> None:
+        self.count = count
+        self.base = base
+        self.partitions = [RecordStore(base=base, partition=i, partitions=count) for i in range(count)]
+        self.extend(records)
+
+    def partition(self, _id: int) -> RecordStore:
+        return self.partitions[_id % self.count]
+
+    def append(self, record: BaseRecord) -> None:
+        self.partition(record._id).append(record)
+
+    def extend(self, records: Iterable[BaseRecord]) -> None:
+        groups = defaultdict(list)
+        for record in records:
+            groups[record._id % self.count].append(record)
+        for i, group in groups.items():
+            self.partitions[i].extend(group)
+
+    def remove(self, record: BaseRecord) -> None:
+        self.partition(record._id).remove(record)
+
+    def chain(self, _id: int) -> list[BaseRecord]:
+        return self.partition(_id).chain(_id)
+
+    def peek(self, _id: int) -> list[BaseRecord]:
+        return self.partition(_id).peek(_id)
+
+    def versions(self, ids: Iterable[int]) -> Iterator[BaseRecord]:
+        for _id in ids:
+            yield from self.peek(_id)
+
+    def scan(self, after: int = 0) -> Iterator[BaseRecord]:
+        return heapq.merge(*(partition.scan(after) for partition in self.partitions), key=lambda record: record._id)
+
+    def chained(self) -> Iterator[BaseRecord]:
+        for partition in self.partitions:
+            yield from partition.chained()
+
+    def shadowed(self, _id: int) -> bool:
+        return self.partition(_id).shadowed(_id)
+
+    def ids(self) -> Iterator[int]:
+        for partition in self.partitions:
+            yield from partition.ids()
+
+    def max_id(self) -> int:
+        return max(partition.max_id() for partition in self.partitions)
+
+    def __contains__(self, _id: int) -> bool:
+        return _id in self.partition(_id)
+
+    def __iter__(self) -> Iterator[BaseRecord]:
+        """Every version in `_id` order, passing over the shared base segment once."""
+        return walk(heapq.merge(*(partition.chain_ids() for partition in self.partitions)), self.base, self.partition)
+
+    def __len__(self) -> int:
+        return sum(len(partition) for partition in self.partitions)
+
+
+def make_store(partitions: int, records: Iterable[BaseRecord] = (),
+               base: Segment | None = None) -> RecordStore | PartitionedStore:
+    if partitions > 1:
+        return PartitionedStore(partitions, records, base)
+    return RecordStore(records, base)
+
+
+# segments opened by this worker process, keyed by path
+segments: dict[str, Segment] = {}
+
+
+def scan_slice(path: str, start: int, stop: int, query: dict | None) -> list[int]:
+    """`_id`s of the segment entries in `[start, stop)` whose doc matches `query`.
+
+    Runs in a scan worker process.
+    """
+    segment = segments.get(path)
+    if segment is None:
+        segment = segments[path] = Segment(path)
+    predicate = compile_query(query)
+    return [segment[i] for i in range(start, stop) if predicate(segment.decode(i).doc)]
+
+
+class ScanPool:
+    """Process pool filtering the base segment in parallel.
+
+    The segment is split into `slices` contiguous ranges of its entry
+    table. Workers map the file themselves and return the matching
+    `_id`s, the caller decodes only those. The pool starts on first use.
+    """
+
+    def __init__(self, slices: int, workers: int) -> None:
+        self.slices = slices
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.executor: ProcessPoolExecutor | None = None
+
+    def submit(self, segment: Segment, query: dict | None) -> list[Future]:
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+        count = len(segment)
+        bounds = [count * i // self.slices for i in range(self.slices + 1)]
+        return [self.executor.submit(scan_slice, segment.path, start, stop, query)
+                for start, stop in zip(bounds, bounds[1:]) if start < stop]
+
+    def close(self) -> None:
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
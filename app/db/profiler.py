@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+logger = logging.getLogger("database")
+
+_local = threading.local()
+
+
+def current() -> 'Profile | None':
+    """Profile of the operation running on this thread, if any."""
+    return getattr(_local, 'profile', None)
+
+
+class Profile:
+    """Execution profile of one find, update or delete.
+
+    `scanned` counts the versions looked at, `visible` those matching and
+    visible to the transaction, `changed` the records written, `locks`
+    the record locks the transaction got meanwhile.
+    """
+    __slots__ = ('op', 'transaction_id', 'queries', 'limit', 'sort', 'plans', 'scanned', 'visible', 'changed',
+                 'locks', 'cache_hit', 'error', 'at', 'started', 'wall_s', 'locks_before')
+
+    def __init__(self, op: str, transaction_id: int, queries: list, limit: int | None = None,
+                 sort: dict | None = None) -> None:
+        self.op = op
+        self.transaction_id = transaction_id
+        self.queries = queries
+        self.limit = limit
+        self.sort = sort
+        self.plans: list[dict] = []
+        self.scanned = 0
+        self.visible = 0
+        self.changed: int | None = None
+        self.locks = 0
+        self.cache_hit = False
+        self.error: str | None = None
+        self.at = time.time()
+        self.started = time.perf_counter()
+        self.wall_s = 0.0
+        self.locks_before = 0
+
+    def to_dict(self) -> dict:
+        return {
+            'op': self.op,
+            'transaction_id': self.transaction_id,
+            'queries': self.queries,
+            'limit': self.limit,
+            'sort': self.sort,
+            'plans': self.plans,
+            'scanned': self.scanned,
+            'visible': self.visible,
+            'changed': self.changed,
+            'locks': self.locks,
+            'cache_hit': self.cache_hit,
+            'error': self.error,
+            'at': self.at,
+            'wall_ms': round(self.wall_s * 1000, 3),
+        }
+
+
+class Profiler:
+    """Profiles operations and hands every finished profile to `hooks`.
+
+    A hook is a callable taking the `Profile`; hooks run on the thread
+    that finished the operation and must not raise.
+    """
+
+    def __init__(self, locks) -> None:
+        self.locks = locks
+        self.hooks: list[Callable[[Profile], None]] = []
+
+    def start(self, op: str, transaction_id: int, queries: list, limit: int | None = None,
+              sort: dict | None = None) -> Profile:
+        profile = Profile(op, transaction_id, queries, limit, sort)
+        profile.locks_before = self.locks.held(transaction_id)
+        return profile
+
+    def finish(self, profile: Profile, error: BaseException | None = None, wall_s: float | None = None) -> None:
+        profile.wall_s = time.perf_counter() - profile.started if wall_s is None else wall_s
+        profile.locks = max(self.locks.held(profile.transaction_id) - profile.locks_before, 0)
+        if error is not None:
+            profile.error = str(error) or type(error).__name__
+        for hook in self.hooks:
+            try:
+                hook(profile)
+            except Exception:
+                logger.critical('Profiler hook failed', exc_info=True)
+
+    @contextmanager
+    def profiling(self, op: str, transaction_id: int, queries: list, limit: int | None = None) -> Iterator[Profile]:
+        profile = self.start(op, transaction_id, queries, limit)
+        error = None
+        previous, _local.profile = current(), profile
+        try:
+            yield profile
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _local.profile = previous
+            self.finish(profile, error)
+
+    @staticmethod
+    def call(profile: Profile, function, *args, **kwargs):
+        """`function(*args, **kwargs)` with `profile` as the thread's profile,
+        so the scans it runs count into it."""
+        previous, _local.profile = current(), profile
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.profile = previous
+
+    def rows(self, profile: Profile, rows: Iterator[dict]) -> Iterator[dict]:
+        """Pass `rows` through with `profile` active, finishing it once they run
+        out or the iterator is closed. Like `metrics.timed_rows`, the time the
+        consumer spends between rows is not counted."""
+        elapsed = time.perf_counter() - profile.started
+        error = None
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    row = self.call(profile, next, rows)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield row
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # a scan stopped early counts what it got through as it's closed
+            close = getattr(rows, 'close', None)
+            if close is not None:
+                close()
+            self.finish(profile, error, elapsed)
+
+
+class SlowQueryLog:
+    """Profiler hook keeping the last `size` profiles that took at least `threshold_ms`."""
+
+    def __init__(self, threshold_ms: float, size: int) -> None:
+        self.threshold_ms = threshold_ms
+        self.entries: deque[dict] = deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.logged = 0
+
+    def __call__(self, profile: Profile) -> None:
+        if profile.wall_s * 1000 < self.threshold_ms:
+            return
+        entry = profile.to_dict()
+        with self.lock:
+            self.entries.append(entry)
+            self.logged += 1
+        logger.warning('Slow %s in transaction %s: %.1f ms, %s scanned, %s visible',
+                       profile.op, profile.transaction_id, entry['wall_ms'], profile.scanned, profile.visible)
+
+    def recent(self, limit: int | None = None) -> list[dict]:
+        """Slowest first."""
+        with self.lock:
+            entries = list(self.entries)
+        entries.sort(key=lambda entry: entry['wall_ms'], reverse=True)
+        return entries if limit is None else entries[:limit]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def describe(self) -> dict:
+        with self.lock:
+            return {'threshold_ms': self.threshold_ms, 'size': self.entries.maxlen, 'entries': len(self.entries),
+                    'logged': self.logged}
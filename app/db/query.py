@@ -0,0 +1,343 @@
+import json
+from collections import defaultdict
+from typing import Any, Callable
+
+MISSING = object()
+
+COMPARISONS = ('$eq', '$ne', '$lt', '$lte', '$gt', '$gte', '$in', '$nin')
+FIELD_OPERATORS = COMPARISONS + ('$exists', '$not')
+LOGICAL_OPERATORS = ('$and', '$or', '$not')
+
+
+class QueryError(ValueError):
+    pass
+
+
+def split_path(field: str) -> tuple[str, ...]:
+    return tuple(field.split('.'))
+
+
+def resolve(doc, path: tuple[str, ...]):
+    """Value at a dotted path, list items are addressed by position."""
+    for part in path:
+        if isinstance(doc, dict):
+            doc = doc.get(part, MISSING)
+        elif isinstance(doc, list) and part.isdigit() and int(part) < len(doc):
+            doc = doc[int(part)]
+        else:
+            return MISSING
+        if doc is MISSING:
+            return MISSING
+    return doc
+
+
+def sort_key(value) -> tuple | None:
+    """Total order over scalars: null < numbers < strings < booleans.
+
+    Values of different kinds never compare as equal or ordered, so `"10"`
+    and `10` are distinct and numbers are ordered numerically. Returns None
+    for values that can't be ordered (documents and lists).
+    """
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (3, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return None
+
+
+def order_key(value) -> tuple:
+    """Total order over any values: missing first, then as `sort_key`, then documents and lists."""
+    if value is MISSING:
+        return (-1,)
+    key = sort_key(value)
+    return key if key is not None else (4, json.dumps(value, sort_keys=True, default=str))
+
+
+class Descending:
+    """Sort key ordering the other way round."""
+    __slots__ = ('key',)
+
+    def __init__(self, key) -> None:
+        self.key = key
+
+    def __lt__(self, other: 'Descending') -> bool:
+        return other.key < self.key
+
+    def __eq__(self, other) -> bool:
+        return self.key == other.key
+
+
+def sort_order(spec: dict) -> tuple[Callable[[Any], Any], bool]:
+    """Key ordering docs by `{"field": 1 or -1, ...}` (see `order_key`), and
+    whether to sort by it in reverse. When every field is descending the
+    key is ascending and reversed, rather than compared through `Descending`.
+    """
+    if not isinstance(spec, dict) or not spec or \
+            any(direction not in (1, -1) or isinstance(direction, bool) for direction in spec.values()):
+        raise QueryError('A sort must be {field: 1 or -1}')
+    reverse = all(direction == -1 for direction in spec.values())
+    fields = [(split_path(field), direction == -1 and not reverse) for field, direction in spec.items()]
+    if len(fields) == 1:
+        path = fields[0][0]
+        return (lambda doc: order_key(resolve(doc, path))), reverse
+
+    def key(doc) -> tuple:
+        return tuple([Descending(order_key(resolve(doc, path))) if descending else order_key(resolve(doc, path))
+                      for path, descending in fields])
+
+    return key, reverse
+
+
+def compile_projection(fields: list[str]) -> Callable[[Any], dict]:
+    """Function copying the values at the dotted `fields` of a doc into a new
+    doc, nested as they are. Missing fields are left out, a field inside
+    another one projected is already included."""
+    if not isinstance(fields, list) or not all(isinstance(field, str) and field for field in fields):
+        raise QueryError('A projection must be a list of fields')
+    paths = []
+    for path in sorted({split_path(field) for field in fields}, key=len):
+        if not any(path[:len(kept)] == kept for kept in paths):
+            paths.append(path)
+
+    def project(doc) -> dict:
+        projected = {}
+        for path in paths:
+            value = resolve(doc, path)
+            if value is MISSING:
+                continue
+            target = projected
+            for part in path[:-1]:
+                target = target.setdefault(part, {})
+            target[path[-1]] = value
+        return projected
+
+    return project
+
+
+def comparison(op: str, value) -> Callable[[Any], bool]:
+    """Predicate on a resolved field value, MISSING never matches."""
+    match op:
+        case '$eq' | '$ne':
+            key, kind = sort_key(value), type(value)
+
+            def eq(field) -> bool:
+                # same type compares directly, others through their sort keys
+                if key is None or type(field) is kind:
+                    return field == value
+                return sort_key(field) == key
+
+            if op == '$eq':
+                return lambda field: field is not MISSING and eq(field)
+            return lambda field: field is not MISSING and not eq(field)
+        case '$in' | '$nin':
+            if not isinstance(value, list):
+                raise QueryError(f'{op} expects a list')
+            keys = {sort_key(v) for v in value if sort_key(v) is not None}
+            others = [v for v in value if sort_key(v) is None]
+
+            def contained(field) -> bool:
+                key = sort_key(field)
+                return key in keys if key is not None else field in others
+
+            if op == '$in':
+                return lambda field: field is not MISSING and contained(field)
+            return lambda field: field is not MISSING and not contained(field)
+        case '$lt' | '$lte' | '$gt' | '$gte':
+            bound = sort_key(value)
+            if bound is None:
+                raise QueryError(f'{op} expects a scalar value')
+            kind = bound[0]
+            test = {
+                '$lt': lambda key: key < bound,
+                '$lte': lambda key: key <= bound,
+                '$gt': lambda key: key > bound,
+                '$gte': lambda key: key >= bound,
+            }[op]
+
+            def ordered(field) -> bool:
+                key = sort_key(field)
+                return key is not None and key[0] == kind and test(key)
+
+            return ordered
+    raise QueryError(f'Unknown operator: {op}')
+
+
+def compile_field(path: tuple[str, ...], spec) -> Callable[[Any], bool]:
+    if not isinstance(spec, dict) or not spec or not all(key.startswith('$') for key in spec):
+        test = comparison('$eq', spec)
+        return lambda doc: test(resolve(doc, path))
+
+    tests = []
+    for op, value in spec.items():
+        match op:
+            case '$exists':
+                exists = bool(value)
+                tests.append(lambda field: (field is not MISSING) == exists)
+            case '$not':
+                inner = compile_field(('',), value)
+                tests.append(lambda field: not inner({'': field} if field is not MISSING else {}))
+            case _ if op in COMPARISONS:
+                tests.append(comparison(op, value))
+            case _:
+                raise QueryError(f'Unknown operator: {op}')
+
+    if len(tests) == 1:
+        test = tests[0]
+        return lambda doc: test(resolve(doc, path))
+    return lambda doc: all(test(field) for field in (resolve(doc, path),) for test in tests)
+
+
+def compile_query(query: dict | None) -> Callable[[Any], bool]:
+    """Compile a filter document into a single predicate on docs.
+
+    `{"a.b": 1, "c": {"$gte": 2, "$lt": 5}}` matches docs where both terms
+    hold. Logical operators: `$and`/`$or` take a list of filters, `$not`
+    a filter. Field operators: `$eq $ne $lt $lte $gt $gte $in $nin $exists
+    $not`; a plain value means `$eq`.
+    """
+    if not query:
+        return lambda doc: True
+    if not isinstance(query, dict):
+        raise QueryError('A query must be an object')
+
+    tests = []
+    for key, spec in query.items():
+        match key:
+            case '$and' | '$or':
+                if not isinstance(spec, list) or not spec:
+                    raise QueryError(f'{key} expects a non-empty list')
+                parts = [compile_query(part) for part in spec]
+                if key == '$and':
+                    tests.append(lambda doc, parts=parts: all(part(doc) for part in parts))
+                else:
+                    tests.append(lambda doc, parts=parts: any(part(doc) for part in parts))
+            case '$not':
+                inner = compile_query(spec)
+                tests.append(lambda doc, inner=inner: not inner(doc))
+            case _ if key.startswith('$'):
+                raise QueryError(f'Unknown operator: {key}')
+            case _:
+                tests.append(compile_field(split_path(key), spec))
+
+    if len(tests) == 1:
+        return tests[0]
+    return lambda doc: all(test(doc) for test in tests)
+
+
+def conjuncts(query: dict | None) -> dict[str, dict]:
+    """Field conditions every match must satisfy, as `{field: {op: value}}`."""
+    terms: dict[str, dict] = {}
+    if not query:
+        return terms
+    for key, spec in query.items():
+        if key == '$and':
+            for part in spec:
+                for field, ops in conjuncts(part).items():
+                    terms.setdefault(field, {}).update(ops)
+        elif not key.startswith('$'):
+            if isinstance(spec, dict) and spec and all(op.startswith('$') for op in spec):
+                ops = {op: value for op, value in spec.items() if op in COMPARISONS}
+            else:
+                ops = {'$eq': spec}
+            if ops:
+                terms.setdefault(key, {}).update(ops)
+    return terms
+
+
+def from_cond(field: str | None, p: str | None, value) -> dict:
+    """Filter document for the single `field/predicate/value` condition."""
+    if not field or not p:
+        return {}
+    return {field: {p: value}}
+
+
+class Plan:
+    """How a query is executed: a predicate plus an optional index lookup."""
+
+    def __init__(self, query: dict | None, predicate: Callable[[Any], bool], index=None,
+                 conditions: dict | None = None) -> None:
+        self.query = query
+        self.predicate = predicate
+        self.index = index
+        self.conditions = conditions or {}
+
+    def candidates(self, store):
+        if self.index is None:
+            return iter(store)
+        return store.versions(self.index.lookup(self.conditions))
+
+    def ordered(self, store, after: int = 0):
+        """Candidates in `_id` order, starting after `after`."""
+        if self.index is None:
+            return store.scan(after)
+        return store.versions(sorted(_id for _id in self.index.lookup(self.conditions) if _id > after))
+
+    def describe(self) -> dict:
+        if self.index is None:
+            return {'type': 'scan'}
+        return {'type': 'index', 'index': self.index.name, 'field': self.index.field, 'conditions': self.conditions}
+
+
+def make_plan(query: dict | None, indexes) -> Plan:
+    """Compile `query` and pick an index for one of its top-level conditions.
+
+    Equality lookups are preferred over ranges.
+    """
+    predicate = compile_query(query)
+    best = None
+    for field, ops in conjuncts(query).items():
+        for index in indexes:
+            if index.field != field:
+                continue
+            usable = {op: value for op, value in ops.items() if index.supports(op)}
+            if not usable:
+                continue
+            rank = 0 if '$eq' in usable or '$in' in usable else 1
+            if best is None or rank < best[0]:
+                best = (rank, index, usable)
+    if best is None:
+        return Plan(query, predicate)
+    return Plan(query, predicate, best[1], best[2])
+
+
+def dispatcher(queries: list[dict | None]) -> Callable[[Any], list[int]]:
+    """Positions of the queries a doc may match, in order.
+
+    Queries with a scalar `$eq` condition on the field with the most
+    distinct such values are looked up by that field's value in the doc,
+    the others are always returned. Callers still run each query's predicate.
+    """
+    terms = [conjuncts(query) for query in queries]
+    values = defaultdict(set)
+    for term in terms:
+        for field, ops in term.items():
+            if '$eq' in ops and (key := sort_key(ops['$eq'])) is not None:
+                values[field].add(key)
+    everything = list(range(len(queries)))
+    if not values:
+        return lambda doc: everything
+
+    field = max(values, key=lambda name: len(values[name]))
+    path = split_path(field)
+    table: dict[tuple, list[int]] = defaultdict(list)
+    residual = []
+    for i, term in enumerate(terms):
+        key = sort_key(term[field]['$eq']) if '$eq' in term.get(field, {}) else None
+        if key is not None:
+            table[key].append(i)
+        else:
+            residual.append(i)
+    table = dict(table)
+
+    def candidates(doc) -> list[int]:
+        value = resolve(doc, path)
+        hit = table.get(sort_key(value)) if value is not MISSING else None
+        if not hit:
+            return residual
+        return sorted(hit + residual) if residual else hit
+
+    return candidates
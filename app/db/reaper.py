@@ -0,0 +1,70 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("database")
+
+
+class Reaper:
+    """Rolls back transactions past their deadline or idle for too long.
+
+    A transaction is idle while no operation runs on it, `last_used` is
+    when the last one ended. Transactions with an operation in progress
+    are left for a later pass; a new operation on one past its deadline
+    fails with `TransactionTimeoutException` instead of starting.
+    """
+
+    def __init__(self, database, idle_s: float = 60, interval_s: float = 1) -> None:
+        self.database = database
+        self.idle_s = idle_s
+        self.interval_s = interval_s
+        self.closed = threading.Event()
+        self.stats = {
+            'runs': 0,
+            'reaped': 0,
+            'deadline': 0,
+            'idle': 0,
+            'last_reaped': 0,
+        }
+
+    def expired(self, t, now: float) -> str | None:
+        if t.deadline is not None and now >= t.deadline:
+            return 'deadline'
+        if self.idle_s and now - t.last_used >= self.idle_s:
+            return 'idle'
+        return None
+
+    def run(self) -> dict:
+        now = time.monotonic()
+        db = self.database
+        reaped = []
+        with db.transactions_lock:
+            for t in list(db.transactions.values()):
+                reason = self.expired(t, now)
+                if reason is not None and not t.busy:
+                    del db.transactions[t.id]
+                    reaped.append((t, reason))
+        for t, reason in reaped:
+            with t.mutex:
+                t.finished = True
+            try:
+                t.rollback()
+            finally:
+                db.close_cursors(t.id)
+            self.stats[reason] += 1
+            logger.warning('Transaction: %s rolled back, %s expired', t.id, reason)
+
+        self.stats['runs'] += 1
+        self.stats['reaped'] += len(reaped)
+        self.stats['last_reaped'] = len(reaped)
+        return dict(self.stats)
+
+    def daemon(self) -> None:
+        while not self.closed.wait(self.interval_s):
+            try:
+                self.run()
+            except Exception:
+                logger.critical('Reaper failed', exc_info=True)
+
+    def close(self) -> None:
+        self.closed.set()
@@ -0,0 +1,78 @@
+import pickle
+import sys
+
+# commit sequence number of a version whose creating or expiring transaction has not committed
+PENDING = sys.maxsize
+
+
+class BaseRecord:
+    """One version of a document together with its MVCC header.
+
+    `created_id` and `expired_id` are the transactions that wrote and
+    expired the version, `created_ts` and `expired_ts` the commit sequence
+    numbers they got, PENDING until they commit. Loaded versions were
+    committed before any running transaction began, `created_ts` 0.
+    """
+    __slots__ = ('_id', 'name', 'created_id', 'expired_id', 'created_ts', 'expired_ts')
+
+    def __init__(self, _id: int, name: str, doc, created_id: int = 0, expired_id: int = 0,
+                 created_ts: int = 0, expired_ts: int = PENDING) -> None:
+        self._id = _id
+        self.name = sys.intern(name) if isinstance(name, str) else name
+        self.created_id = created_id
+        self.expired_id = expired_id
+        self.created_ts = created_ts
+        self.expired_ts = expired_ts
+
+    @classmethod
+    def slots(cls) -> list[str]:
+        return [slot for klass in reversed(cls.__mro__) for slot in getattr(klass, '__slots__', ())]
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BaseRecord':
+        return cls(data['_id'], data['name'], data['doc'], data.get('created_id', 0), data.get('expired_id', 0))
+
+    def copy(self, **changes) -> 'BaseRecord':
+        record = self.__class__.__new__(self.__class__)
+        for slot in self.slots():
+            setattr(record, slot, changes.get(slot, getattr(self, slot)))
+        return record
+
+    def to_dict(self) -> dict:
+        return {
+            '_id': self._id,
+            'name': self.name,
+            'doc': self.doc,
+            'created_id': self.created_id,
+            'expired_id': self.expired_id
+        }
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.to_dict()})'
+
+
+class Record(BaseRecord):
+    __slots__ = ('doc',)
+
+    def __init__(self, _id: int, name: str, doc, created_id: int = 0, expired_id: int = 0,
+                 created_ts: int = 0, expired_ts: int = PENDING) -> None:
+        super().__init__(_id, name, doc, created_id, expired_id, created_ts, expired_ts)
+        self.doc = doc
+
+
+class CompactRecord(BaseRecord):
+    """Record keeping its doc pickled, the doc is decoded on every access."""
+    __slots__ = ('data',)
+
+    def __init__(self, _id: int, name: str, doc, created_id: int = 0, expired_id: int = 0,
+                 created_ts: int = 0, expired_ts: int = PENDING) -> None:
+        super().__init__(_id, name, doc, created_id, expired_id, created_ts, expired_ts)
+        self.data = pickle.dumps(doc, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @property
+    def doc(self):
+        return pickle.loads(self.data)
+
+
+def record_class(compact: bool = False) -> type[BaseRecord]:
+    return CompactRecord if compact else Record
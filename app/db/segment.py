@@ -0,0 +1,96 @@
+import bisect
+import mmap
+import pickle
+import struct
+from typing import Iterable, Iterator
+
+from app.db.record import BaseRecord, Record
+from app.utils.fs import atomic_open
+
+MAGIC = b'KYDB'
+VERSION = 1
+# magic, version, lsn, next_doc, count, table offset
+HEADER = struct.Struct('<4sHQQQQ')
+# _id, offset, length
+ENTRY = struct.Struct('<QQI')
+LENGTH = struct.Struct('<I')
+
+
+class SegmentError(Exception):
+    pass
+
+
+class Segment:
+    """Read-only, memory-mapped image of committed records.
+
+    Layout: header, length-prefixed pickled `(name, doc)` pairs, then an
+    `_id` offset table sorted by `_id`. Opening a segment only parses the
+    header, lookups binary search the table in the mapping and decode a
+    single record.
+    """
+
+    def __init__(self, path: str, record_class: type[BaseRecord] = Record) -> None:
+        self.path = path
+        self.record_class = record_class
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size:
+            raise SegmentError(f'{path} is too short')
+        magic, version, self.lsn, self.next_doc, self.count, self.table = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise SegmentError(f'{path} is not a segment file')
+
+    @staticmethod
+    def is_segment(path: str) -> bool:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> int:
+        return ENTRY.unpack_from(self.mm, self.table + i * ENTRY.size)[0]
+
+    def position(self, _id: int) -> int:
+        i = bisect.bisect_left(self, _id)
+        return i if i < self.count and self[i] == _id else -1
+
+    def __contains__(self, _id: int) -> bool:
+        return self.position(_id) >= 0
+
+    def decode(self, i: int) -> BaseRecord:
+        _id, offset, length = ENTRY.unpack_from(self.mm, self.table + i * ENTRY.size)
+        name, doc = pickle.loads(self.mm[offset + LENGTH.size:offset + LENGTH.size + length])
+        return self.record_class(_id, name, doc)
+
+    def get(self, _id: int) -> BaseRecord | None:
+        i = self.position(_id)
+        return self.decode(i) if i >= 0 else None
+
+    def ids(self) -> Iterator[int]:
+        for i in range(self.count):
+            yield self[i]
+
+    def max_id(self) -> int:
+        return self[self.count - 1] if self.count else 0
+
+    def close(self) -> None:
+        self.mm.close()
+
+    @staticmethod
+    def write(path: str, records: Iterable[BaseRecord], lsn: int, next_doc: int) -> int:
+        """Write records sorted by `_id` to `path` atomically, returns the file size."""
+        entries = []
+        with atomic_open(path) as f:
+            f.write(b'\0' * HEADER.size)
+            offset = HEADER.size
+            for record in records:
+                payload = pickle.dumps((record.name, record.doc), protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(LENGTH.pack(len(payload)))
+                f.write(payload)
+                entries.append(ENTRY.pack(record._id, offset, len(payload)))
+                offset += LENGTH.size + len(payload)
+            f.write(b''.join(entries))
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, lsn, next_doc, len(entries), offset))
+        return offset + len(entries) * ENTRY.size
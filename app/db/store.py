@@ -0,0 +1,226 @@
+import bisect
+import heapq
+import threading
+from collections import defaultdict
+from typing import Iterable, Iterator
+
+from app.db.record import BaseRecord
+from app.db.segment import Segment
+
+
+class RecordStore:
+    """Record versions keyed by `_id`.
+
+    Each key holds its version chain, oldest version first. Point lookups,
+    appends and removals touch a single chain, so they do not depend on
+    the size of the store.
+
+    Committed records loaded from a checkpoint stay in the memory-mapped
+    `base` segment. A base record gets a chain the first time it is
+    fetched for reading or writing through `chain`; scans and `peek`
+    decode it without keeping it. `removed` holds base `_id`s whose
+    chain has since been emptied.
+
+    Chains are copy-on-write: writers replace the list under the lock
+    stripe of its `_id`, so readers can iterate a chain without locking.
+    `order` keeps the chain `_id`s sorted for `scan`.
+
+    As one of `partitions` stores sharing a base segment, it only holds
+    `_id`s with `_id % partitions == partition`, see `PartitionedStore`.
+    """
+
+    STRIPES = 64
+    # chain `_id`s a full iteration takes at once
+    CHUNK = 1024
+
+    def __init__(self, records: Iterable[BaseRecord] = (), base: Segment | None = None,
+                 partition: int = 0, partitions: int = 1) -> None:
+        self.partition = partition
+        self.partitions = partitions
+        self.locks = [threading.Lock() for _ in range(self.STRIPES)]
+        self.chains: dict[int, list[BaseRecord]] = {}
+        self.base = base
+        self.removed: set[int] = set()
+        self.order: list[int] = []
+        self.order_lock = threading.Lock()
+        for record in records:
+            self.append(record)
+
+    def owns(self, _id: int) -> bool:
+        return self.partitions == 1 or _id % self.partitions == self.partition
+
+    def load(self, _id: int) -> list[BaseRecord]:
+        if self.base is None or _id in self.removed:
+            return []
+        record = self.base.get(_id)
+        return [record] if record is not None else []
+
+    def stripe(self, _id: int) -> threading.Lock:
+        return self.locks[_id % self.STRIPES]
+
+    def append(self, record: BaseRecord) -> None:
+        with self.stripe(record._id):
+            chain = self.chains.get(record._id)
+            if chain is None:
+                chain = self.load(record._id)
+                self.ordered(record._id)
+            self.chains[record._id] = chain + [record]
+
+    def extend(self, records: Iterable[BaseRecord]) -> None:
+        """Append many versions, taking each lock stripe once."""
+        groups = defaultdict(list)
+        new_ids = []
+        for record in records:
+            groups[record._id % self.STRIPES].append(record)
+        for stripe, group in groups.items():
+            with self.locks[stripe]:
+                for record in group:
+                    chain = self.chains.get(record._id)
+                    if chain is None:
+                        chain = self.load(record._id)
+                        new_ids.append(record._id)
+                    self.chains[record._id] = chain + [record]
+        self.ordered(*new_ids)
+
+    def remove(self, record: BaseRecord) -> None:
+        with self.stripe(record._id):
+            chain = self.chains.get(record._id)
+            if chain is None:
+                return
+            chain = [version for version in chain if version is not record]
+            if chain:
+                self.chains[record._id] = chain
+            else:
+                self.chains.pop(record._id, None)
+                with self.order_lock:
+                    i = bisect.bisect_left(self.order, record._id)
+                    if i < len(self.order) and self.order[i] == record._id:
+                        del self.order[i]
+                if self.base is not None and record._id in self.base:
+                    self.removed.add(record._id)
+
+    def chain(self, _id: int) -> list[BaseRecord]:
+        chain = self.chains.get(_id)
+        if chain is None:
+            with self.stripe(_id):
+                chain = self.chains.get(_id)
+                if chain is None:
+                    chain = self.load(_id)
+                    if chain:
+                        self.ordered(_id)
+                        self.chains[_id] = chain
+        return chain
+
+    def ordered(self, *ids: int) -> None:
+        ids = sorted(ids)
+        with self.order_lock:
+            if not ids:
+                return
+            if not self.order or self.order[-1] < ids[0]:
+                self.order.extend(ids)
+            elif len(ids) > self.STRIPES:
+                self.order = list(heapq.merge(self.order, ids))
+            else:
+                for _id in ids:
+                    bisect.insort(self.order, _id)
+
+    def peek(self, _id: int) -> list[BaseRecord]:
+        chain = self.chains.get(_id)
+        return chain if chain is not None else self.load(_id)
+
+    def versions(self, ids: Iterable[int]) -> Iterator[BaseRecord]:
+        for _id in ids:
+            yield from self.peek(_id)
+
+    def scan(self, after: int = 0) -> Iterator[BaseRecord]:
+        """Versions in `_id` order, starting after `after`.
+
+        Each step re-seeks past the last `_id` returned, so concurrent
+        inserts and removals never make it skip or repeat a key.
+        """
+        last = after
+        base_count = len(self.base) if self.base is not None else 0
+        i = bisect.bisect_right(self.base, last) if base_count else 0
+        while True:
+            with self.order_lock:
+                j = bisect.bisect_right(self.order, last)
+                chained = self.order[j] if j < len(self.order) else None
+            while i < base_count and (self.base[i] <= last or not self.owns(self.base[i])):
+                i += 1
+            based = self.base[i] if i < base_count else None
+            if chained is None and based is None:
+                return
+            last = min(_id for _id in (chained, based) if _id is not None)
+            yield from self.peek(last)
+
+    def chained(self) -> Iterator[BaseRecord]:
+        """Versions held in chains, i.e. all but the untouched base records."""
+        for chain in list(self.chains.values()):
+            yield from chain
+
+    def shadowed(self, _id: int) -> bool:
+        """Whether the base version of `_id` has been replaced or removed."""
+        return _id in self.chains or _id in self.removed
+
+    def ids(self) -> Iterator[int]:
+        materialized = list(self.chains)
+        yield from materialized
+        if self.base is not None:
+            materialized = set(materialized)
+            for _id in self.base.ids():
+                if _id not in materialized and _id not in self.chains and _id not in self.removed \
+                        and self.owns(_id):
+                    yield _id
+
+    def max_id(self) -> int:
+        return max(max(self.chains, default=0), self.base.max_id() if self.base is not None else 0)
+
+    def __contains__(self, _id: int) -> bool:
+        return _id in self.chains or (self.base is not None and _id not in self.removed and _id in self.base)
+
+    def __iter__(self) -> Iterator[BaseRecord]:
+        """Every version in `_id` order, like `scan` but taking the chain
+        `_id`s CHUNK at a time, so a full pass neither copies the store nor
+        seeks once per key."""
+        return walk(self.chain_ids(), self.base, lambda _id: self)
+
+    def chain_ids(self) -> Iterator[int]:
+        """`_id`s of the chains in order, taken CHUNK at a time under `order_lock`."""
+        last = 0
+        while True:
+            with self.order_lock:
+                j = bisect.bisect_right(self.order, last)
+                chunk = self.order[j:j + self.CHUNK]
+            yield from chunk
+            if len(chunk) < self.CHUNK:
+                return
+            last = chunk[-1]
+
+    def peek_base(self, i: int) -> list[BaseRecord]:
+        """`peek` of the `i`th base `_id`, decoding it by position."""
+        _id = self.base[i]
+        if not self.owns(_id):
+            return []
+        chain = self.chains.get(_id)
+        if chain is not None:
+            return chain
+        return [] if _id in self.removed else [self.base.decode(i)]
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.ids()) + sum(len(chain) - 1 for chain in list(self.chains.values()))
+
+
+def walk(chain_ids: Iterator[int], base: Segment | None, owner) -> Iterator[BaseRecord]:
+    """Versions in `_id` order, merging the sorted `chain_ids` with one pass
+    over the `base` segment. `owner(_id)` is the `RecordStore` serving `_id`."""
+    base_count = len(base) if base is not None else 0
+    i = 0
+    for _id in chain_ids:
+        while i < base_count and (based := base[i]) <= _id:
+            if based < _id:
+                yield from owner(based).peek_base(i)
+            i += 1
+        yield from owner(_id).peek(_id)
+    while i < base_count:
+        yield from owner(base[i]).peek_base(i)
+        i += 1
@@ -1,9 +1,10 @@
-from exeptions import RollbackException
-from collection import Collection
-from transaction import ReadCommittedTransaction
-
 import datetime
 
+from app.db.collection import Collection
+from app.db.exeptions import RollbackException
+from app.db.transaction import (OptimisticTransaction, ReadCommittedTransaction, ReadUncommittedTransaction,
+                                RepeatableReadTransaction, SerializableTransaction)
+
 doc1 = {
     'name': {'first': 'Alan', 'last': 'Turing'},
     'birth': str(datetime.date(1912, 6, 23)),
@@ -20,10 +21,12 @@ doc2 = {
 
 class TransactionTest:
     def __init__(self, transaction_type):
-        self.col = Collection()
+        self.col = Collection(lock_timeout_s=0.1)
         t0 = self.col.begin(ReadCommittedTransaction)
         t0.add_record(name='Doc1', doc=doc1)
         t0.add_record(name='Doc2', doc=doc2)
+        self.doc1_id = t0.fetch_record(name='Doc1')._id
+        self.doc2_id = t0.fetch_record(name='Doc2')._id
         t0.commit()
 
         self.t1 = self.col.begin(transaction_type)
@@ -47,7 +50,7 @@ class TransactionTest:
 class DirtyRead(TransactionTest):
     def run(self):
         result1 = self.t1.fetch_record(name='Doc1')
-        self.t2.update_record(name='Doc1', doc=doc2)
+        self.t2.update_record(self.doc1_id, name='Doc1', doc=doc2)
         result2 = self.t1.fetch_record(name='Doc1')
 
         return result1 != result2
@@ -56,7 +59,7 @@ class DirtyRead(TransactionTest):
 class NonRepeatableRead(TransactionTest):
     def run(self):
         result1 = self.t1.fetch_record(name='Doc1')
-        self.t2.update_record(name='Doc1', doc=doc1)
+        self.t2.update_record(self.doc1_id, name='Doc1', doc=doc1)
         self.t2.commit()
         result2 = self.t1.fetch_record(name='Doc1')
 
@@ -71,3 +74,25 @@ class PhantomRead(TransactionTest):
         result2 = self.t1.count_records()
 
         return result1 != result2
+
+
+class WriteSkew(TransactionTest):
+    def run(self):
+        self.t1.count_records()
+        self.t2.count_records()
+        self.t1.update_record(self.doc1_id, name='Doc1', doc=doc2)
+        self.t2.update_record(self.doc2_id, name='Doc2', doc=doc1)
+        self.t1.commit()
+        self.t2.commit()
+
+        return True
+
+
+if __name__ == '__main__':
+    # ✔ where the anomaly shows up, run with `python -m app.db.test`
+    tests = [DirtyRead, NonRepeatableRead, PhantomRead, WriteSkew]
+    print(f'{"":<20}' + ''.join(f'{test.__name__:<20}' for test in tests))
+    for transaction_type in [ReadUncommittedTransaction, ReadCommittedTransaction,
+                             RepeatableReadTransaction, SerializableTransaction, OptimisticTransaction]:
+        print(f'{transaction_type.__name__.removesuffix("Transaction"):<20}'
+              + ''.join(f'{test(transaction_type).result():<20}' for test in tests))
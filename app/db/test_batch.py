@@ -0,0 +1,50 @@
+from app.models.command import Batch
+from app.routers.db import execute_batch
+
+
+def batch(*commands: dict, **options) -> dict:
+    return execute_batch(Batch.model_validate({'commands': list(commands), **options}))
+
+
+def ks(db) -> list:
+    t = db.begin_transaction('read_committed')
+    try:
+        return sorted(row['doc']['k'] for row in db.find(t, None))
+    finally:
+        db.rollback(t)
+
+
+def test_commands_run_in_order(database):
+    result = batch(
+        {'op': 'begin'},
+        {'op': 'insert_many', 'docs': [{'name': 'a', 'doc': {'k': 1}}, {'name': 'b', 'doc': {'k': 2}}]},
+        {'op': 'update', 'filter': {'query': {'k': 2}}, 'set': {'k': 3}},
+        {'op': 'find', 'filter': {'query': {}}, 'sort': {'k': -1}, 'projection': ['k']},
+        {'op': 'commit'},
+    )
+    assert result['error'] is None and result['transaction_id'] is None
+    assert [r['op'] for r in result['results']] == ['begin', 'insert_many', 'update', 'find', 'commit']
+    assert result['results'][2]['result'] == 1
+    assert [row['doc'] for row in result['results'][3]['result']] == [{'k': 3}, {'k': 1}]
+    assert ks(database) == [1, 3]
+
+
+def test_failing_command_rolls_back_an_implicit_transaction(database):
+    result = batch(
+        {'op': 'insert', 'name': 'a', 'doc': {'k': 1}},
+        {'op': 'find', 'filter': {'query': {'k': {'$bad': 1}}}},
+        {'op': 'insert', 'name': 'b', 'doc': {'k': 2}},
+        implicit=True,
+    )
+    assert len(result['results']) == 1 and result['error'] and result['rolled_back']
+    assert ks(database) == [] and not database.transactions
+
+
+def test_transaction_passed_in_is_left_open(database):
+    t = database.begin_transaction('read_committed')
+    result = batch({'op': 'insert', 'name': 'a', 'doc': {'k': 1}}, {'op': 'begin'}, transaction_id=t)
+    # a failure doesn't end the caller's transaction, its writes stay pending
+    assert result['error'] and not result['rolled_back'] and result['transaction_id'] == t
+    assert ks(database) == []
+    database.commit(t)
+    assert ks(database) == [1]
@@ -0,0 +1,35 @@
+from app.db.test_commit import docs, seed
+
+
+def test_operations_take_each_record_once(database):
+    seed(database, *range(10))
+    t = database.begin_transaction('read_committed')
+    changed = database.bulk_write(t, [
+        ({'k': {'$lt': 3}}, None, {'k': 100}),
+        # 0 to 2 belong to the first operation
+        ({'k': {'$lt': 5}}, None, None),
+        ({'k': {'$gte': 5}}, 2, {'k': -1}),
+    ])
+    database.commit(t)
+    assert changed == 7
+    assert sorted(doc['k'] for doc in docs(database)) == [-1, -1, 7, 8, 9, 100, 100, 100]
+
+
+def test_changed_counts_only_records_written(database, monkeypatch):
+    seed(database, *range(4))
+    t = database.begin_transaction('read_committed')
+    transaction = database.transactions[t]
+    delete_record_id = transaction.delete_record_id
+    skipped = []
+
+    def expired_meanwhile(_id: int) -> bool:
+        if not skipped:
+            skipped.append(_id)
+            return False
+        return delete_record_id(_id)
+
+    monkeypatch.setattr(transaction, 'delete_record_id', expired_meanwhile)
+    assert database.update(t, {}, None, {'k': 10}) == 3
+    database.commit(t)
+    # the first record, k 0, was left alone
+    assert [doc['k'] for doc in docs(database)] == [0, 10, 10, 10]
@@ -0,0 +1,86 @@
+import pytest
+
+
+def find(db, query, transaction_type='read_committed') -> list:
+    t = db.begin_transaction(transaction_type)
+    try:
+        return sorted(row['doc']['k'] for row in db.find(t, query))
+    finally:
+        db.rollback(t)
+
+
+def write(db, op, *args) -> None:
+    t = db.begin_transaction('read_committed')
+    getattr(db, op)(t, *args)
+    db.commit(t)
+
+
+@pytest.fixture
+def cached(database):
+    database.cache.max_bytes = 1 << 20
+    t = database.begin_transaction('read_committed')
+    database.insert_many(t, [(f'n{i}', {'k': i, 'g': i % 2}) for i in range(10)])
+    database.commit(t)
+    return database
+
+
+def stats(db) -> tuple[int, int]:
+    return db.cache.stats['hits'], db.cache.stats['misses']
+
+
+def test_repeated_find_is_served_from_the_cache(cached):
+    assert find(cached, {'g': 1}) == [1, 3, 5, 7, 9]
+    assert find(cached, {'g': 1}) == [1, 3, 5, 7, 9]
+    assert stats(cached) == (1, 1)
+
+
+@pytest.mark.parametrize('op, args, expected', [
+    ('update', ({'k': 3}, None, {'k': 3, 'g': 0}), [1, 5, 7, 9]),
+    ('delete', ({'k': 5}, None), [1, 3, 7, 9]),
+    ('insert', ('new', {'k': 11, 'g': 1}), [1, 3, 5, 7, 9, 11]),
+])
+def test_commit_drops_the_entries_it_changes(cached, op, args, expected):
+    find(cached, {'g': 1})
+    write(cached, op, *args)
+    assert find(cached, {'g': 1}) == expected
+    assert stats(cached) == (0, 2)
+
+
+def test_insert_not_matching_keeps_the_entry(cached):
+    find(cached, {'g': 1})
+    write(cached, 'insert', 'new', {'k': 12, 'g': 0})
+    assert find(cached, {'g': 1}) == [1, 3, 5, 7, 9]
+    assert stats(cached) == (1, 1)
+
+
+def test_snapshot_behind_the_latest_commit_bypasses_the_cache(cached):
+    find(cached, {'g': 1})
+    t = cached.begin_transaction('repeatable_read')
+    write(cached, 'insert', 'new', {'k': 12, 'g': 0})
+    find(cached, {'g': 1})
+    # the entry is for the current version, the snapshot is older
+    assert sorted(row['doc']['k'] for row in cached.find(t, {'g': 1})) == [1, 3, 5, 7, 9]
+    cached.rollback(t)
+    assert cached.cache.stats['bypassed'] == 1
+    assert stats(cached) == (1, 1)
+
+
+def test_own_writes_bypass_the_cache(cached):
+    find(cached, {'g': 1})
+    t = cached.begin_transaction('read_committed')
+    cached.insert(t, 'mine', {'k': 13, 'g': 1})
+    assert sorted(row['doc']['k'] for row in cached.find(t, {'g': 1})) == [1, 3, 5, 7, 9, 13]
+    cached.rollback(t)
+    assert cached.cache.stats['bypassed'] == 1
+
+
+def test_least_recently_used_entry_is_evicted(cached):
+    find(cached, {'k': 1})
+    size = cached.cache.bytes
+    cached.cache.max_bytes = size * 2
+    find(cached, {'k': 2})
+    find(cached, {'k': 1})
+    find(cached, {'k': 3})
+    assert cached.cache.stats['evictions'] == 1
+    keys = [key[0] for key in cached.cache.entries]
+    assert keys == ['{"k": 1}', '{"k": 3}']
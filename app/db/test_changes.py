@@ -0,0 +1,140 @@
+import http.client
+import json
+
+import pytest
+from websockets.sync.client import connect
+
+from app.db.changes import ChangeLog
+from app.db.exeptions import ChangeStreamException
+from app.db.query import compile_query
+from bench.concurrency import PREFIX, Client
+
+
+def write(db, *docs: dict) -> list[int]:
+    t = db.begin_transaction('read_committed')
+    ids = db.insert_many(t, [(f'n{doc["k"]}', doc) for doc in docs])
+    db.commit(t)
+    return ids
+
+
+def test_changes_come_in_commit_order(database):
+    ids = write(database, {'k': 1}, {'k': 2})
+    t = database.begin_transaction('read_committed')
+    database.update(t, {'k': 1}, None, {'k': 10})
+    database.delete(t, {'k': 2}, None)
+    database.commit(t)
+
+    events, position = database.changes.read(0)
+    assert [(event['op'], event['_id']) for event in events] == \
+        [('insert', ids[0]), ('insert', ids[1]), ('update', ids[0]), ('delete', ids[1])]
+    assert [event['position'] for event in events] == [1, 2, 3, 4] and position == 4
+    assert events[0]['version'] == events[1]['version'] < events[2]['version'] == events[3]['version']
+    assert events[2]['doc'] == {'k': 10}
+    # a delete carries the doc it deleted
+    assert events[3]['doc'] == {'k': 2}
+
+
+def test_rolled_back_writes_are_not_emitted(database):
+    write(database, {'k': 1})
+    t = database.begin_transaction('read_committed')
+    database.insert(t, 'gone', {'k': 2})
+    database.update(t, {'k': 1}, None, {'k': 3})
+    database.rollback(t)
+    # neither is a commit that wrote nothing
+    t = database.begin_transaction('read_committed')
+    database.commit(t)
+
+    events, position = database.changes.read(0)
+    assert [event['doc'] for event in events] == [{'k': 1}] and position == 1
+
+
+def test_resume_and_filter():
+    log = ChangeLog(4)
+    for ts in range(1, 7):
+        log.publish(ts, [], [('insert', ts, f'n{ts}', {'k': ts % 2})])
+
+    events, position = log.read(3)
+    assert [event['_id'] for event in events] == [4, 5, 6] and position == 6
+    events, position = log.read(2, limit=2)
+    assert [event['_id'] for event in events] == [3, 4] and position == 4
+    # filtered out changes still move the position on
+    events, position = log.read(2, compile_query({'k': 1}))
+    assert [event['_id'] for event in events] == [3, 5] and position == 6
+    assert log.read(None) == ([], 6)
+    with pytest.raises(ChangeStreamException):
+        log.read(1)
+    with pytest.raises(ChangeStreamException):
+        log.read(7)
+
+
+def commit(port: int, *docs: dict) -> None:
+    client = Client(port)
+    t = client.begin()
+    for doc in docs:
+        client.post(f'/insert_one/{t}', {'name': 'n', 'doc': doc})
+    client.post(f'/commit/{t}')
+
+
+def position(port: int) -> int:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', f'{PREFIX}/admin/changes')
+    return json.loads(conn.getresponse().read())['position']
+
+
+def sse(port: int, query: str, headers: dict | None = None, count: int = 1) -> list[tuple[int, dict]]:
+    """The first `count` change events of the stream at `query`."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', f'{PREFIX}/changes?{query}', headers=headers or {})
+    response = conn.getresponse()
+    assert response.status == 200
+    events, event = [], {}
+    while len(events) < count:
+        line = response.readline().decode().rstrip('\n')
+        if line.startswith(('id: ', 'event: ', 'data: ')):
+            key, value = line.split(': ', 1)
+            event[key] = value
+        elif not line:
+            if event.get('event') == 'change':
+                events.append((int(event['id']), json.loads(event['data'])))
+            event = {}
+    conn.close()
+    return events
+
+
+def test_sse_filters_and_resumes(server):
+    after = position(server)
+    commit(server, {'g': 1, 'k': 1}, {'g': 2, 'k': 2}, {'g': 1, 'k': 3})
+
+    events = sse(server, f'field=g&predicate=$eq&value=1&after={after}', count=2)
+    assert [change['doc']['k'] for _, change in events] == [1, 3]
+    assert [event_id for event_id, _ in events] == [change['position'] for _, change in events]
+
+    # a reconnecting client resumes after the last id it got, whatever `after` says
+    events = sse(server, 'after=0', {'Last-Event-ID': str(after + 1)}, count=2)
+    assert [change['doc']['k'] for _, change in events] == [2, 3]
+
+
+def test_sse_rejects_a_position_past_the_log(server):
+    conn = http.client.HTTPConnection('127.0.0.1', server, timeout=10)
+    conn.request('GET', f'{PREFIX}/changes?after={position(server) + 100}')
+    assert conn.getresponse().status == 400
+
+
+def test_websocket_streams_matching_changes(server):
+    with connect(f'ws://127.0.0.1:{server}{PREFIX}/changes/ws') as websocket:
+        websocket.send(json.dumps({'query': {'k': {'$gte': 10}}}))
+        # the first message is empty, the subscription is live from then on
+        assert json.loads(websocket.recv(10))['changes'] == []
+        commit(server, {'k': 5}, {'k': 10})
+        commit(server, {'k': 11})
+        changes = []
+        while len(changes) < 2:
+            changes.extend(json.loads(websocket.recv(10))['changes'])
+    assert [change['doc']['k'] for change in changes] == [10, 11]
+    assert changes[0]['position'] < changes[1]['position']
+
+
+def test_websocket_reports_a_bad_subscription(server):
+    with connect(f'ws://127.0.0.1:{server}{PREFIX}/changes/ws') as websocket:
+        websocket.send(json.dumps({'after': position(server) + 100}))
+        assert 'error' in json.loads(websocket.recv(10))
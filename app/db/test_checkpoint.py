@@ -0,0 +1,62 @@
+import os
+
+from app.db.conftest import crash
+from app.settings import settings
+
+
+def state(db) -> list[tuple]:
+    t = db.begin_transaction('read_committed')
+    docs = sorted((row['_id'], row['name'], row['doc']['k']) for row in db.find(t, None))
+    db.rollback(t)
+    return docs
+
+
+def write(db, op, *args) -> None:
+    t = db.begin_transaction('read_committed')
+    getattr(db, op)(t, *args)
+    db.commit(t)
+
+
+def test_checkpoints_and_replay_restore_the_state(database):
+    write(database, 'insert_many', [(f'n{i}', {'k': i}) for i in range(20)])
+    assert database.checkpoint()['last_kind'] == 'full'
+    write(database, 'update', {'k': {'$lt': 5}}, None, {'k': 100})
+    write(database, 'delete', {'k': 7}, None)
+    assert database.checkpoint()['last_kind'] == 'delta'
+    # only in the WAL
+    write(database, 'delete', {'k': 100}, 2)
+    write(database, 'insert', 'after', {'k': 50})
+    # not committed, neither saved nor replayed
+    t = database.begin_transaction('read_committed')
+    database.insert(t, 'open', {'k': -1})
+    database.update(t, {'k': 8}, None, {'k': -8})
+    expected = state(database)
+    manifest = database.checkpointer.manifest
+
+    database = crash(database)
+    assert state(database) == expected
+    assert (database.checkpointer.manifest['full'], database.checkpointer.manifest['deltas']) == \
+        (manifest['full'], manifest['deltas']) and len(manifest['deltas']) == 1
+    assert database.collection.live == len(expected) == 18
+
+
+def test_checkpoint_leaves_running_transactions_alone(database):
+    write(database, 'insert_many', [(f'n{i}', {'k': i}) for i in range(5)])
+    t = database.begin_transaction('repeatable_read')
+    database.update(t, {'k': 0}, None, {'k': 10})
+    before = [record.to_dict() for record in database.collection.records]
+    database.checkpoint(full=True)
+    # versions keep their transaction ids, the pending write commits as usual
+    assert [record.to_dict() for record in database.collection.records] == before
+    database.commit(t)
+    assert sorted(k for _, _, k in state(database)) == [1, 2, 3, 4, 10]
+
+
+def test_full_checkpoint_drops_the_old_chain(database):
+    for i in range(settings.CHECKPOINT_RETAIN + 2):
+        write(database, 'insert', f'n{i}', {'k': i})
+        database.checkpoint(full=True)
+    names = os.listdir(settings.CHECKPOINT_DIR)
+    assert len([name for name in names if name.endswith('.seg')]) == settings.CHECKPOINT_RETAIN
+    # the WAL before the last checkpoint is gone too
+    assert all(lsn > database.checkpointer.manifest['lsn'] for lsn, _ in database.wal.replay())
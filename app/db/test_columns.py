@@ -0,0 +1,56 @@
+GROUP = [{'$group': {'_id': '$g', 'n': {'$count': {}}, 'total': {'$sum': '$k'}}}, {'$sort': {'_id': 1}}]
+
+
+def aggregate(db, pipeline=GROUP, transaction_type='read_committed') -> list[dict]:
+    t = db.begin_transaction(transaction_type)
+    try:
+        return db.aggregate(t, pipeline)
+    finally:
+        db.rollback(t)
+
+
+def write(db, op, *args) -> None:
+    t = db.begin_transaction('read_committed')
+    getattr(db, op)(t, *args)
+    db.commit(t)
+
+
+def test_commits_keep_the_columns_up_to_date(database):
+    write(database, 'insert_many', [(f'n{i}', {'k': i, 'g': i % 2}) for i in range(10)])
+    assert aggregate(database) == [{'_id': 0, 'n': 5, 'total': 20}, {'_id': 1, 'n': 5, 'total': 25}]
+    assert database.columns.stats['builds'] == 1
+
+    write(database, 'update', {'k': 3}, None, {'k': 30, 'g': 0})
+    write(database, 'delete', {'k': 4}, None)
+    write(database, 'insert', 'new', {'k': 7, 'g': 2})
+    expected = [{'_id': 0, 'n': 5, 'total': 46}, {'_id': 1, 'n': 4, 'total': 22}, {'_id': 2, 'n': 1, 'total': 7}]
+    assert aggregate(database) == expected
+    # updated in place, not built again
+    stats = database.columns.describe()
+    assert (stats['builds'], stats['appended'], stats['expired'], stats['dead']) == (1, 2, 2, 2)
+    # the same as over the records, a snapshot doesn't use the cache
+    assert aggregate(database, transaction_type='repeatable_read') == expected
+
+
+def test_rolled_back_writes_leave_the_columns_alone(database):
+    write(database, 'insert_many', [(f'n{i}', {'k': i, 'g': 0}) for i in range(4)])
+    aggregate(database)
+    t = database.begin_transaction('read_committed')
+    database.update(t, {}, None, {'k': 100, 'g': 0})
+    database.rollback(t)
+    assert aggregate(database) == [{'_id': 0, 'n': 4, 'total': 6}]
+    assert database.columns.describe()['dead'] == 0
+
+
+def test_rebuilt_once_dead_slots_dominate(database):
+    write(database, 'insert_many', [(f'n{i}', {'k': i, 'g': 0}) for i in range(3000)])
+    aggregate(database)
+    write(database, 'delete', {'k': {'$lt': 1500}}, None)
+    # as many dead slots as live ones is still kept
+    assert database.columns.describe()['built']
+    write(database, 'delete', {'k': {'$lt': 1510}}, None)
+    assert not database.columns.describe()['built']
+
+    assert aggregate(database) == [{'_id': 0, 'n': 1490, 'total': sum(range(1510, 3000))}]
+    stats = database.columns.describe()
+    assert (stats['builds'], stats['slots'], stats['dead']) == (2, 1490, 0)
@@ -0,0 +1,50 @@
+import pytest
+
+
+def docs(db, query=None) -> list[dict]:
+    t = db.begin_transaction('read_committed')
+    try:
+        return sorted((row['doc'] for row in db.find(t, query)), key=lambda doc: doc['k'])
+    finally:
+        db.rollback(t)
+
+
+def seed(db, *values: int) -> None:
+    t = db.begin_transaction('read_committed')
+    db.insert_many(t, [(f'n{value}', {'k': value}) for value in values])
+    db.commit(t)
+
+
+def test_failed_wal_append_rolls_back(database, monkeypatch):
+    seed(database, 1)
+    t = database.begin_transaction('repeatable_read')
+    database.update(t, {'k': 1}, None, {'k': 2})
+
+    def full(entry):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(database.wal, 'append', full)
+    with pytest.raises(OSError):
+        database.commit(t)
+    monkeypatch.undo()
+
+    collection = database.collection
+    assert t not in database.transactions
+    assert not collection.active_ids
+    assert not collection.snapshots
+    assert collection.locks.held(t) == 0
+    assert docs(database) == [{'k': 1}]
+
+    writer = database.begin_transaction('repeatable_read')
+    assert database.update(writer, {'k': 1}, None, {'k': 3}) == 1
+    database.commit(writer)
+    assert docs(database) == [{'k': 3}]
+
+
+def test_unknown_transaction(database):
+    with pytest.raises(KeyError):
+        database.insert(12345, 'x', {'k': 1})
+    with pytest.raises(KeyError):
+        database.commit(12345)
+    with pytest.raises(KeyError):
+        database.rollback(12345)
@@ -0,0 +1,33 @@
+import pytest
+
+
+@pytest.fixture
+def seeded(database):
+    t = database.begin_transaction('read_committed')
+    database.insert_many(t, [(f'n{i}', {'k': i}) for i in range(10)])
+    database.commit(t)
+    return database
+
+
+def test_pages_come_in_id_order(seeded):
+    t = seeded.begin_transaction('repeatable_read')
+    cursor_id = seeded.open_cursor(t, {'k': {'$gte': 2}}, limit=7, batch_size=3)
+    pages = []
+    while not pages or not pages[-1]['done']:
+        pages.append(seeded.next_batch(cursor_id))
+    assert [[row['doc']['k'] for row in page['batch']] for page in pages] == [[2, 3, 4], [5, 6, 7], [8]]
+    seeded.rollback(t)
+
+
+@pytest.mark.parametrize('end', ['commit', 'rollback'])
+def test_cursor_expires_with_its_transaction(seeded, end):
+    t = seeded.begin_transaction('repeatable_read')
+    cursor_id = seeded.open_cursor(t, None, batch_size=4)
+    assert len(seeded.next_batch(cursor_id)['batch']) == 4
+    getattr(seeded, end)(t)
+
+    assert cursor_id not in seeded.cursors
+    with pytest.raises(KeyError):
+        seeded.next_batch(cursor_id)
+    with pytest.raises(KeyError):
+        seeded.open_cursor(t, None)
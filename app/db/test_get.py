@@ -0,0 +1,33 @@
+import http.client
+import json
+import time
+
+from bench.concurrency import PREFIX, Client
+
+
+def get(port: int, transaction_id: int, _id: int) -> tuple[int, dict]:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', f'{PREFIX}/get/{transaction_id}/{_id}')
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_get_maps_errors_to_statuses(server):
+    client = Client(server)
+    t = client.begin()
+    _id, = client.post(f'/insert_many/{t}', [{'name': 'a', 'doc': {'k': 1}}])['ids']
+
+    status, record = get(server, t, _id)
+    assert status == 200 and record['doc'] == {'k': 1}
+    assert get(server, t, _id + 1) == (404, {'detail': f'Record: {_id + 1} not found'})
+    client.post(f'/commit/{t}')
+    assert get(server, t, _id)[0] == 404
+
+    # past its deadline and not reaped yet, the reaper makes it a 404 once it runs
+    for _ in range(5):
+        t = client.post('/begin/read_committed?timeout_s=0.05')['transaction_id']
+        time.sleep(0.1)
+        status, body = get(server, t, _id)
+        if status != 404:
+            break
+    assert status == 408 and 'timed out' in body['detail']
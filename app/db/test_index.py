@@ -0,0 +1,67 @@
+import pytest
+
+from app.db.conftest import crash
+from app.db.index import IndexType
+
+DOCS = [
+    {'v': 1}, {'v': 1.0}, {'v': 2}, {'v': 2.5}, {'v': -3}, {'v': True}, {'v': False}, {'v': None},
+    {'v': 'a'}, {'v': 'b'}, {'v': ''}, {'v': [1]}, {'v': [1, 2]}, {'v': []}, {'v': {'x': 1}}, {'v': {}},
+    {'w': 1}, {}, {'v': {'nested': 'a'}, 'w': 'b'},
+]
+
+QUERIES = [
+    {'v': 1}, {'v': 'a'}, {'v': None}, {'v': True}, {'v': [1]}, {'v': {'x': 1}},
+    {'v': {'$eq': 2}}, {'v': {'$ne': 1}}, {'v': {'$ne': 'a'}}, {'v': {'$ne': [1]}}, {'v': {'$ne': {'x': 1}}},
+    {'v': {'$ne': None}}, {'v': {'$in': [1, 'b', [1, 2], {}]}}, {'v': {'$in': []}},
+    {'v': {'$gt': 1}}, {'v': {'$gte': 1}}, {'v': {'$lt': 2.5}}, {'v': {'$lte': -3}}, {'v': {'$gt': 'a'}},
+    {'v': {'$gte': 1, '$lt': 2.5}}, {'v': {'$gt': 0}, 'w': 'b'},
+]
+
+
+def rows(db, query) -> list[tuple]:
+    t = db.begin_transaction('repeatable_read')
+    try:
+        return sorted((row['_id'], repr(row['doc'])) for row in db.find(t, query))
+    finally:
+        db.rollback(t)
+
+
+@pytest.mark.parametrize('index_type', [IndexType.hash, IndexType.ordered])
+def test_index_matches_scan(database, index_type):
+    t = database.begin_transaction('repeatable_read')
+    database.insert_many(t, [(f'n{i}', doc) for i, doc in enumerate(DOCS)])
+    database.commit(t)
+    # versions expired and written again are candidates the visibility check drops
+    t = database.begin_transaction('repeatable_read')
+    database.update(t, {'v': 2}, None, {'v': 3})
+    database.delete(t, {'v': 'b'}, None)
+    database.commit(t)
+
+    scans = [rows(database, query) for query in QUERIES]
+    index = database.create_index('v', 'v', index_type)
+    assert index['keys']
+    t = database.begin_transaction('repeatable_read')
+    for query, scan in zip(QUERIES, scans):
+        uses_index = database.explain(t, query)['plan']['type'] == 'index'
+        assert rows(database, query) == scan, (query, uses_index)
+    database.rollback(t)
+
+
+def test_indexes_survive_a_restart(database):
+    t = database.begin_transaction('read_committed')
+    database.insert_many(t, [(f'n{i}', {'k': i, 'g': i % 3}) for i in range(20)])
+    database.commit(t)
+    database.create_index('k', 'k', IndexType.ordered)
+    database.create_index('gone', 'g', IndexType.hash)
+    database.checkpoint(full=True)
+    # changes after the checkpoint are replayed from the WAL
+    database.drop_index('gone')
+    database.create_index('g', 'g', IndexType.hash)
+
+    database = crash(database)
+    assert sorted((index['name'], index['field'], index['type'], index['keys']) for index in database.indexes()) == \
+        [('g', 'g', IndexType.hash, 3), ('k', 'k', IndexType.ordered, 20)]
+    t = database.begin_transaction('read_committed')
+    assert database.explain(t, {'k': {'$gte': 15}})['plan']['type'] == 'index'
+    assert sorted(row['doc']['k'] for row in database.find(t, {'g': 1})) == [1, 4, 7, 10, 13, 16, 19]
+    database.rollback(t)
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from app.db.exeptions import DeadlockException, LockTimeoutException
+from app.db.lock_manager import LockManager, LockMode
+
+
+def waiting(locks: LockManager, t_id: int) -> None:
+    """Block until `t_id` is queued for a lock."""
+    deadline = time.monotonic() + 5
+    while t_id not in locks.waiting:
+        assert time.monotonic() < deadline, f'{t_id} never waited'
+        time.sleep(0.001)
+
+
+def acquire_in_thread(locks: LockManager, *args) -> tuple[threading.Thread, list]:
+    outcome = []
+
+    def target() -> None:
+        try:
+            locks.acquire(*args)
+            outcome.append('granted')
+        except Exception as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, outcome
+
+
+def test_the_request_closing_a_cycle_is_the_victim():
+    locks = LockManager(timeout_s=5)
+    locks.acquire(1, 10)
+    locks.acquire(2, 20)
+    thread, outcome = acquire_in_thread(locks, 1, 20)
+    waiting(locks, 1)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlockException):
+        locks.acquire(2, 10)
+    # found before waiting, not by timing out
+    assert time.monotonic() - started < 1
+    assert locks.stats['deadlocks'] == 1 and locks.holds(2, 10) is None
+
+    # the victim ending lets the other one through
+    locks.release_all(2)
+    thread.join(5)
+    assert outcome == ['granted'] and locks.holds(1, 20) is LockMode.exclusive
+
+
+def test_a_longer_cycle_is_found():
+    locks = LockManager(timeout_s=5)
+    for t_id, key in [(1, 10), (2, 20), (3, 30)]:
+        locks.acquire(t_id, key)
+    threads = [acquire_in_thread(locks, 1, 20), acquire_in_thread(locks, 2, 30)]
+    waiting(locks, 1)
+    waiting(locks, 2)
+    with pytest.raises(DeadlockException):
+        locks.acquire(3, 10)
+    locks.release_all(3)
+    locks.release_all(2)
+    locks.release_all(1)
+    for thread, outcome in threads:
+        thread.join(5)
+        assert outcome == ['granted']
+
+
+def test_wait_times_out():
+    locks = LockManager(timeout_s=5)
+    locks.acquire(1, 10, LockMode.shared)
+    # shared locks don't conflict
+    locks.acquire(2, 10, LockMode.shared)
+    started = time.monotonic()
+    with pytest.raises(LockTimeoutException):
+        locks.acquire(3, 10, timeout_s=0.05)
+    assert 0.05 <= time.monotonic() - started < 1
+    stats = locks.describe()
+    assert (stats['timeouts'], stats['deadlocks'], stats['waiting']) == (1, 0, 0)
+    assert locks.holds(3, 10) is None
+
+
+def test_waiters_are_granted_in_order():
+    locks = LockManager(timeout_s=5)
+    locks.acquire(1, 10)
+    first, granted_first = acquire_in_thread(locks, 2, 10, LockMode.shared)
+    waiting(locks, 2)
+    second, granted_second = acquire_in_thread(locks, 3, 10)
+    waiting(locks, 3)
+    # a shared request doesn't overtake the exclusive one queued before it
+    with pytest.raises(LockTimeoutException):
+        locks.acquire(4, 10, LockMode.shared, timeout_s=0.05)
+
+    locks.release_all(1)
+    first.join(5)
+    assert granted_first == ['granted'] and granted_second == []
+    locks.release_all(2)
+    second.join(5)
+    assert granted_second == ['granted']
@@ -0,0 +1,38 @@
+import http.client
+
+from bench.concurrency import Client
+
+
+def scrape(port: int) -> list[str]:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', '/metrics')
+    response = conn.getresponse()
+    assert response.status == 200 and response.getheader('Content-Type').startswith('text/plain')
+    return response.read().decode().splitlines()
+
+
+def sample(lines: list[str], prefix: str) -> float:
+    values = [float(line.rsplit(' ', 1)[1]) for line in lines if line.startswith(prefix + ' ')]
+    assert len(values) == 1, prefix
+    return values[0]
+
+
+def test_metrics_endpoint(server):
+    client = Client(server)
+    for _ in range(3):
+        t = client.begin()
+        client.post(f'/insert_one/{t}', {'name': 'n', 'doc': {'k': 1}})
+        client.post(f'/commit/{t}')
+    t = client.begin()
+    client.post(f'/cursor/open/{t}', {})
+    lines = scrape(server)
+
+    # requests are labelled by route, not by path
+    route = ('database_http_request_seconds_count'
+             '{method="POST",route="/api/v1/db/insert_one/{transaction_id}",status="200"}')
+    assert sample(lines, route) == 3
+    assert sample(lines, 'database_op_seconds_count{op="commit"}') >= 3
+    assert sample(lines, 'database_versions{state="live"}') >= 3
+    assert sample(lines, 'database_active_transactions') >= 1
+    assert sample(lines, 'database_open_cursors') == 1
+    assert '# TYPE database_versions gauge' in lines
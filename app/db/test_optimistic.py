@@ -0,0 +1,53 @@
+import pytest
+
+from app.db.exeptions import RollbackException
+from app.db.test_commit import docs, seed
+
+
+def test_failed_validation_rolls_back(database):
+    seed(database, 1, 2)
+    t = database.begin_transaction('optimistic')
+    database.update(t, {'k': 1}, None, {'k': 10})
+    other = database.begin_transaction('repeatable_read')
+    database.update(other, {'k': 2}, None, {'k': 20})
+    database.commit(other)
+    list(database.find(t, {'k': 2}))
+
+    with pytest.raises(RollbackException):
+        database.commit(t)
+    assert t not in database.transactions
+    assert database.collection.locks.held(t) == 0
+    assert docs(database) == [{'k': 1}, {'k': 20}]
+
+
+def test_write_skew_is_refused(database):
+    seed(database, 1, 2)
+    t1 = database.begin_transaction('optimistic')
+    t2 = database.begin_transaction('optimistic')
+    assert len(list(database.find(t1, {'k': 1}))) == 1
+    assert len(list(database.find(t2, {'k': 2}))) == 1
+    database.update(t1, {'k': 2}, None, {'k': 3})
+    database.update(t2, {'k': 1}, None, {'k': 4})
+
+    database.commit(t1)
+    with pytest.raises(RollbackException):
+        database.commit(t2)
+    assert docs(database) == [{'k': 1}, {'k': 3}]
+
+
+def test_disjoint_reads_and_read_only_transactions_commit(database):
+    seed(database, 1, 2)
+    reader = database.begin_transaction('optimistic')
+    t1 = database.begin_transaction('optimistic')
+    t2 = database.begin_transaction('optimistic')
+    list(database.find(reader, None))
+    list(database.find(t1, {'k': 1}))
+    list(database.find(t2, {'k': 2}))
+    database.update(t1, {'k': 1}, None, {'k': 10})
+    database.update(t2, {'k': 2}, None, {'k': 20})
+
+    database.commit(t1)
+    database.commit(t2)
+    # it wrote nothing, so what it read changing since doesn't matter
+    database.commit(reader)
+    assert docs(database) == [{'k': 10}, {'k': 20}]
@@ -0,0 +1,76 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.db.conftest import crash
+from app.db.partition import PartitionedStore
+from app.db.record import Record
+from app.settings import settings
+
+QUERIES = [None, {'g': 1}, {'k': {'$gte': 150}}, {'$or': [{'g': 0}, {'k': {'$lt': 10}}]}]
+
+
+def rows(db, query, sort=None) -> list[tuple]:
+    t = db.begin_transaction('repeatable_read')
+    try:
+        return [(row['_id'], row['doc']['k']) for row in db.find(t, query, sort=sort)]
+    finally:
+        db.rollback(t)
+
+
+def results(db) -> list:
+    return [sorted(rows(db, query)) for query in QUERIES] + [rows(db, None, {'k': -1})]
+
+
+@pytest.fixture
+def partitioned(database, monkeypatch):
+    """The data of an unpartitioned database, with its results, opened again in 4 partitions
+    with a checkpoint segment scanned in parallel."""
+    t = database.begin_transaction('read_committed')
+    database.insert_many(t, [(f'n{i}', {'k': i, 'g': i % 3}) for i in range(200)])
+    database.commit(t)
+    database.checkpoint(full=True)
+    # chained versions on top of the segment
+    t = database.begin_transaction('read_committed')
+    database.update(t, {'k': {'$lt': 20}}, None, {'k': 1000, 'g': 1})
+    database.delete(t, {'k': {'$gte': 190}}, None)
+    database.insert(t, 'new', {'k': 500, 'g': 0})
+    database.commit(t)
+    database = crash(database)
+    expected = results(database)
+
+    monkeypatch.setattr(settings, 'PARTITIONS', 4)
+    monkeypatch.setattr(settings, 'PARALLEL_SCAN_MIN_RECORDS', 1)
+    database = crash(database)
+    assert database.scan_pool is not None and database.collection.records.base is not None
+    return database, expected
+
+
+def test_partitioned_find_equals_unpartitioned(partitioned):
+    database, expected = partitioned
+    assert results(database) == expected
+    assert database.scan_pool.executor is not None
+
+
+def broken(*args):
+    future = Future()
+    future.set_exception(BrokenProcessPool('a scan worker died'))
+    return [future]
+
+
+def refused(*args):
+    raise BrokenProcessPool('the pool is broken')
+
+
+@pytest.mark.parametrize('submit', [broken, refused])
+def test_failed_pool_falls_back_to_a_serial_scan(partitioned, monkeypatch, submit):
+    database, expected = partitioned
+    monkeypatch.setattr(database.scan_pool, 'submit', submit)
+    assert results(database) == expected
+
+
+def test_iteration_is_in_id_order():
+    store = PartitionedStore(3, [Record(_id, 'n', {}) for _id in (9, 2, 7, 4, 1, 8)])
+    store.append(Record(2, 'n', {}))
+    assert [record._id for record in store] == [1, 2, 2, 4, 7, 8, 9]
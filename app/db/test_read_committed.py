@@ -0,0 +1,49 @@
+import pytest
+
+from app.db.exeptions import RollbackException
+
+
+def docs(db) -> list[dict]:
+    t = db.begin_transaction('read_committed')
+    try:
+        return [row['doc'] for row in db.find(t, None)]
+    finally:
+        db.rollback(t)
+
+
+@pytest.fixture
+def seeded(database):
+    t = database.begin_transaction('read_committed')
+    database.insert(t, 'doc', {'k': 1})
+    database.commit(t)
+    return database
+
+
+def test_statement_sees_commits_made_before_it(seeded):
+    t = seeded.begin_transaction('read_committed')
+    assert [row['doc'] for row in seeded.find(t, None)] == [{'k': 1}]
+    other = seeded.begin_transaction('read_committed')
+    seeded.update(other, {'k': 1}, None, {'k': 2})
+    assert [row['doc'] for row in seeded.find(t, None)] == [{'k': 1}]
+    seeded.commit(other)
+    assert [row['doc'] for row in seeded.find(t, None)] == [{'k': 2}]
+    seeded.rollback(t)
+
+
+def test_write_keeps_the_read_point_its_targets_were_picked_at(seeded, monkeypatch):
+    t_id = seeded.begin_transaction('read_committed')
+    t = seeded.transactions[t_id]
+    delete_record_id = t.delete_record_id
+
+    def racing(_id):
+        # another transaction commits a change to the target between the scan and the write
+        other = seeded.begin_transaction('read_committed')
+        assert seeded.update(other, {'k': 1}, None, {'k': 2}) == 1
+        seeded.commit(other)
+        return delete_record_id(_id)
+
+    monkeypatch.setattr(t, 'delete_record_id', racing)
+    with pytest.raises(RollbackException):
+        seeded.update(t_id, {'k': 1}, None, {'k': 10})
+    seeded.rollback(t_id)
+    assert docs(seeded) == [{'k': 2}]
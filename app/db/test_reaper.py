@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+
+def reap(db) -> None:
+    """A reaper pass once every transaction has been idle for long enough."""
+    time.sleep(db.reaper.idle_s * 2)
+    db.reaper.run()
+
+
+@pytest.fixture
+def stream(database):
+    t = database.begin_transaction('repeatable_read')
+    database.insert_many(t, [(f'n{i}', {'k': i}) for i in range(10)])
+    database.commit(t)
+    # passes are run by the tests, not the daemon
+    database.reaper.close()
+    database.reaper.idle_s = 0.01
+    t = database.begin_transaction('repeatable_read')
+    rows = database.find(t, None)
+    next(rows)
+    return t, rows
+
+
+def test_reaper_skips_a_transaction_while_its_rows_are_read(database, stream):
+    t, rows = stream
+    reap(database)
+    assert t in database.transactions
+    assert len(list(rows)) == 9
+
+    reap(database)
+    assert t not in database.transactions
+    assert database.collection.locks.held(t) == 0
+
+
+def test_closed_rows_release_the_transaction(database, stream):
+    t, rows = stream
+    rows.close()
+    reap(database)
+    assert t not in database.transactions
+
+
+def test_rows_fail_once_the_transaction_ended(database, stream):
+    t, rows = stream
+    database.commit(t)
+    with pytest.raises(KeyError):
+        next(rows)
+    assert not database.collection.active_ids
@@ -0,0 +1,89 @@
+import os
+import pickle
+import shutil
+
+import pytest
+
+from app.db.conftest import crash, open_database, stop
+from app.db.db import Database
+from app.db.record import Record
+from app.db.segment import Segment, SegmentError
+from app.settings import settings
+
+
+def test_segment_round_trip(tmp_path):
+    path = str(tmp_path / 'a.seg')
+    records = [Record(_id, f'n{_id}', {'k': _id, 'nested': [_id, None]}) for _id in (2, 3, 5, 8)]
+    size = Segment.write(path, records, lsn=7, next_doc=9)
+    assert size == os.path.getsize(path) and Segment.is_segment(path)
+
+    segment = Segment(path)
+    assert (segment.lsn, segment.next_doc, len(segment), segment.max_id()) == (7, 9, 4, 8)
+    assert list(segment.ids()) == [2, 3, 5, 8]
+    assert segment.get(5).to_dict() == records[2].to_dict()
+    assert segment.get(4) is None and 4 not in segment and 8 in segment
+    segment.close()
+
+
+def test_other_files_are_not_segments(tmp_path):
+    path = tmp_path / 'a.full'
+    path.write_bytes(pickle.dumps([]))
+    assert not Segment.is_segment(str(path))
+    with pytest.raises(SegmentError):
+        Segment(str(path))
+
+
+def state(db) -> list[tuple]:
+    t = db.begin_transaction('read_committed')
+    docs = sorted((row['_id'], row['name'], row['doc']) for row in db.find(t, None))
+    db.rollback(t)
+    return docs
+
+
+def reopen(db, files: dict):
+    """Open an empty data directory holding only `files`, each pickled."""
+    stop(db)
+    db.wal.close()
+    shutil.rmtree(settings.DATA_DIR)
+    for path, data in files.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump(data, f)
+    return open_database()
+
+
+def record(_id: int, k, **ids) -> dict:
+    return dict({'_id': _id, 'name': f'n{_id}', 'doc': {'k': k}, 'created_id': 0, 'expired_id': 0}, **ids)
+
+
+def migrated(db, expected: list[tuple]) -> None:
+    """`db` was migrated to a segment holding `expected`, and is read back from it."""
+    assert state(db) == expected
+    full = db.checkpointer.manifest['full']
+    assert full.endswith('.seg')
+    db = crash(db)
+    assert db.checkpointer.manifest['full'] == full and not db.checkpointer.migrate
+    assert state(db) == expected
+    t = db.begin_transaction('read_committed')
+    db.insert(t, 'new', {'k': 'new'})
+    db.commit(t)
+    assert max(_id for _id, _, _ in state(db)) > max(_id for _id, _, _ in expected)
+
+
+def test_legacy_dump_is_migrated(database):
+    # transaction ids of the process that dumped it mean nothing now
+    records = [record(1, 'a', created_id=5), record(4, 'b'), record(2, 'c', created_id=9)]
+    database = reopen(database, {Database.FILENAME: records})
+    migrated(database, [(1, 'n1', {'k': 'a'}), (2, 'n2', {'k': 'c'}), (4, 'n4', {'k': 'b'})])
+
+
+def test_pickled_full_checkpoint_is_migrated(database):
+    full = os.path.join(settings.CHECKPOINT_DIR, f'{3:020d}.full')
+    delta = os.path.join(settings.CHECKPOINT_DIR, f'{5:020d}.delta')
+    manifest = {'lsn': 5, 'full': os.path.basename(full), 'deltas': [os.path.basename(delta)], 'indexes': []}
+    database = reopen(database, {
+        full: [record(1, 'a'), record(2, 'b'), record(3, 'c')],
+        delta: {2: None, 3: record(3, 'c2'), 6: record(6, 'd')},
+        os.path.join(settings.CHECKPOINT_DIR, 'MANIFEST'): manifest,
+    })
+    migrated(database, [(1, 'n1', {'k': 'a'}), (3, 'n3', {'k': 'c2'}), (6, 'n6', {'k': 'd'})])
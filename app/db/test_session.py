@@ -0,0 +1,65 @@
+import json
+import time
+
+from websockets.sync.client import connect
+
+from app.utils import codec
+from bench.concurrency import PREFIX, Client
+
+
+def session(port: int):
+    return connect(f'ws://127.0.0.1:{port}{PREFIX}/session')
+
+
+def replies(websocket, count: int, decode=json.loads) -> dict:
+    """The next `count` replies by request id, they may come in any order."""
+    return {reply['id']: reply for reply in (decode(websocket.recv(10)) for _ in range(count))}
+
+
+def test_pipelined_requests_in_binary_frames(server):
+    requests = [
+        {'id': 1, 'op': 'begin'},
+        {'id': 2, 'op': 'insert', 'name': 'a', 'doc': {'k': 1, 'blob': b'\x00\x01'}},
+        {'id': 3, 'op': 'find', 'filter': {'query': {'k': 1}}},
+        {'id': 4, 'op': 'commit'},
+    ]
+    with session(server) as websocket:
+        # sent without waiting, the requests run in order on the transaction begun first
+        for request in requests:
+            websocket.send(codec.encode(request))
+        got = replies(websocket, len(requests), codec.decode)
+    assert all('error' not in reply for reply in got.values())
+    rows = got[3]['result']
+    assert [row['_id'] for row in rows] == [got[2]['result']]
+    assert rows[0]['doc'] == {'k': 1, 'blob': b'\x00\x01'}
+    assert got[4]['result'] is None
+
+
+def test_errors_are_replied_to_the_request(server):
+    with session(server) as websocket:
+        websocket.send(json.dumps({'id': 'a', 'op': 'find'}))
+        websocket.send(json.dumps({'id': 'b', 'op': 'nope'}))
+        websocket.send('not json')
+        got = replies(websocket, 3)
+    assert got['a']['error'] == 'No open transaction'
+    assert 'error' in got['b'] and 'error' in got[None]
+
+
+def test_closing_the_session_rolls_back_its_transactions(server):
+    with session(server) as websocket:
+        websocket.send(json.dumps({'id': 1, 'op': 'begin'}))
+        websocket.send(json.dumps({'id': 2, 'op': 'insert', 'name': 'a', 'doc': {'k': 'session'}}))
+        t_id = replies(websocket, 2)[1]['result']
+
+    client = Client(server)
+    # rolled back once the server has seen the connection close
+    for _ in range(100):
+        try:
+            client.post(f'/find/{t_id}')
+        except RuntimeError:
+            break
+        time.sleep(0.05)
+    else:
+        raise AssertionError(f'Transaction: {t_id} is still open')
+    t = client.begin()
+    assert client.post(f'/find/{t}', {'filter': {'query': {'k': 'session'}}}) == []
@@ -0,0 +1,61 @@
+import pytest
+
+from app.db.index import IndexType
+
+DOCS = [
+    {'v': 'b'}, {'v': 2}, {'v': True}, {'v': None}, {'v': [1]}, {'v': 1.5}, {}, {'v': 'a'},
+    {'v': False}, {'v': {'x': 1}}, {'v': -1}, {'v': 2}, {'v': '10'},
+]
+# missing, null, numbers, strings, booleans, then lists and documents by their JSON; ties in `_id` order
+ASCENDING = [6, 3, 10, 5, 1, 11, 12, 7, 0, 8, 2, 4, 9]
+
+
+def sorted_ids(db, query, sort, limit=-1) -> list[int]:
+    t = db.begin_transaction('repeatable_read')
+    try:
+        return [row['_id'] for row in db.find(t, query, limit, sort)]
+    finally:
+        db.rollback(t)
+
+
+@pytest.fixture
+def mixed(database):
+    t = database.begin_transaction('read_committed')
+    ids = database.insert_many(t, [(f'n{i}', doc) for i, doc in enumerate(DOCS)])
+    database.commit(t)
+    return database, ids
+
+
+def test_mixed_types_sort_by_kind_then_value(mixed):
+    database, ids = mixed
+    assert sorted_ids(database, None, {'v': 1}) == [ids[i] for i in ASCENDING]
+    # reversed, ties still in `_id` order
+    descending = [ids[i] for i in reversed(ASCENDING)]
+    descending[-6:-4] = descending[-5], descending[-6]
+    assert sorted_ids(database, None, {'v': -1}) == descending
+    assert sorted_ids(database, None, {'v': 1}, 4) == [ids[i] for i in ASCENDING[:4]]
+
+
+@pytest.mark.parametrize('query, sort', [
+    (None, {'v': -1}),
+    ({'v': {'$gte': 0}}, {'v': 1}),
+    ({'v': {'$gt': 'a'}}, {'v': -1}),
+    ({'v': {'$lt': 2}}, {'v': 1}),
+    ({'v': {'$ne': None}}, {'v': 1}),
+])
+@pytest.mark.parametrize('limit', [1, 3, 20])
+def test_index_walk_matches_in_memory_sort(mixed, monkeypatch, query, sort, limit):
+    database, _ = mixed
+    # versions expired and written again sit in the buckets of their old keys
+    t = database.begin_transaction('read_committed')
+    database.update(t, {'v': 2}, None, {'v': 0.5})
+    database.update(t, {'v': 'b'}, None, {'v': 3})
+    database.commit(t)
+    expected = sorted_ids(database, query, sort, limit)
+
+    database.create_index('v', 'v', IndexType.ordered)
+    walks = []
+    walk_index = database.walk_index
+    monkeypatch.setattr(database, 'walk_index', lambda *args: walks.append(1) or walk_index(*args))
+    assert sorted_ids(database, query, sort, limit) == expected
+    assert walks
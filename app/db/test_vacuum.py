@@ -0,0 +1,44 @@
+def ks(db, t) -> list:
+    return sorted(row['doc']['k'] for row in db.find(t, None))
+
+
+def test_versions_a_snapshot_sees_are_kept(database):
+    # reclaimed only by the passes run here
+    database.vacuum.close()
+    t = database.begin_transaction('read_committed')
+    database.insert_many(t, [(f'n{i}', {'k': i}) for i in range(3)])
+    database.commit(t)
+    snapshot = database.begin_transaction('repeatable_read')
+    assert ks(database, snapshot) == [0, 1, 2]
+
+    t = database.begin_transaction('read_committed')
+    database.update(t, {'k': {'$lt': 2}}, None, {'k': 10})
+    database.delete(t, {'k': 2}, None)
+    database.commit(t)
+    assert database.collection.dead == 3
+
+    assert database.vacuum.run()['last_reclaimed'] == 0
+    assert ks(database, snapshot) == [0, 1, 2]
+    assert len(database.collection.records) == 5
+    database.rollback(snapshot)
+
+    stats = database.vacuum.run()
+    assert (stats['last_reclaimed'], stats['pending']) == (3, 0)
+    assert database.collection.dead == 0 and database.collection.live == 2
+    t = database.begin_transaction('repeatable_read')
+    assert ks(database, t) == [10, 10]
+    database.rollback(t)
+
+
+def test_budget_bounds_a_pass(database):
+    database.vacuum.close()
+    t = database.begin_transaction('read_committed')
+    database.insert_many(t, [(f'n{i}', {'k': i}) for i in range(10)])
+    database.commit(t)
+    t = database.begin_transaction('read_committed')
+    database.delete(t, None, None)
+    database.commit(t)
+
+    assert database.vacuum.run(budget=4)['last_reclaimed'] == 4
+    stats = database.vacuum.run()
+    assert (stats['last_reclaimed'], stats['pending'], stats['reclaimed']) == (6, 0, 10)
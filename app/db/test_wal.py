@@ -0,0 +1,73 @@
+import os
+import threading
+
+from app.db.conftest import crash
+from app.db.wal import SyncMode, WriteAheadLog
+
+
+def state(db) -> list[tuple]:
+    t = db.begin_transaction('read_committed')
+    docs = sorted((row['_id'], row['name'], row['doc']['k']) for row in db.find(t, None))
+    db.rollback(t)
+    return docs
+
+
+def test_replay_restores_the_commits(database):
+    t = database.begin_transaction('read_committed')
+    database.insert_many(t, [(f'n{i}', {'k': i}) for i in range(20)])
+    database.commit(t)
+    t = database.begin_transaction('read_committed')
+    database.update(t, {'k': {'$lt': 5}}, None, {'k': 100})
+    database.delete(t, {'k': {'$gte': 15, '$lt': 100}}, None)
+    database.commit(t)
+    # neither a rolled back nor an open transaction is replayed
+    t = database.begin_transaction('read_committed')
+    database.insert(t, 'rolled back', {'k': -1})
+    database.rollback(t)
+    t = database.begin_transaction('read_committed')
+    database.insert(t, 'open', {'k': -2})
+    expected = state(database)
+
+    database = crash(database)
+    assert state(database) == expected
+    assert database.collection.live == 15
+    # new `_id`s don't reuse replayed ones
+    t = database.begin_transaction('read_committed')
+    database.insert(t, 'new', {'k': 0})
+    database.commit(t)
+    assert len({_id for _id, _, _ in state(database)}) == 16
+
+
+def test_concurrent_appends_are_all_durable(tmp_path):
+    wal = WriteAheadLog(str(tmp_path), sync_mode=SyncMode.fsync)
+    wal.open()
+    lsns = []
+
+    def append(n: int) -> None:
+        for i in range(20):
+            lsns.append(wal.append({'transaction_id': n * 100 + i, 'ops': []}))
+
+    threads = [threading.Thread(target=append, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert wal.durable_lsn == wal.last_lsn == 160
+    wal.close()
+
+    assert sorted(lsns) == list(range(1, 161))
+    replayed = [entry['transaction_id'] for _, entry in WriteAheadLog(str(tmp_path)).replay()]
+    assert sorted(replayed) == sorted(n * 100 + i for n in range(8) for i in range(20))
+
+
+def test_torn_frame_ends_the_segment(tmp_path):
+    wal = WriteAheadLog(str(tmp_path))
+    wal.open()
+    for i in range(3):
+        wal.append({'transaction_id': i, 'ops': []})
+    wal.close()
+    path = wal.segments()[-1]
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 1)
+
+    assert [entry['transaction_id'] for _, entry in WriteAheadLog(str(tmp_path)).replay()] == [0, 1]
@@ -1,8 +1,12 @@
 import logging
+import threading
+import time
 from enum import Enum
 
 from app.db.collection import Collection
-from app.db.exeptions import RollbackException
+from app.db.exeptions import ReadOnlyException, RollbackException
+from app.db.lock_manager import LockMode
+from app.db.record import PENDING
 
 logger = logging.getLogger(__name__)
 
@@ -12,69 +16,111 @@ class TransactionType(str, Enum):
     read_committed = 'read_committed'
     repeatable_read = 'repeatable_read'
     serializable = 'serializable'
+    read_only = 'read_only'
+    optimistic = 'optimistic'
 
 
 class Transaction:
+    # reads see only committed data, as of `snapshot` if there is one, and have no side effects
+    cacheable = False
+    # reads see the data committed when the transaction began
+    snapshot_reads = False
+    # each statement reads the data committed when it started, see `ReadCommittedTransaction`
+    statement_reads = False
+    # commit checks the reads against the commits since the snapshot, see `Collection.commit_log`
+    validates = False
+
     def __init__(self, collection: Collection, t_id: int) -> None:
         self.collection = collection
         self.id = t_id
         self.rollback_actions = []
-
-    def add_record(self, name: str, doc: dict) -> None:
-        record = {
-            '_id': self.collection.identity(),
-            'name': name,
-            'doc': doc,
-            'created_id': self.id,
-            'expired_id': 0
-        }
-        self.rollback_actions.append(["delete", len(self.collection.records)])
+        # commit sequence number the reads see, taken under `collection.lock` by `Collection.begin`
+        self.snapshot: int | None = collection.version if self.snapshot_reads else None
+        # the same for the current statement, moved by `Collection.read_latest`
+        self.read_point: int | None = collection.version if self.statement_reads else None
+        self.last_used = time.monotonic()
+        # monotonic time past which the reaper rolls the transaction back
+        self.deadline: float | None = None
+        # operations in progress, see `Database.using`
+        self.busy = 0
+        # held by each operation step; set `finished` under it so that no step runs after the end
+        self.mutex = threading.RLock()
+        self.finished = False
+
+    def add_record(self, name: str, doc: dict, _id: int | None = None) -> None:
+        record = self.collection.record_class(
+            self.collection.identity() if _id is None else _id, name, doc, created_id=self.id, created_ts=PENDING)
+        self.rollback_actions.append(["delete", record])
         self.collection.records.append(record)
-        logger.info(f'Record {record["_id"]} added by {self.id}')
+        self.collection.index_record(record)
+        logger.info('Record %s added by %s', record._id, self.id)
+
+    def add_records(self, items: list[tuple[str, dict]], ids: list[int] | None = None) -> list[int]:
+        """Add many records at once, `_id`s are reserved as one range unless given."""
+        if ids is None:
+            ids = self.collection.identity_range(len(items))
+        record_class = self.collection.record_class
+        records = [record_class(_id, name, doc, created_id=self.id, created_ts=PENDING)
+                   for _id, (name, doc) in zip(ids, items)]
+        self.rollback_actions.extend(["delete", record] for record in records)
+        self.collection.records.extend(records)
+        self.collection.index_records(records)
+        logger.info('%s records added by %s', len(records), self.id)
+        return [record._id for record in records]
+
+    def expire_record(self, record) -> None:
+        self.collection.locks.acquire(self.id, record._id, LockMode.exclusive)
+        if record.expired_id != 0 or self.is_locked(record):
+            warn = f'Failed to delete: record {record._id} locked by another transaction.'
+            logger.warning(warn)
+            raise RollbackException(warn)
+        record.expired_id = self.id
+        self.rollback_actions.append(["add", record])
+        logger.info('Record %s deleted by transaction: %s.', record._id, self.id)
 
     def delete_record_name(self, name: str) -> None:
-        for i, record in enumerate(self.collection.records):
-            if self.is_visible(record) and record['name'] == name:
-                if self.is_locked(record):
-                    warn = f'Failed to delete: record {record["_id"]} locked by another transaction.'
-                    logger.warning(warn)
-                    raise RollbackException(warn)
-                else:
-                    record['expired_id'] = self.id
-                    self.rollback_actions.append(["add", i])
-                    logger.info(f'Record {record["_id"]} deleted by transaction: {self.id}.')
-
-    def delete_record_id(self, _id: int) -> None:
-        for i, record in enumerate(self.collection.records):
-            if self.is_visible(record) and record['_id'] == _id:
-                if self.is_locked(record):
-                    warn = f'Failed to delete: record {record["_id"]} locked by another transaction.'
-                    logger.warning(warn)
-                    raise RollbackException(warn)
-                else:
-                    record['expired_id'] = self.id
-                    self.rollback_actions.append(["add", i])
-                    logger.info(f'Record {record["_id"]} deleted by transaction: {self.id}.')
+        self.reads(None)
+        for record in self.collection.records:
+            if self.is_visible(record) and record.name == name:
+                self.expire_record(record)
+
+    def delete_record_id(self, _id: int) -> bool:
+        for record in list(self.collection.records.chain(_id)):
+            if self.is_visible(record):
+                self.expire_record(record)
+                return True
+        return False
 
     def update_record(self, _id: int, name: str, doc: dict) -> None:
-        logger.info(f'Update record {name}')
-        self.delete_record_id(_id)
-        return self.add_record(name, doc)
+        logger.info('Update record %s', name)
+        if self.delete_record_id(_id):
+            return self.add_record(name, doc, _id=_id)
 
     def fetch_record(self, name: str) :
+        self.reads(None)
         for record in self.collection.records:
-            if self.is_visible(record) and record['name'] is name:
+            if self.is_visible(record) and record.name is name:
+                return record
+
+        return None
+
+    def fetch_by_id(self, _id: int):
+        for record in self.collection.records.chain(_id):
+            if self.is_visible(record):
                 return record
 
         return None
 
     def count_records(self):
+        self.reads(None)
         return sum(self.is_visible(record) for record in self.collection.records)
 
     def fetch_all_records(self):
+        self.reads(None)
         return [record for record in self.collection.records if self.is_visible(record)]
 
     def fetch(self, expr):
+        self.reads(None)
         visible_records = []
         for record in self.collection.records:
             if self.is_visible(record) and expr(record):
@@ -82,26 +128,51 @@ class Transaction:
 
         return visible_records
 
-    def commit(self):
-        check_ids = [id for _, id in self.rollback_actions]
-        new_records = [record
-                       for i, record in enumerate(self.collection.records)
-                       if i not in check_ids or not self.is_dead(record)]
-        self.collection.records = new_records
+    def changes(self) -> list[tuple]:
+        ops = []
+        for action, record in self.rollback_actions:
+            if record.created_id == self.id and self.is_dead(record):
+                continue
+            if action == 'delete':
+                ops.append(('insert', record._id, record.name, record.doc))
+            elif action == 'add':
+                ops.append(('delete', record._id))
+        return ops
 
-        self.collection.active_ids.discard(self.id)
-
-        logger.info(f'Commit transaction: {self.id}.')
+    def commit(self):
+        with self.collection.committing():
+            try:
+                ops = self.changes()
+                if ops:
+                    if self.collection.wal is not None:
+                        self.collection.wal.append({'transaction_id': self.id, 'ops': ops})
+                        self.collection.mark_dirty(op[1] for op in ops)
+            except BaseException:
+                # nothing was made visible: undo the writes, end the transaction and free its locks
+                self.rollback()
+                raise
+
+            try:
+                self.collection.committed(self.rollback_actions, ops)
+                self.collection.garbage.extend(record for action, record in self.rollback_actions
+                                               if action == 'add' and self.is_dead(record))
+            finally:
+                self.collection.end(self)
+                self.collection.locks.release_all(self.id)
+        logger.info('Commit transaction: %s.', self.id)
 
     def rollback(self):
-        for action in reversed(self.rollback_actions):
-            if action[0] == 'add':
-                self.collection.records[action[1]]['expired_id'] = 0
-            elif action[0] == 'delete':
-                self.collection.records[action[1]]['expired_id'] = self.id
-
-        self.collection.active_ids.discard(self.id)
-        logger.info(f'Rollback transaction: {self.id}.')
+        for action, record in reversed(self.rollback_actions):
+            if action == 'add':
+                record.expired_id = 0
+            elif action == 'delete':
+                record.expired_id = self.id
+                self.collection.records.remove(record)
+                self.collection.unindex_record(record)
+
+        self.collection.end(self)
+        self.collection.locks.release_all(self.id)
+        logger.info('Rollback transaction: %s.', self.id)
 
     def is_visible(self, record):
         pass
@@ -109,8 +180,17 @@ class Transaction:
     def is_locked(self, record):
         pass
 
+    def reads(self, predicate) -> None:
+        """Called before reading the documents matching `predicate` (None for all of them)."""
+
     def is_dead(self, record):
-        return record['expired_id'] == self.id
+        return record.expired_id == self.id
+
+    def in_snapshot(self, record) -> bool:
+        """Whether `record` is visible as of `snapshot`, with this transaction's own changes."""
+        if record.created_id != self.id and record.created_ts > self.snapshot:
+            return False
+        return record.expired_id != self.id and record.expired_ts > self.snapshot
 
 
 class ReadUncommittedTransaction(Transaction):
@@ -118,49 +198,158 @@ class ReadUncommittedTransaction(Transaction):
         return not self.is_visible(record)
 
     def is_visible(self, record):
-        return record['expired_id'] == 0
+        return record.expired_id == 0
 
 
 class ReadCommittedTransaction(Transaction):
+    """Each statement reads the commits published when it started.
+
+    A commit stamps its versions one by one before publishing its
+    sequence number, so reads compare the stamps with `read_point`, the
+    sequence number the statement started at, rather than with PENDING:
+    a commit shows all at once. Like a snapshot, the read point keeps
+    the versions it sees from the vacuum until the next statement.
+    """
+    cacheable = True
+    statement_reads = True
+
+    def reads(self, predicate) -> None:
+        if self.statement_reads:
+            self.collection.read_latest(self)
+
+    def fetch_by_id(self, _id: int):
+        if self.statement_reads:
+            self.collection.read_latest(self)
+        return super().fetch_by_id(_id)
+
+    def update_record(self, _id: int, name: str, doc: dict) -> None:
+        # a statement of its own; `delete_record_id` is also a step of `Database.write`
+        # and keeps the read point its targets were picked at
+        if self.statement_reads:
+            self.collection.read_latest(self)
+        return super().update_record(_id, name, doc)
+
     def is_locked(self, record):
-        return record['expired_id'] != 0 and record['expired_id'] in self.collection.active_ids
+        return record.expired_id != 0 and record.expired_ts == PENDING
 
     def is_visible(self, record):
-        if record['created_id'] in self.collection.active_ids and record['created_id'] != self.id:
+        if record.created_id != self.id and record.created_ts > self.read_point:
             return False
 
-        if record['expired_id'] != 0 and \
-                (record['expired_id'] not in self.collection.active_ids or record['expired_id'] == self.id):
-            return False
-
-        return True
+        return record.expired_id != self.id and record.expired_ts > self.read_point
 
 
 class RepeatableReadTransaction(ReadCommittedTransaction):
-    def is_locked(self, record):
-        return ReadCommittedTransaction.is_locked(self, record) or \
-            self.collection.locks.exists(self, record['_id'])
+    """Snapshot isolation: reads see the snapshot and take no locks.
+
+    Expiring a version another transaction expired since the snapshot,
+    even if it committed, fails like any write conflict.
+    """
+    snapshot_reads = True
+    statement_reads = False
 
     def is_visible(self, record):
-        is_visible = ReadCommittedTransaction.is_visible(self, record)
+        return self.in_snapshot(record)
 
-        if is_visible:
-            self.collection.locks.add(self, record['_id'])
 
-        return is_visible
+class SerializableTransaction(RepeatableReadTransaction):
+    """Snapshot reads holding shared locks, so no version read can be
+    expired until the transaction ends. A version read that was already
+    expired by a commit after the snapshot fails the read."""
+    # reads take shared locks
+    cacheable = False
 
+    def is_visible(self, record):
+        if not self.in_snapshot(record):
+            return False
+
+        self.collection.locks.acquire(self.id, record._id, LockMode.shared)
+        if record.expired_id != 0:
+            warn = f'Failed to read: record {record._id} changed by another transaction.'
+            logger.warning(warn)
+            raise RollbackException(warn)
+        return True
+
+
+class ReadOnlyTransaction(Transaction):
+    """Snapshot reads without locks or rollback state, any write fails."""
+    cacheable = True
+    snapshot_reads = True
 
-class SerializableTransaction(RepeatableReadTransaction):
     def __init__(self, collection, t_id):
-        Transaction.__init__(self, collection, t_id)
-        self.existing_ids = self.collection.active_ids.copy()
+        super().__init__(collection, t_id)
+        self.rollback_actions = ()
+
+    def add_record(self, name: str, doc: dict, _id: int | None = None) -> None:
+        raise ReadOnlyException(f'Transaction: {self.id} is read only')
+
+    def add_records(self, items: list[tuple[str, dict]], ids: list[int] | None = None) -> list[int]:
+        raise ReadOnlyException(f'Transaction: {self.id} is read only')
+
+    def expire_record(self, record) -> None:
+        raise ReadOnlyException(f'Transaction: {self.id} is read only')
+
+    def commit(self):
+        self.collection.end(self)
+        logger.info('Commit transaction: %s.', self.id)
+
+    def rollback(self):
+        self.collection.end(self)
+        logger.info('Rollback transaction: %s.', self.id)
 
     def is_visible(self, record):
-        is_visible = ReadCommittedTransaction.is_visible(self, record) \
-                     and record['created_id'] <= self.id \
-                     and record['created_id'] in self.existing_ids
+        return self.in_snapshot(record)
+
 
-        if is_visible:
-            self.collection.locks.add(self, record['_id'])
+class OptimisticTransaction(RepeatableReadTransaction):
+    """Serializable without read locks: reads see the snapshot and are
+    validated when the transaction commits.
 
-        return is_visible
+    The read set is kept compact: the predicates of the queries run, so
+    a full scan is one entry, and the `_id`s read by point lookups. A
+    commit fails if a transaction that committed since the snapshot
+    wrote one of those `_id`s, or wrote or expired a version matching
+    one of those predicates, which also covers phantoms. Writes still
+    take exclusive locks, as the versions are changed in place.
+    Transactions that wrote nothing always commit.
+    """
+    validates = True
+    # reads are recorded by the scans, which a cached result skips
+    cacheable = False
+
+    def __init__(self, collection, t_id):
+        super().__init__(collection, t_id)
+        self.read_predicates = []
+        self.read_ids = set()
+
+    def reads(self, predicate) -> None:
+        self.read_predicates.append(predicate)
+
+    def fetch_by_id(self, _id: int):
+        self.read_ids.add(_id)
+        return super().fetch_by_id(_id)
+
+    def conflict(self) -> int | None:
+        """`_id` of a version written since the snapshot that this transaction read, if any."""
+        for ts, ids, records in self.collection.commits_since(self.snapshot):
+            for _id in self.read_ids & ids:
+                return _id
+            if not self.read_predicates:
+                continue
+            for record in records:
+                doc = record.doc
+                if any(predicate is None or predicate(doc) for predicate in self.read_predicates):
+                    return record._id
+        return None
+
+    def commit(self):
+        if not self.rollback_actions:
+            return super().commit()
+        with self.collection.validation_lock:
+            _id = self.conflict()
+            if _id is not None:
+                self.rollback()
+                warn = f'Failed to commit: record {_id} read by transaction {self.id} changed since.'
+                logger.warning(warn)
+                raise RollbackException(warn)
+            super().commit()
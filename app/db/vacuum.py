@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+
+from app.db.collection import Collection
+
+logger = logging.getLogger("database")
+
+
+class Vacuum:
+    """Reclaims dead versions.
+
+    Commit queues the versions it expired on `collection.garbage`. A
+    version is removed from the store and the indexes once it was expired
+    at or before the oldest running snapshot (see `Collection.horizon`),
+    so no running transaction can still see it. Each pass looks at no
+    more than `budget` queued versions.
+    """
+
+    def __init__(self, collection: Collection, budget: int = 10000, interval_s: float = 1) -> None:
+        self.collection = collection
+        self.budget = budget
+        self.interval_s = interval_s
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.stats = {
+            'runs': 0,
+            'reclaimed': 0,
+            'last_reclaimed': 0,
+            'last_duration_s': 0.0,
+            'pending': 0,
+            'horizon': 0,
+        }
+
+    def run(self, budget: int | None = None) -> dict:
+        with self.lock:
+            started = time.monotonic()
+            garbage = self.collection.garbage
+            horizon = self.collection.horizon()
+            reclaimed = 0
+            for _ in range(min(budget or self.budget, len(garbage))):
+                record = garbage.popleft()
+                if record.expired_id == 0:
+                    continue
+                if record.expired_ts <= horizon:
+                    self.collection.records.remove(record)
+                    self.collection.unindex_record(record)
+                    reclaimed += 1
+                else:
+                    garbage.append(record)
+
+            self.collection.reclaimed(reclaimed)
+            self.stats['runs'] += 1
+            self.stats['reclaimed'] += reclaimed
+            self.stats['last_reclaimed'] = reclaimed
+            self.stats['last_duration_s'] = time.monotonic() - started
+            self.stats['pending'] = len(garbage)
+            self.stats['horizon'] = horizon
+            if reclaimed:
+                logger.debug('Vacuum reclaimed %s versions, %s pending', reclaimed, len(garbage))
+            return dict(self.stats)
+
+    def daemon(self) -> None:
+        while not self.closed.wait(self.interval_s):
+            try:
+                self.run()
+            except Exception:
+                logger.critical('Vacuum failed', exc_info=True)
+
+    def close(self) -> None:
+        self.closed.set()
@@ -1,7 +1,7 @@
 from fastapi import FastAPI
 
 from app.db.db import Database
-from app.routers import api
+from app.routers import api, metrics
 from logging.config import dictConfig
 import logging
 from app.settings.config import LogConfig
@@ -11,6 +11,8 @@ logger = logging.getLogger("database")
 
 app = FastAPI(debug=True)
 app.include_router(api.router)
+app.include_router(metrics.router)
+app.add_middleware(metrics.LatencyMiddleware)
 
 
 @app.get("/")
@@ -27,4 +29,4 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info('Shutting down')
-    Database().dump_to_fs()
+    Database().close()
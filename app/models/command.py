@@ -1,18 +1,41 @@
-from typing import Literal
+from typing import Annotated, Any, Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
+
+from app.db.index import IndexType
+from app.db.query import from_cond
+from app.db.transaction import TransactionType
 
 
 class Cond(BaseModel):
     field: str | None = None
-    predicate: Literal["$eq", "$ne", "$lt", "$lte", "$gt", "$gte"] | None = None
-    value: str | None = None
+    predicate: Literal["$eq", "$ne", "$lt", "$lte", "$gt", "$gte", "$in", "$nin", "$exists"] | None = None
+    value: str | int | float | bool | list | dict | None = None
 
 
 class Filter(BaseModel):
     cond: Cond | None = Cond()
+    query: dict[str, Any] | None = None
     limit: int | None = -1
 
+    def to_query(self) -> dict:
+        """`query` and `cond` combined, both must match."""
+        cond = from_cond(self.cond.field, self.cond.predicate, self.cond.value) if self.cond else {}
+        if cond and self.query:
+            return {'$and': [cond, self.query]}
+        return cond or self.query or {}
+
+
+class Subscribe(BaseModel):
+    # changes whose doc matches both, for a delete the doc it deleted
+    cond: Cond | None = None
+    query: dict[str, Any] | None = None
+    # resume after this change position, by default start from the next change
+    after: int | None = None
+
+    def to_query(self) -> dict:
+        return Filter(cond=self.cond, query=self.query).to_query()
+
 
 class Insert(BaseModel):
     name: str
@@ -21,6 +44,57 @@ class Insert(BaseModel):
 
 class Find(BaseModel):
     filter: Filter | None = Filter()
+    # {"field": 1 or -1, ...}, docs without a field sort before the others
+    sort: dict[str, Literal[1, -1]] | None = None
+    # doc fields to return, rows are then {_id, name, doc}
+    projection: list[str] | None = None
+
+
+class Explain(Find):
+    # the operation to plan, it isn't run
+    op: Literal["find", "update", "delete"] = "find"
+
+
+class Match(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    match: Filter = Field(alias="$match")
+
+
+class Group(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    # {"_id": "$field" or a constant, "out": {"$count" | "$sum" | "$avg" | "$min" | "$max": "$field"}, ...}
+    group: dict[str, Any] = Field(alias="$group")
+
+
+class Sort(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    sort: dict[str, Literal[1, -1]] = Field(alias="$sort")
+
+
+class Limit(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    limit: int = Field(alias="$limit", ge=0)
+
+
+class Aggregate(BaseModel):
+    pipeline: list[Match | Group | Sort | Limit]
+
+    def to_pipeline(self) -> list[dict]:
+        """Stages as the engine takes them, a `$match` limit becomes a `$limit` after it."""
+        stages = []
+        for stage in self.pipeline:
+            if isinstance(stage, Match):
+                stages.append({"$match": stage.match.to_query()})
+                if stage.match.limit is not None and stage.match.limit >= 0:
+                    stages.append({"$limit": stage.match.limit})
+            else:
+                stages.append(stage.model_dump(by_alias=True))
+        return stages
+
+
+class Cursor(BaseModel):
+    filter: Filter | None = Filter()
+    batch_size: int | None = Field(default=None, gt=0)
 
 
 class Update(BaseModel):
@@ -31,3 +105,63 @@ class Update(BaseModel):
 class Delete(BaseModel):
     filter: Filter | None = Filter()
 
+
+class Index(BaseModel):
+    name: str
+    field: str
+    type: IndexType = IndexType.hash
+
+
+class BatchBegin(BaseModel):
+    op: Literal["begin"]
+    type: TransactionType = TransactionType.read_committed
+
+
+class BatchInsert(Insert):
+    op: Literal["insert"]
+
+
+class BatchInsertMany(BaseModel):
+    op: Literal["insert_many"]
+    docs: list[Insert]
+
+
+class BatchFind(Find):
+    op: Literal["find"]
+
+
+class BatchGet(BaseModel):
+    op: Literal["get"]
+    id: int = Field(alias="_id")
+
+
+class BatchUpdate(Update):
+    op: Literal["update"]
+
+
+class BatchDelete(Delete):
+    op: Literal["delete"]
+
+
+class BatchCommit(BaseModel):
+    op: Literal["commit"]
+
+
+class BatchRollback(BaseModel):
+    op: Literal["rollback"]
+
+
+BatchCommand = Annotated[
+    BatchBegin | BatchInsert | BatchInsertMany | BatchFind | BatchGet | BatchUpdate | BatchDelete
+    | BatchCommit | BatchRollback,
+    Field(discriminator="op")
+]
+
+
+class Batch(BaseModel):
+    commands: list[BatchCommand]
+    # run in this open transaction instead of beginning one
+    transaction_id: int | None = None
+    # wrap the commands in a transaction of `type`, committed at the end
+    implicit: bool = False
+    type: TransactionType = TransactionType.read_committed
@@ -0,0 +1,114 @@
+import logging
+
+from fastapi import APIRouter, HTTPException
+
+from app.db.db import Database
+from app.utils import metrics
+from app.utils.executor import run
+
+logger = logging.getLogger("database")
+
+router = APIRouter(
+    prefix="/db/admin",
+    tags=["admin"],
+)
+
+
+@router.get("/checkpoint")
+async def checkpoint_stats() -> dict:
+    return Database().checkpointer.stats
+
+
+@router.post("/checkpoint")
+async def checkpoint(full: bool = False) -> dict:
+    try:
+        stats = await run(Database().checkpoint, full=full)
+        logger.info("/admin/checkpoint full=%s", full)
+    except Exception as e:
+        logger.critical('Checkpoint error', exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    return stats
+
+
+@router.get("/vacuum")
+async def vacuum_stats() -> dict:
+    return Database().vacuum.stats
+
+
+@router.post("/vacuum")
+async def vacuum(budget: int | None = None) -> dict:
+    try:
+        stats = await run(Database().vacuum.run, budget=budget)
+        logger.info("/admin/vacuum reclaimed=%s", stats['last_reclaimed'])
+    except Exception as e:
+        logger.critical('Vacuum error', exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    return stats
+
+
+@router.get("/reaper")
+async def reaper_stats() -> dict:
+    return Database().reaper.stats
+
+
+@router.post("/reaper")
+async def reap() -> dict:
+    try:
+        stats = await run(Database().reaper.run)
+        logger.info("/admin/reaper reaped=%s", stats['last_reaped'])
+    except Exception as e:
+        logger.critical('Reaper error', exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    return stats
+
+
+@router.get("/locks")
+async def lock_stats() -> dict:
+    return Database().collection.locks.describe()
+
+
+@router.get("/cache")
+async def cache_stats() -> dict:
+    return Database().cache.describe()
+
+
+@router.delete("/cache")
+async def clear_cache() -> dict:
+    await run(Database().cache.clear)
+    logger.info("/admin/cache cleared")
+    return {"message": "Success"}
+
+
+@router.get("/columns")
+async def column_stats() -> dict:
+    return Database().columns.describe()
+
+
+@router.delete("/columns")
+async def clear_columns() -> dict:
+    await run(Database().columns.clear)
+    logger.info("/admin/columns cleared")
+    return {"message": "Success"}
+
+
+@router.get("/changes")
+async def change_stats() -> dict:
+    return Database().changes.describe()
+
+
+@router.get("/slow_queries")
+async def slow_queries(limit: int | None = None) -> dict:
+    log = Database().slow_queries
+    return dict(log.describe(), queries=log.recent(limit))
+
+
+@router.delete("/slow_queries")
+async def clear_slow_queries() -> dict:
+    Database().slow_queries.clear()
+    logger.info("/admin/slow_queries cleared")
+    return {"message": "Success"}
+
+
+@router.get("/stats")
+async def stats() -> dict:
+    return dict(await run(Database().stats), metrics=metrics.registry.snapshot())
@@ -1,7 +1,7 @@
 from fastapi import APIRouter
 
 from app.settings.settings import API_VERSION
-from app.routers import db
+from app.routers import admin, changes, db, session
 
 router = APIRouter(
     prefix=f'/api/v{API_VERSION}',
@@ -10,3 +10,6 @@ router = APIRouter(
 
 
 router.include_router(db.router)
+router.include_router(admin.router)
+router.include_router(session.router)
+router.include_router(changes.router)
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+from typing import Annotated, AsyncIterator
+
+from fastapi import APIRouter, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+
+from app.db.changes import ChangeLog
+from app.db.db import Database
+from app.db.exeptions import ChangeStreamException
+from app.db.query import QueryError, compile_query
+from app.models import command
+from app.settings import settings
+from app.utils.executor import run
+
+logger = logging.getLogger("database")
+
+router = APIRouter(
+    prefix="/db",
+    tags=["changes"],
+)
+
+
+async def follow(log: ChangeLog, query: dict, after: int | None) -> AsyncIterator[tuple[list[dict], int]]:
+    """Batches of the changes past `after` whose doc matches `query`, with
+    the position to resume after. The first batch is empty, so is one
+    sent every CHANGE_STREAM_HEARTBEAT_S while nothing changes.
+
+    A batch is read from the log once the previous one is taken, a slow
+    consumer only falls behind in the log; past its end the next read
+    raises `ChangeStreamException`.
+    """
+    predicate = compile_query(query) if query else None
+    loop = asyncio.get_running_loop()
+    published = asyncio.Event()
+
+    def wake() -> None:
+        # called on the committing thread
+        if not published.is_set():
+            try:
+                loop.call_soon_threadsafe(published.set)
+            except RuntimeError:
+                pass
+
+    log.subscribe(wake)
+    try:
+        _, after = log.read(after, limit=0)
+        yield [], after
+        while True:
+            published.clear()
+            position = after
+            events, after = await run(log.read, after, predicate, settings.CHANGE_STREAM_BATCH)
+            if events:
+                yield events, after
+            elif after == position:
+                try:
+                    await asyncio.wait_for(published.wait(), settings.CHANGE_STREAM_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield [], after
+    finally:
+        log.unsubscribe(wake)
+
+
+async def events(query: dict, after: int | None):
+    try:
+        async for changes, position in follow(Database().changes, query, after):
+            if not changes:
+                yield f': heartbeat\nid: {position}\n\n'
+                continue
+            yield ''.join(f'id: {change["position"]}\nevent: change\ndata: {json.dumps(change)}\n\n'
+                          for change in changes)
+    except ChangeStreamException as e:
+        yield f'event: error\ndata: {json.dumps({"detail": str(e)})}\n\n'
+
+
+@router.get("/changes")
+async def changes(field: str | None = None, predicate: str | None = None, value: str | None = None,
+                  after: int | None = None,
+                  last_event_id: Annotated[int | None, Header()] = None) -> StreamingResponse:
+    """Server-sent events of the committed changes, see `ChangeLog`.
+
+    The filter is a `Cond` with `value` given as JSON (or a plain
+    string). A reconnecting client resumes after the `Last-Event-ID` it
+    got, others after `after`, or from the next change.
+    """
+    try:
+        if value is not None:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        query = command.Subscribe(cond=command.Cond(field=field, predicate=predicate, value=value)).to_query()
+        compile_query(query)
+        if last_event_id is not None:
+            after = last_event_id
+        Database().changes.read(after, limit=0)
+        logger.info("/changes after=%s\n%s", after, query)
+    except (ValidationError, QueryError, ChangeStreamException) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(events(query, after), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+async def send_changes(websocket: WebSocket, request: command.Subscribe) -> None:
+    try:
+        async for changes, position in follow(Database().changes, request.to_query(), request.after):
+            await websocket.send_text(json.dumps({'position': position, 'changes': changes}))
+    except (QueryError, ChangeStreamException) as e:
+        await websocket.send_text(json.dumps({'error': str(e)}))
+        await websocket.close()
+
+
+async def closed(websocket: WebSocket) -> None:
+    while (await websocket.receive())['type'] != 'websocket.disconnect':
+        pass
+
+
+@router.websocket("/changes/ws")
+async def changes_ws(websocket: WebSocket) -> None:
+    """The first message is a `Subscribe`, the replies `{"position": ..., "changes": [...]}`
+    or, once the stream can't go on, `{"error": ...}`. Later messages are ignored."""
+    await websocket.accept()
+    logger.info("/changes/ws opened")
+    try:
+        request = command.Subscribe.model_validate_json(await websocket.receive_text())
+    except WebSocketDisconnect:
+        return
+    except ValidationError as e:
+        await websocket.send_text(json.dumps({'error': str(e)}))
+        await websocket.close()
+        return
+    # a client gone while nothing changes is noticed right away, not at the next heartbeat
+    tasks = [asyncio.create_task(send_changes(websocket, request)), asyncio.create_task(closed(websocket))]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    logger.info("/changes/ws closed")
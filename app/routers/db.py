@@ -1,11 +1,17 @@
+import itertools
+import json
 import logging
-from typing import Annotated
+from typing import Annotated, Iterator
 
 from fastapi import APIRouter, HTTPException, Path
+from fastapi.responses import StreamingResponse
 
 from app.db.db import Database
+from app.db.exeptions import TransactionTimeoutException
 from app.db.transaction import TransactionType
 from app.models import command
+from app.settings import settings
+from app.utils.executor import finish, run
 
 logger = logging.getLogger("database")
 
@@ -17,13 +23,13 @@ router = APIRouter(
 
 
 @router.post("/begin/{transaction_type}")
-async def begin(transaction_type: TransactionType) -> dict:
+async def begin(transaction_type: TransactionType, timeout_s: float | None = None) -> dict:
     try:
-        t_id = Database().begin_transaction(transaction_type)
-        logger.info(f"/begin/{transaction_type}/{t_id}")
+        t_id = await run(Database().begin_transaction, transaction_type, timeout_s=timeout_s)
+        logger.info("/begin/%s/%s", transaction_type, t_id)
     except Exception as e:
         logger.critical(f'Begin error in transaction: {transaction_type}', exc_info=True)
-        raise HTTPException(status_code=400, detail=e)
+        raise HTTPException(status_code=400, detail=str(e))
 
     return {"transaction_id": t_id}
 
@@ -31,72 +37,217 @@ async def begin(transaction_type: TransactionType) -> dict:
 @router.post("/commit/{transaction_id}", status_code=201)
 async def commit(transaction_id: Annotated[int, Path(title="Transaction ID to commit")]) -> dict:
     try:
-        Database().commit(transaction_id)
-        logger.info(f"/commit/{transaction_id}/{transaction_id}")
+        await finish(Database().commit, transaction_id)
+        logger.info("/commit/%s/%s", transaction_id, transaction_id)
+    except KeyError as e:
+        logger.critical(f'Transaction: {transaction_id} not found')
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.critical(f'Commit error in transaction: {transaction_id}', exc_info=True)
-        raise HTTPException(status_code=400, detail=e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"message": "Success"}
+
+
+@router.post("/rollback/{transaction_id}")
+async def rollback(transaction_id: Annotated[int, Path(title="Transaction ID to roll back")]) -> dict:
+    try:
+        await finish(Database().rollback, transaction_id)
+        logger.info("/rollback/%s", transaction_id)
+    except KeyError as e:
+        logger.critical(f'Transaction: {transaction_id} not found')
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.critical(f'Rollback error in transaction: {transaction_id}', exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
 
     return {"message": "Success"}
 
 
 @router.post("/insert_one/{transaction_id}")
 async def insert_one(transaction_id: int, cmd: command.Insert) -> dict:
+    if transaction_id not in Database().transactions:
+        logger.critical(f'Transaction: {transaction_id} not found')
+        raise HTTPException(status_code=400, detail=f'Transaction: {transaction_id} not found')
     try:
-        Database().insert(transaction_id=transaction_id, name=cmd.name, doc=cmd.doc)
-        logger.info(f"/insert_one/{transaction_id}\n{cmd}")
+        await run(Database().insert, transaction_id=transaction_id, name=cmd.name, doc=cmd.doc)
+        logger.info("/insert_one/%s\n%s", transaction_id, cmd)
     except Exception as e:
         logger.critical(f'Insert error in transaction: {transaction_id}', exc_info=True)
-        raise HTTPException(status_code=400, detail=e)
+        raise HTTPException(status_code=400, detail=str(e))
     return {"message": "Success"}
 
 
 @router.post("/insert_many/{transaction_id}")
-async def insert_many(transaction_id: int, cmds: list[command.Insert]) -> set[dict]:
-    res = [await insert_one(transaction_id, cmd) for cmd in cmds]
-    return set(res)
+async def insert_many(transaction_id: int, cmds: list[command.Insert]) -> dict:
+    if transaction_id not in Database().transactions:
+        logger.critical(f'Transaction: {transaction_id} not found')
+        raise HTTPException(status_code=400, detail=f'Transaction: {transaction_id} not found')
+    try:
+        ids = await run(Database().insert_many, transaction_id, [(cmd.name, cmd.doc) for cmd in cmds])
+        logger.info("/insert_many/%s %s documents", transaction_id, len(cmds))
+    except Exception as e:
+        logger.critical(f'Insert error in transaction: {transaction_id}', exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Success", "ids": ids}
 
 
 @router.post("/find/{transaction_id}")
 async def find(transaction_id: int, cmd: command.Find) -> list[dict]:
     try:
         if transaction_id in Database().transactions:
-            values = Database().find(
+            rows = await run(
+                Database().find,
                 transaction_id=transaction_id,
+                query=cmd.filter.to_query(),
                 limit=cmd.filter.limit,
-                field=cmd.filter.cond.field,
-                p=cmd.filter.cond.predicate,
-                value=cmd.filter.cond.value
+                sort=cmd.sort,
+                projection=cmd.projection
             )
-            logger.info(f"/find/{transaction_id}\n{cmd}")
+            values = await run(list, rows)
+            logger.info("/find/%s\n%s", transaction_id, cmd)
         else:
             logger.critical(f'Transaction: {transaction_id} not found', exc_info=True)
             raise HTTPException(status_code=400, detail=f'Transaction: {transaction_id} not found')
     except Exception as e:
         logger.critical(f'Find error in transaction: {transaction_id}', exc_info=True)
-        raise HTTPException(status_code=400, detail=e)
+        raise HTTPException(status_code=400, detail=str(e))
     return values
 
 
+@router.post("/explain/{transaction_id}")
+async def explain(transaction_id: int, cmd: command.Explain) -> dict:
+    if transaction_id not in Database().transactions:
+        logger.critical(f'Transaction: {transaction_id} not found')
+        raise HTTPException(status_code=400, detail=f'Transaction: {transaction_id} not found')
+    try:
+        plan = await run(Database().explain, transaction_id, cmd.filter.to_query(), cmd.filter.limit,
+                         sort=cmd.sort, op=cmd.op)
+        logger.info("/explain/%s\n%s", transaction_id, cmd)
+    except Exception as e:
+        logger.critical(f'Explain error in transaction: {transaction_id}', exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    return plan
+
+
+@router.post("/aggregate/{transaction_id}")
+async def aggregate(transaction_id: int, cmd: command.Aggregate) -> list[dict]:
+    if transaction_id not in Database().transactions:
+        logger.critical(f'Transaction: {transaction_id} not found')
+        raise HTTPException(status_code=400, detail=f'Transaction: {transaction_id} not found')
+    try:
+        docs = await run(Database().aggregate, transaction_id, cmd.to_pipeline())
+        logger.info("/aggregate/%s\n%s", transaction_id, cmd)
+    except Exception as e:
+        logger.critical(f'Aggregate error in transaction: {transaction_id}', exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    return docs
+
+
+async def ndjson(rows: Iterator[dict]):
+    while batch := await run(lambda: list(itertools.islice(rows, settings.CURSOR_BATCH_SIZE))):
+        yield ''.join(json.dumps(row) + '\n' for row in batch)
+
+
+@router.post("/stream/{transaction_id}")
+async def stream(transaction_id: int, cmd: command.Find) -> StreamingResponse:
+    if transaction_id not in Database().transactions:
+        logger.critical(f'Transaction: {transaction_id} not found')
+        raise HTTPException(status_code=400, detail=f'Transaction: {transaction_id} not found')
+    try:
+        rows = await run(
+            Database().find,
+            transaction_id=transaction_id,
+            query=cmd.filter.to_query(),
+            limit=cmd.filter.limit,
+            sort=cmd.sort,
+            projection=cmd.projection
+        )
+        logger.info("/stream/%s\n%s", transaction_id, cmd)
+    except Exception as e:
+        logger.critical(f'Stream error in transaction: {transaction_id}', exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(ndjson(rows), media_type="application/x-ndjson")
+
+
+@router.post("/cursor/open/{transaction_id}")
+async def open_cursor(transaction_id: int, cmd: command.Cursor) -> dict:
+    try:
+        cursor_id = await run(
+            Database().open_cursor,
+            transaction_id=transaction_id,
+            query=cmd.filter.to_query(),
+            limit=cmd.filter.limit,
+            batch_size=cmd.batch_size
+        )
+        logger.info("/cursor/open/%s/%s\n%s", transaction_id, cursor_id, cmd)
+    except Exception as e:
+        logger.critical(f'Cursor error in transaction: {transaction_id}', exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"cursor_id": cursor_id}
+
+
+@router.post("/cursor/next/{cursor_id}")
+async def next_batch(cursor_id: int) -> dict:
+    if cursor_id not in Database().cursors:
+        raise HTTPException(status_code=404, detail=f'Cursor: {cursor_id} not found')
+    try:
+        batch = await run(Database().next_batch, cursor_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f'Cursor: {cursor_id} not found')
+    except Exception as e:
+        logger.critical(f'Cursor error: {cursor_id}', exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    return batch
+
+
+@router.post("/cursor/close/{cursor_id}")
+async def close_cursor(cursor_id: int) -> dict:
+    try:
+        await run(Database().close_cursor, cursor_id)
+        logger.info("/cursor/close/%s", cursor_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f'Cursor: {cursor_id} not found')
+    return {"message": "Success"}
+
+
+@router.get("/get/{transaction_id}/{_id}")
+async def get(transaction_id: int, _id: int) -> dict:
+    try:
+        record = await run(Database().fetch_by_id, transaction_id=transaction_id, _id=_id)
+    except KeyError as e:
+        logger.critical(f'Transaction: {transaction_id} not found')
+        raise HTTPException(status_code=404, detail=str(e))
+    except TransactionTimeoutException as e:
+        logger.warning(f'Transaction: {transaction_id} timed out')
+        raise HTTPException(status_code=408, detail=str(e))
+    except Exception as e:
+        logger.critical(f'Get error in transaction: {transaction_id}', exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    if record is None:
+        raise HTTPException(status_code=404, detail=f'Record: {_id} not found')
+    logger.info("/get/%s/%s", transaction_id, _id)
+    return record
+
+
 @router.post("/update/{transaction_id}")
 async def update(transaction_id: int, cmd: command.Update) -> dict:
     try:
         if transaction_id in Database().transactions:
-            Database().update(
+            await run(
+                Database().update,
                 transaction_id=transaction_id,
+                query=cmd.filter.to_query(),
                 limit=cmd.filter.limit,
-                field=cmd.filter.cond.field,
-                p=cmd.filter.cond.predicate,
-                value=cmd.filter.cond.value,
                 new_doc=cmd.set
             )
-            logger.info(f"/update/{transaction_id}\n{cmd}")
+            logger.info("/update/%s\n%s", transaction_id, cmd)
         else:
             logger.critical(f'Transaction: {transaction_id} not found', exc_info=True)
             raise HTTPException(status_code=400, detail=f'Transaction: {transaction_id} not found')
     except Exception as e:
         logger.critical(f'Update error in transaction: {transaction_id}', exc_info=True)
-        raise HTTPException(status_code=400, detail=e)
+        raise HTTPException(status_code=400, detail=str(e))
     return {"message": "Success"}
 
 
@@ -104,18 +255,149 @@ async def update(transaction_id: int, cmd: command.Update) -> dict:
 async def delete(transaction_id: int, cmd: command.Delete) -> dict:
     try:
         if transaction_id in Database().transactions:
-            Database().delete(
+            await run(
+                Database().delete,
                 transaction_id=transaction_id,
-                limit=cmd.filter.limit,
-                field=cmd.filter.cond.field,
-                p=cmd.filter.cond.predicate,
-                value=cmd.filter.cond.value
+                query=cmd.filter.to_query(),
+                limit=cmd.filter.limit
             )
-            logger.info(f"/delete/{transaction_id}\n{cmd}")
+            logger.info("/delete/%s\n%s", transaction_id, cmd)
         else:
             logger.critical(f'Transaction: {transaction_id} not found', exc_info=True)
             raise HTTPException(status_code=400, detail=f'Transaction: {transaction_id} not found')
     except Exception as e:
         logger.critical(f'Delete error in transaction: {transaction_id}', exc_info=True)
-        raise HTTPException(status_code=400, detail=e)
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Success"}
+
+
+@router.post("/bulk_update/{transaction_id}")
+async def bulk_update(transaction_id: int, cmds: list[command.Update]) -> dict:
+    ops = [(cmd.filter.to_query(), cmd.filter.limit, cmd.set) for cmd in cmds]
+    return await bulk_write(transaction_id, ops, "bulk_update")
+
+
+@router.post("/bulk_delete/{transaction_id}")
+async def bulk_delete(transaction_id: int, cmds: list[command.Delete]) -> dict:
+    ops = [(cmd.filter.to_query(), cmd.filter.limit, None) for cmd in cmds]
+    return await bulk_write(transaction_id, ops, "bulk_delete")
+
+
+async def bulk_write(transaction_id: int, ops: list[tuple], route: str) -> dict:
+    if transaction_id not in Database().transactions:
+        logger.critical(f'Transaction: {transaction_id} not found')
+        raise HTTPException(status_code=400, detail=f'Transaction: {transaction_id} not found')
+    try:
+        changed = await run(Database().bulk_write, transaction_id, ops)
+        logger.info("/%s/%s %s operations", route, transaction_id, len(ops))
+    except Exception as e:
+        logger.critical(f'Bulk write error in transaction: {transaction_id}', exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Success", "changed": changed}
+
+
+def execute(db: Database, t_id: int, cmd):
+    match cmd.op:
+        case "insert":
+            return db.insert_many(t_id, [(cmd.name, cmd.doc)])[0]
+        case "insert_many":
+            return db.insert_many(t_id, [(doc.name, doc.doc) for doc in cmd.docs])
+        case "find":
+            return list(db.find(t_id, query=cmd.filter.to_query(), limit=cmd.filter.limit, sort=cmd.sort,
+                                projection=cmd.projection))
+        case "get":
+            return db.fetch_by_id(t_id, cmd.id)
+        case "update":
+            return db.update(t_id, query=cmd.filter.to_query(), limit=cmd.filter.limit, new_doc=cmd.set)
+        case "delete":
+            return db.delete(t_id, query=cmd.filter.to_query(), limit=cmd.filter.limit)
+
+
+def execute_batch(cmd: command.Batch) -> dict:
+    """Run the commands in order until one fails.
+
+    A transaction begun by the batch, explicitly or with `implicit`, is
+    rolled back when a command fails; one passed in `transaction_id` is
+    left open for the caller, unless its commit failed, which rolls it
+    back.
+    """
+    db = Database()
+    t_id = cmd.transaction_id
+    if t_id is not None and t_id not in db.transactions:
+        raise KeyError(f'Transaction: {t_id} not found')
+    opened = committing = None
+    if cmd.implicit and t_id is None:
+        t_id = opened = db.begin_transaction(cmd.type)
+    results = []
+    try:
+        for c in cmd.commands:
+            match c.op:
+                case "begin":
+                    if t_id is not None:
+                        raise ValueError(f'Transaction: {t_id} is already open')
+                    t_id = opened = db.begin_transaction(c.type)
+                    result = t_id
+                case "commit" | "rollback":
+                    if t_id is None:
+                        raise ValueError('No open transaction')
+                    # either ends the transaction, even when it fails
+                    opened = None
+                    if c.op == "commit":
+                        committing = t_id
+                        db.commit(t_id)
+                    else:
+                        db.rollback(t_id)
+                    t_id = committing = result = None
+                case _:
+                    if t_id is None:
+                        raise ValueError('No open transaction')
+                    result = execute(db, t_id, c)
+            results.append({"op": c.op, "result": result})
+        if cmd.implicit and opened is not None:
+            committing, opened = opened, None
+            db.commit(committing)
+            t_id = committing = None
+    except Exception as e:
+        logger.warning(f'Batch failed at command {len(results)}: {e}')
+        if opened is not None:
+            db.rollback(opened)
+        rolled_back = opened is not None or (committing is not None and committing not in db.transactions)
+        return {"transaction_id": t_id, "results": results, "error": str(e), "rolled_back": rolled_back}
+    return {"transaction_id": t_id, "results": results, "error": None, "rolled_back": False}
+
+
+@router.post("/batch")
+async def batch(cmd: command.Batch) -> dict:
+    try:
+        res = await run(execute_batch, cmd)
+        logger.info("/batch %s commands", len(cmd.commands))
+    except Exception as e:
+        logger.critical('Batch error', exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    return res
+
+
+@router.get("/index")
+async def indexes() -> list[dict]:
+    return await run(Database().indexes)
+
+
+@router.post("/index", status_code=201)
+async def create_index(cmd: command.Index) -> dict:
+    try:
+        index = await run(Database().create_index, name=cmd.name, field=cmd.field, index_type=cmd.type)
+        logger.info("/index\n%s", cmd)
+    except Exception as e:
+        logger.critical(f'Create index error: {cmd.name}', exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    return index
+
+
+@router.delete("/index/{name}")
+async def drop_index(name: str) -> dict:
+    try:
+        await run(Database().drop_index, name)
+        logger.info("/index/%s", name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     return {"message": "Success"}
@@ -0,0 +1,84 @@
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.db.db import Database
+from app.utils import metrics
+from app.utils.executor import run
+
+router = APIRouter(tags=["metrics"])
+
+
+class LatencyMiddleware:
+    """Observes every HTTP request in `database_http_request_seconds`.
+
+    Requests are labelled with the route template rather than the path,
+    so transaction and cursor ids don't make a series each. A streamed
+    response is timed until its last chunk is sent.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_status(message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get('route')
+            metrics.registry.histogram('database_http_request_seconds', 'HTTP request latency in seconds.',
+                                       method=scope['method'], route=route.path if route is not None else 'unmatched',
+                                       status=status).observe(time.perf_counter() - started)
+
+
+def gauges(stats: dict) -> list[tuple]:
+    locks, checkpoint, vacuum, cache = stats['locks'], stats['checkpoint'], stats['vacuum'], stats['cache']
+    columns = stats['columns']
+    return [
+        ('database_versions', 'gauge', 'Record versions in memory.', {'state': 'live'}, stats['versions']['live']),
+        ('database_versions', 'gauge', 'Record versions in memory.', {'state': 'dead'}, stats['versions']['dead']),
+        ('database_active_transactions', 'gauge', 'Transactions begun and not finished.', {},
+         stats['active_transactions']),
+        ('database_transactions_reaped_total', 'counter', 'Transactions rolled back by the reaper.',
+         {'reason': 'deadline'}, stats['reaper']['deadline']),
+        ('database_transactions_reaped_total', 'counter', 'Transactions rolled back by the reaper.',
+         {'reason': 'idle'}, stats['reaper']['idle']),
+        ('database_open_cursors', 'gauge', 'Open cursors.', {}, stats['open_cursors']),
+        ('database_lock_keys', 'gauge', 'Records with a lock held or requested.', {}, locks['keys']),
+        ('database_lock_waiting', 'gauge', 'Transactions waiting for a lock.', {}, locks['waiting']),
+        ('database_locks_acquired_total', 'counter', 'Record locks granted.', {}, locks['acquired']),
+        ('database_lock_timeouts_total', 'counter', 'Lock waits that timed out.', {}, locks['timeouts']),
+        ('database_deadlocks_total', 'counter', 'Lock requests failed by deadlock detection.', {}, locks['deadlocks']),
+        ('database_checkpoints_total', 'counter', 'Checkpoints written.', {}, checkpoint['checkpoints']),
+        ('database_checkpoint_bytes_total', 'counter', 'Bytes written by checkpoints.', {}, checkpoint['total_bytes']),
+        ('database_checkpoint_last_bytes', 'gauge', 'Size of the last checkpoint.', {}, checkpoint['last_bytes']),
+        ('database_vacuum_reclaimed_total', 'counter', 'Dead versions reclaimed.', {}, vacuum['reclaimed']),
+        ('database_cache_hits_total', 'counter', 'Finds served by the query cache.', {}, cache['hits']),
+        ('database_cache_misses_total', 'counter', 'Cacheable finds not in the query cache.', {}, cache['misses']),
+        ('database_cache_invalidations_total', 'counter', 'Cache entries dropped by commits.', {},
+         cache['invalidations']),
+        ('database_cache_evictions_total', 'counter', 'Cache entries evicted for space.', {}, cache['evictions']),
+        ('database_cache_bytes', 'gauge', 'Memory held by cached finds.', {}, cache['bytes']),
+        ('database_column_cache_slots', 'gauge', 'Document versions in the column cache.', {}, columns['slots']),
+        ('database_column_cache_builds_total', 'counter', 'Times the column cache was built.', {},
+         columns['builds']),
+        ('database_column_cache_hits_total', 'counter', 'Aggregations run over the column cache.', {},
+         columns['hits']),
+    ]
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus() -> str:
+    stats = await run(Database().stats)
+    return metrics.render(gauges(stats))
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+
+from fastapi import APIRouter, WebSocket
+from pydantic import TypeAdapter
+
+from app.db.db import Database
+from app.models import command
+from app.routers.db import execute
+from app.settings import settings
+from app.utils import codec
+from app.utils.executor import finish, run
+
+logger = logging.getLogger("database")
+
+router = APIRouter(
+    prefix="/db",
+    tags=["session"],
+)
+
+COMMAND = TypeAdapter(command.BatchCommand)
+
+
+class Session:
+    """One WebSocket connection running pipelined requests.
+
+    A request is `{"id": ..., "op": ..., "transaction_id": ..., **args}`
+    with the same ops and arguments as `/batch` commands; without a
+    `transaction_id` the last transaction begun on the session is used.
+    The reply `{"id": ..., "result": ...}` or `{"id": ..., "error": ...}`
+    is encoded like the request: JSON in text frames, `utils.codec` in
+    binary frames.
+
+    Requests on the same transaction run in the order they arrive, the
+    others concurrently, so replies may come back out of order. At most
+    SESSION_MAX_INFLIGHT requests run at once. Transactions begun on the
+    session and still open when it closes are rolled back.
+    """
+
+    def __init__(self, websocket: WebSocket) -> None:
+        self.websocket = websocket
+        self.current: asyncio.Future | None = None
+        self.opened: set[int] = set()
+        self.locks: dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.send_lock = asyncio.Lock()
+        self.inflight = asyncio.Semaphore(settings.SESSION_MAX_INFLIGHT)
+        self.tasks: set[asyncio.Task] = set()
+
+    async def serve(self) -> None:
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                await self.inflight.acquire()
+                task = asyncio.create_task(self.handle(message))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+        finally:
+            if self.tasks:
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+            for t_id in list(self.opened):
+                try:
+                    await finish(Database().rollback, t_id)
+                except Exception:
+                    logger.warning(f'Session rollback failed for transaction: {t_id}', exc_info=True)
+
+    async def handle(self, message: dict) -> None:
+        binary = message.get('bytes') is not None
+        request_id = None
+        try:
+            request = codec.decode(message['bytes']) if binary else json.loads(message['text'])
+            if not isinstance(request, dict):
+                raise ValueError('A request must be an object')
+            request_id = request.get('id')
+            reply = {'id': request_id, 'result': await self.execute(request)}
+        except Exception as e:
+            reply = {'id': request_id, 'error': str(e)}
+        try:
+            async with self.send_lock:
+                if binary:
+                    await self.websocket.send_bytes(codec.encode(reply))
+                else:
+                    await self.websocket.send_text(json.dumps(reply))
+        except Exception:
+            logger.info(f'Session reply {request_id} not sent', exc_info=True)
+        finally:
+            self.inflight.release()
+
+    async def execute(self, request: dict):
+        cmd = COMMAND.validate_python(request)
+        db = Database()
+        if cmd.op == 'begin':
+            # set before the first await so requests pipelined behind it wait for its id
+            current = self.current = asyncio.get_running_loop().create_future()
+            t_id = None
+            try:
+                t_id = await run(db.begin_transaction, cmd.type)
+                self.opened.add(t_id)
+            finally:
+                current.set_result(t_id)
+            return t_id
+
+        t_id = request.get('transaction_id')
+        if t_id is None and self.current is not None:
+            t_id = await self.current
+        if t_id is None:
+            raise ValueError('No open transaction')
+        async with self.locks[t_id]:
+            if t_id not in db.transactions:
+                raise KeyError(f'Transaction: {t_id} not found')
+            match cmd.op:
+                case 'commit' | 'rollback':
+                    await finish(db.commit if cmd.op == 'commit' else db.rollback, t_id)
+                    self.opened.discard(t_id)
+                    self.locks.pop(t_id, None)
+                    if self.current is not None and self.current.done() and self.current.result() == t_id:
+                        self.current = None
+                    return None
+                case _:
+                    return await run(execute, db, t_id, cmd)
+
+
+@router.websocket("/session")
+async def session(websocket: WebSocket) -> None:
+    await websocket.accept()
+    logger.info("/session opened")
+    await Session(websocket).serve()
+    logger.info("/session closed")
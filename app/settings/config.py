@@ -1,12 +1,14 @@
 from pydantic import BaseModel
 
+from app.settings import settings
+
 
 class LogConfig(BaseModel):
     """Logging configuration to be set for the server"""
 
     LOGGER_NAME: str = "database"
     LOG_FORMAT: str = "%(levelprefix)s | %(asctime)s | %(message)s"
-    LOG_LEVEL: str = "DEBUG"
+    LOG_LEVEL: str = settings.LOG_LEVEL
 
     # Logging config
     version: int = 1
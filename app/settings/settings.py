@@ -1 +1,79 @@
+import os
+
 API_VERSION = 1
+
+# Engine calls run on a pool of this many threads so they don't block the event loop
+ENGINE_WORKERS = 16
+# Commits and rollbacks run on a pool of their own, free while lock waits fill the engine pool
+FINISH_WORKERS = 4
+
+# The WAL and checkpoints live under here, db.pickle of older versions is read from here
+DATA_DIR = 'data'
+
+# Level of the "database" logger; per-request lines are logged at INFO, WARNING turns them off
+LOG_LEVEL = 'DEBUG'
+
+# Keep documents pickled in memory and decode them on access
+COMPACT_RECORDS = False
+
+# Longest a transaction waits for a record lock before it has to roll back
+LOCK_TIMEOUT_S = 5
+
+# fsync: fsync on every commit, batch: fsync every WAL_SYNC_INTERVAL_MS, os: leave it to the OS
+WAL_DIR = os.path.join(DATA_DIR, 'wal')
+WAL_SYNC_MODE = 'fsync'
+WAL_SYNC_INTERVAL_MS = 10
+
+# A checkpoint runs every CHECKPOINT_INTERVAL_S or once the WAL grows past CHECKPOINT_WAL_BYTES.
+# Every CHECKPOINT_MAX_DELTAS incremental checkpoints a full one is written, the last
+# CHECKPOINT_RETAIN full checkpoints are kept.
+CHECKPOINT_DIR = os.path.join(DATA_DIR, 'checkpoints')
+CHECKPOINT_INTERVAL_S = 60
+CHECKPOINT_WAL_BYTES = 64 * 1024 * 1024
+CHECKPOINT_MAX_DELTAS = 8
+CHECKPOINT_RETAIN = 2
+
+# Every VACUUM_INTERVAL_S the vacuum looks at up to VACUUM_BUDGET dead versions
+VACUUM_INTERVAL_S = 1
+VACUUM_BUDGET = 10000
+
+# Every REAPER_INTERVAL_S transactions open longer than TRANSACTION_TIMEOUT_S, or unused for
+# TRANSACTION_IDLE_TIMEOUT_S, are rolled back; 0 turns either limit off
+TRANSACTION_TIMEOUT_S = 600
+TRANSACTION_IDLE_TIMEOUT_S = 60
+REAPER_INTERVAL_S = 1
+
+# Documents per cursor page and per chunk of a streamed find
+CURSOR_BATCH_SIZE = 1000
+
+# Requests a WebSocket session may have in flight before it stops reading new ones
+SESSION_MAX_INFLIGHT = 64
+
+# Memory for cached find results, 0 turns the cache off; larger results are never cached
+QUERY_CACHE_BYTES = 64 * 1024 * 1024
+QUERY_CACHE_MAX_ROWS = 10000
+
+# Fields kept as columns for aggregations, 0 turns the column cache off
+COLUMN_CACHE_FIELDS = 16
+
+# Finds, updates and deletes taking at least SLOW_QUERY_MS go to the slow-query log,
+# which keeps the last SLOW_QUERY_LOG_SIZE of them
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG_SIZE = 256
+
+# Committed changes kept in memory for /changes subscribers, 0 turns change streams off.
+# A subscriber is sent at most CHANGE_STREAM_BATCH of them at a time, and a heartbeat every
+# CHANGE_STREAM_HEARTBEAT_S while there are none
+CHANGE_LOG_SIZE = 100_000
+CHANGE_STREAM_BATCH = 1000
+CHANGE_STREAM_HEARTBEAT_S = 15
+
+# Versions /explain evaluates the query on to estimate how many match
+EXPLAIN_SAMPLE = 1000
+
+# Records are split into PARTITIONS stores by _id hash. With more than one, full scans of
+# a checkpoint segment of at least PARALLEL_SCAN_MIN_RECORDS are split as many ways and
+# filtered by up to SCAN_WORKERS processes.
+PARTITIONS = 1
+SCAN_WORKERS = 4
+PARALLEL_SCAN_MIN_RECORDS = 50000
@@ -0,0 +1,137 @@
+"""Compact binary encoding of JSON-like values.
+
+Every value starts with a one byte tag. Numbers are fixed size
+little-endian, strings, bytes, lists and maps carry a `u32` length
+prefix. Map keys may be any encodable value.
+"""
+import struct
+
+NONE = b'N'
+TRUE = b'T'
+FALSE = b'F'
+INT = b'i'
+BIGINT = b'z'
+FLOAT = b'd'
+STR = b's'
+BYTES = b'b'
+LIST = b'l'
+MAP = b'm'
+
+I64 = struct.Struct('<q')
+F64 = struct.Struct('<d')
+U32 = struct.Struct('<I')
+
+
+class CodecError(ValueError):
+    pass
+
+
+def encode(value) -> bytes:
+    out = bytearray()
+    write(value, out)
+    return bytes(out)
+
+
+def write(value, out: bytearray) -> None:
+    if value is None:
+        out += NONE
+    elif value is True:
+        out += TRUE
+    elif value is False:
+        out += FALSE
+    elif isinstance(value, int):
+        if -(1 << 63) <= value < (1 << 63):
+            out += INT
+            out += I64.pack(value)
+        else:
+            digits = str(int(value)).encode()
+            out += BIGINT
+            out += U32.pack(len(digits))
+            out += digits
+    elif isinstance(value, float):
+        out += FLOAT
+        out += F64.pack(value)
+    elif isinstance(value, str):
+        data = value.encode()
+        out += STR
+        out += U32.pack(len(data))
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        out += BYTES
+        out += U32.pack(len(value))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        out += LIST
+        out += U32.pack(len(value))
+        for item in value:
+            write(item, out)
+    elif isinstance(value, dict):
+        out += MAP
+        out += U32.pack(len(value))
+        for key, item in value.items():
+            write(key, out)
+            write(item, out)
+    else:
+        raise CodecError(f'Cannot encode {type(value).__name__}')
+
+
+def decode(data: bytes):
+    try:
+        value, end = read(data, 0)
+    except CodecError:
+        raise
+    except (struct.error, ValueError, TypeError, RecursionError) as e:
+        raise CodecError(f'Malformed frame: {e}') from e
+    if end != len(data):
+        raise CodecError('Malformed frame: trailing bytes')
+    return value
+
+
+def read(data: bytes, pos: int):
+    tag = data[pos:pos + 1]
+    pos += 1
+    if tag == INT:
+        return I64.unpack_from(data, pos)[0], pos + I64.size
+    if tag == STR:
+        size = U32.unpack_from(data, pos)[0]
+        pos += U32.size
+        return sized(data, pos, size).decode(), pos + size
+    if tag == MAP:
+        count = U32.unpack_from(data, pos)[0]
+        pos += U32.size
+        value = {}
+        for _ in range(count):
+            key, pos = read(data, pos)
+            value[key], pos = read(data, pos)
+        return value, pos
+    if tag == LIST:
+        count = U32.unpack_from(data, pos)[0]
+        pos += U32.size
+        value = []
+        for _ in range(count):
+            item, pos = read(data, pos)
+            value.append(item)
+        return value, pos
+    if tag == NONE:
+        return None, pos
+    if tag == TRUE:
+        return True, pos
+    if tag == FALSE:
+        return False, pos
+    if tag == FLOAT:
+        return F64.unpack_from(data, pos)[0], pos + F64.size
+    if tag == BYTES:
+        size = U32.unpack_from(data, pos)[0]
+        pos += U32.size
+        return bytes(sized(data, pos, size)), pos + size
+    if tag == BIGINT:
+        size = U32.unpack_from(data, pos)[0]
+        pos += U32.size
+        return int(sized(data, pos, size)), pos + size
+    raise CodecError(f'Malformed frame: unknown tag {tag!r} at {pos - 1}')
+
+
+def sized(data: bytes, pos: int, size: int) -> bytes:
+    if pos + size > len(data):
+        raise CodecError('Malformed frame: truncated')
+    return data[pos:pos + size]
@@ -0,0 +1,19 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from app.settings.settings import ENGINE_WORKERS, FINISH_WORKERS
+
+executor = ThreadPoolExecutor(max_workers=ENGINE_WORKERS, thread_name_prefix='engine')
+# ends transactions, a request blocked on a lock never holds up the commit that frees it
+finisher = ThreadPoolExecutor(max_workers=FINISH_WORKERS, thread_name_prefix='finish')
+
+
+async def run(func, *args, **kwargs):
+    """Run a blocking engine call on the worker pool without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+async def finish(func, *args, **kwargs):
+    """Run a commit or rollback on its own pool, see `finisher`."""
+    return await asyncio.get_running_loop().run_in_executor(finisher, partial(func, *args, **kwargs))
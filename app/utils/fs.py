@@ -0,0 +1,32 @@
+import os
+from contextlib import contextmanager
+
+
+def fsync_dir(path: str) -> None:
+    fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(path: str):
+    """Open `path + '.tmp'` for writing and rename it over `path` once the block succeeds."""
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    fsync_dir(path)
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    with atomic_open(path) as f:
+        f.write(data)
@@ -0,0 +1,177 @@
+import bisect
+import functools
+import threading
+import time
+from typing import Iterable, Iterator
+
+# upper bounds in seconds, from 50us to 10s
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+           5, 10)
+
+
+class Counter:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self) -> None:
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'lock')
+
+    def __init__(self, buckets: tuple = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def cumulative(self) -> tuple[list[int], float]:
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        for i in range(1, len(counts)):
+            counts[i] += counts[i - 1]
+        return counts, total
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the `q` quantile, None before any observation."""
+        counts, _ = self.cumulative()
+        if not counts[-1]:
+            return None
+        i = bisect.bisect_left(counts, q * counts[-1])
+        return self.buckets[i] if i < len(self.buckets) else float('inf')
+
+
+class Registry:
+    """Metric families by name, each holding one metric per label set.
+
+    Metrics are created on first use and live as long as the process.
+    Callers on a hot path keep the metric they get instead of looking it
+    up on every event.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.families: dict[str, tuple[str, str, dict[tuple, Counter | Histogram]]] = {}
+
+    def metric(self, kind: str, name: str, documentation: str, labels: dict):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = (kind, documentation, {})
+            elif family[0] != kind:
+                raise ValueError(f'Metric {name} is a {family[0]}')
+            metrics = family[2]
+            if key not in metrics:
+                metrics[key] = Counter() if kind == 'counter' else Histogram()
+            return metrics[key]
+
+    def counter(self, name: str, documentation: str, **labels) -> Counter:
+        return self.metric('counter', name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, **labels) -> Histogram:
+        return self.metric('histogram', name, documentation, labels)
+
+    def items(self) -> list[tuple[str, str, str, list]]:
+        with self.lock:
+            return [(name, kind, documentation, list(metrics.items()))
+                    for name, (kind, documentation, metrics) in sorted(self.families.items())]
+
+    def snapshot(self) -> dict:
+        """Current values: counters as numbers, histograms as count, sum, p50 and p99."""
+        result = {}
+        for name, kind, _, metrics in self.items():
+            for key, metric in metrics:
+                if kind == 'counter':
+                    value = metric.value
+                else:
+                    counts, total = metric.cumulative()
+                    value = {'count': counts[-1], 'sum': total,
+                             'p50': metric.quantile(0.5), 'p99': metric.quantile(0.99)}
+                result.setdefault(name, []).append(dict(key, value=value))
+        return result
+
+
+registry = Registry()
+
+
+def labels_text(labels: Iterable[tuple[str, object]]) -> str:
+    pairs = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                     for key, value in labels)
+    return '{' + pairs + '}' if pairs else ''
+
+
+def number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(gauges: list[tuple[str, str, str, dict, float]] = (), source: Registry = registry) -> str:
+    """The metrics of `source` and the `(name, kind, help, labels, value)` samples in `gauges`
+    in the Prometheus text exposition format."""
+    lines = []
+    for name, kind, documentation, metrics in source.items():
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key, metric in metrics:
+            if kind == 'counter':
+                lines.append(f'{name}{labels_text(key)} {number(metric.value)}')
+                continue
+            counts, total = metric.cumulative()
+            for bound, count in zip(metric.buckets + (float('inf'),), counts):
+                lines.append(f'{name}_bucket{labels_text(key + (("le", number(bound)),))} {count}')
+            lines.append(f'{name}_sum{labels_text(key)} {number(total)}')
+            lines.append(f'{name}_count{labels_text(key)} {counts[-1]}')
+    described = set()
+    for name, kind, documentation, labels, value in gauges:
+        if name not in described:
+            described.add(name)
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name}{labels_text(labels.items())} {number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def timed(histogram: Histogram):
+    """Decorator observing the duration of every call in `histogram`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def timed_rows(histogram: Histogram, started: float, rows: Iterator) -> Iterator:
+    """Pass `rows` through, observing the time since `started` spent producing them
+    once they run out or the iterator is closed. Time the consumer spends between
+    rows is not counted."""
+    elapsed = time.perf_counter() - started
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield row
+    finally:
+        histogram.observe(elapsed)
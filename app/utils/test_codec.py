@@ -0,0 +1,35 @@
+import math
+
+import pytest
+
+from app.utils.codec import CodecError, decode, encode
+
+VALUES = [
+    None, True, False, 0, -1, (1 << 63) - 1, -(1 << 63), 1 << 64, -(1 << 100), 1.5, -0.0, math.inf,
+    '', 'ascii', 'ünïcødé ✓', b'', b'\x00\xff', [], [1, 'a', None, [2.5, {}]],
+    {'_id': 1, 'doc': {'k': [True, False], 'n': None}}, {1: 'int key', None: 'null key'},
+]
+
+
+@pytest.mark.parametrize('value', VALUES, ids=repr)
+def test_round_trip(value):
+    decoded = decode(encode(value))
+    assert decoded == value
+    assert type(decoded) is type(value)
+
+
+def test_tuples_decode_as_lists():
+    assert decode(encode((1, (2,)))) == [1, [2]]
+
+
+@pytest.mark.parametrize('data', [
+    b'', b'x', b'i\x01', b's\x05\x00\x00\x00ab', b'l\x02\x00\x00\x00N', b'NN',
+], ids=repr)
+def test_malformed_frames_are_refused(data):
+    with pytest.raises(CodecError):
+        decode(data)
+
+
+def test_unencodable_values_are_refused():
+    with pytest.raises(CodecError):
+        encode({'s': {1, 2}})
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from app.utils.metrics import Histogram, Registry, render, timed, timed_rows
+
+
+def test_histogram_counts_and_quantiles():
+    histogram = Histogram(buckets=(1, 2, 5))
+    assert histogram.quantile(0.5) is None
+    for value in (0.5, 1, 1.5, 3, 3, 4, 7):
+        histogram.observe(value)
+    # a value on a bound falls in that bucket
+    assert histogram.cumulative() == ([2, 3, 6, 7], 20.0)
+    assert (histogram.quantile(0.5), histogram.quantile(0.85), histogram.quantile(0.9)) == (5, 5, float('inf'))
+
+
+def test_metrics_are_created_once_per_label_set():
+    registry = Registry()
+    a = registry.counter('requests_total', 'Requests.', route='/a')
+    assert registry.counter('requests_total', 'Requests.', route='/a') is a
+    assert registry.counter('requests_total', 'Requests.', route='/b') is not a
+    with pytest.raises(ValueError):
+        registry.histogram('requests_total', 'Requests.')
+
+
+def test_render_in_the_text_exposition_format():
+    registry = Registry()
+    registry.counter('requests_total', 'Requests.', route='/a"b\\').inc(3)
+    registry.histogram('latency_seconds', 'Latency.', op='find').observe(0.2)
+    gauges = [('open', 'gauge', 'Open things.', {'kind': 'x'}, 2),
+              ('open', 'gauge', 'Open things.', {'kind': 'y'}, 0.5)]
+    lines = render(gauges, registry).splitlines()
+
+    assert lines[:2] == ['# HELP latency_seconds Latency.', '# TYPE latency_seconds histogram']
+    assert 'latency_seconds_bucket{op="find",le="0.1"} 0' in lines
+    assert 'latency_seconds_bucket{op="find",le="0.25"} 1' in lines
+    assert 'latency_seconds_bucket{op="find",le="+Inf"} 1' in lines
+    assert 'latency_seconds_sum{op="find"} 0.2' in lines and 'latency_seconds_count{op="find"} 1' in lines
+    assert 'requests_total{route="/a\\"b\\\\"} 3' in lines
+    # a gauge family is described once
+    assert lines[-4:] == ['# HELP open Open things.', '# TYPE open gauge', 'open{kind="x"} 2', 'open{kind="y"} 0.5']
+
+
+def test_timed_observes_failing_calls_too():
+    histogram = Histogram()
+
+    @timed(histogram)
+    def fail():
+        raise KeyError
+
+    with pytest.raises(KeyError):
+        fail()
+    assert histogram.cumulative()[0][-1] == 1
+
+
+def test_timed_rows_observes_once_when_closed_early():
+    histogram = Histogram()
+    rows = timed_rows(histogram, time.perf_counter(), iter(range(10)))
+    assert next(rows) == 0
+    assert histogram.cumulative()[0][-1] == 0
+    rows.close()
+    assert histogram.cumulative()[0][-1] == 1
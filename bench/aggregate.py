@@ -0,0 +1,109 @@
+"""Grouping on the client against `Database.aggregate` over the records and over the column cache.
+
+Loads `--records` documents with a `cat` out of `--groups` values and a
+numeric `x`, then times `--runs` times a `$match` on `x` followed by a
+`$group` on `cat` counting and summing `x`:
+
+- client: a find of every document, filtered and grouped in Python
+- rows: `aggregate` with the column cache off
+- columns: `aggregate` over the column cache, built by a first run not timed
+
+With `--writes` each run is preceded by a commit updating that many
+documents, which the column cache takes in incrementally.
+
+    python -m bench.aggregate [--records 100000] [--groups 10] [--runs 10] [--writes 0]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+from app.db.db import Database
+from app.settings import settings
+from app.utils.meta_singleton import MetaSingleton
+
+PIPELINE = [
+    {'$match': {'x': {'$gte': 100}}},
+    {'$group': {'_id': '$cat', 'n': {'$count': {}}, 'total': {'$sum': '$x'}}},
+]
+
+
+def on_client(db: Database, t_id: int) -> list[dict]:
+    groups = defaultdict(lambda: {'n': 0, 'total': 0})
+    for row in db.find(t_id, {}):
+        doc = row['doc']
+        if doc['x'] >= 100:
+            group = groups[doc['cat']]
+            group['n'] += 1
+            group['total'] += doc['x']
+    return [dict(group, _id=cat) for cat, group in groups.items()]
+
+
+MODES = {
+    'client': on_client,
+    'rows': lambda db, t_id: db.aggregate(t_id, PIPELINE),
+    'columns': lambda db, t_id: db.aggregate(t_id, PIPELINE),
+}
+
+
+def measure(mode: str, args) -> dict:
+    settings.COLUMN_CACHE_FIELDS = 16 if mode == 'columns' else 0
+    settings.QUERY_CACHE_BYTES = 0
+    MetaSingleton._instances.pop(Database, None)
+    db = Database()
+    rng = random.Random(1)
+    t_id = db.begin_transaction('read_committed')
+    db.insert_many(t_id, [(f'doc-{i}', {'cat': f'cat-{rng.randrange(args.groups)}', 'x': rng.randrange(1000)})
+                          for i in range(args.records)])
+    db.commit(t_id)
+    if mode == 'columns':
+        t_id = db.begin_transaction('read_only')
+        db.aggregate(t_id, PIPELINE)
+        db.commit(t_id)
+
+    timings = []
+    for _ in range(args.runs):
+        if args.writes:
+            t_id = db.begin_transaction('read_committed')
+            for i in rng.sample(range(args.records), args.writes):
+                db.update(t_id, {'cat': f'cat-{rng.randrange(args.groups)}', 'x': {'$gte': 0}}, 1,
+                          {'cat': f'cat-{rng.randrange(args.groups)}', 'x': rng.randrange(1000)})
+            db.commit(t_id)
+        t_id = db.begin_transaction('read_only')
+        started = time.perf_counter()
+        groups = MODES[mode](db, t_id)
+        timings.append(time.perf_counter() - started)
+        db.commit(t_id)
+    columns = db.columns.describe()
+    db.close()
+    return {
+        'mode': mode,
+        'groups': len(groups),
+        'median_ms': round(statistics.median(timings) * 1000, 2),
+        'min_ms': round(min(timings) * 1000, 2),
+        'column_cache_builds': columns['builds'],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=100_000)
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--writes', type=int, default=0)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in MODES:
+            os.chdir(tempfile.mkdtemp(dir=workdir))
+            results.append(measure(mode, args))
+    print(json.dumps(dict(vars(args), results=results), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Throughput of the bulk write paths against one call per document.
+
+Calls the route handlers in-process, without HTTP, in a scratch
+directory. Inserts `--records` documents one `insert_one` at a time,
+the way `insert_many` used to, and then with one `insert_many`. Then it
+applies `--ops` updates and deletes one `update`/`delete` at a time and
+as one `bulk_update`/`bulk_delete`. Every step runs in its own
+transaction, commit included.
+
+    python -m bench.bulk [--records 20000] [--ops 200]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+from app.db.db import Database
+from app.models import command
+from app.routers import db as routes
+
+
+def make_doc(i: int, tag: str) -> dict:
+    return {'k': i, 'tag': tag, 'first': 'Alan', 'last': 'Turing'}
+
+
+def timed(db: Database, work) -> float:
+    t_id = db.begin_transaction('read_committed')
+    started = time.perf_counter()
+    asyncio.run(work(t_id))
+    db.commit(t_id)
+    return time.perf_counter() - started
+
+
+def rate(count: int, elapsed: float) -> float:
+    return round(count / elapsed, 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20_000)
+    parser.add_argument('--ops', type=int, default=200)
+    args = parser.parse_args()
+    n, ops = args.records, args.ops
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        db = Database()
+
+        def insert(i: int, tag: str) -> command.Insert:
+            return command.Insert(name=f'name-{i}', doc=make_doc(i, tag))
+
+        def update(i: int, tag: str) -> command.Update:
+            return command.Update(filter={'query': {'tag': tag, 'k': i}}, set=make_doc(i, tag))
+
+        def delete(i: int, tag: str) -> command.Delete:
+            return command.Delete(filter={'query': {'tag': tag, 'k': i}})
+
+        async def insert_each(t_id: int) -> None:
+            for i in range(n):
+                await routes.insert_one(t_id, insert(i, 'each'))
+
+        async def insert_bulk(t_id: int) -> None:
+            await routes.insert_many(t_id, [insert(i, 'bulk') for i in range(n)])
+
+        async def update_each(t_id: int) -> None:
+            for i in range(ops):
+                await routes.update(t_id, update(i, 'each'))
+
+        async def update_bulk(t_id: int) -> None:
+            await routes.bulk_update(t_id, [update(i, 'bulk') for i in range(ops)])
+
+        async def delete_each(t_id: int) -> None:
+            for i in range(ops):
+                await routes.delete(t_id, delete(i, 'each'))
+
+        async def delete_bulk(t_id: int) -> None:
+            await routes.bulk_delete(t_id, [delete(i, 'bulk') for i in range(ops)])
+
+        results = {}
+        for name, count, each, bulk in (('insert', n, insert_each, insert_bulk),
+                                        ('update', ops, update_each, update_bulk),
+                                        ('delete', ops, delete_each, delete_bulk)):
+            each_s, bulk_s = timed(db, each), timed(db, bulk)
+            results[name] = {
+                'per_document_per_s': rate(count, each_s),
+                'bulk_per_s': rate(count, bulk_s),
+                'speedup': round(each_s / bulk_s, 1),
+            }
+        db.close()
+
+    print(json.dumps({'records': n, 'ops': ops, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Throughput of the HTTP API against the number of concurrent clients.
+
+Starts the app with uvicorn in a scratch directory, loads `--records`
+documents, then for every client count runs `--duration` seconds of
+`begin, find, insert, commit` sessions where every find scans the
+whole collection.
+
+    python -m bench.concurrency [--clients 1,2,4,8,16] [--duration 5] [--records 5000]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PREFIX = '/api/v1/db'
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Client:
+    def __init__(self, port: int) -> None:
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def post(self, path: str, body=None):
+        self.conn.request('POST', PREFIX + path, body=json.dumps(body or {}),
+                          headers={'Content-Type': 'application/json'})
+        response = self.conn.getresponse()
+        data = response.read()
+        if response.status >= 300:
+            raise RuntimeError(f'{path}: {response.status} {data[:200]}')
+        return json.loads(data)
+
+    def begin(self, transaction_type: str = 'read_committed') -> int:
+        return self.post(f'/begin/{transaction_type}')['transaction_id']
+
+
+def start_server(port: int, workdir: str) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('server did not start')
+
+
+def session(client: Client, i: int) -> None:
+    t_id = client.begin()
+    client.post(f'/find/{t_id}', {'filter': {'cond': {'field': 'group', 'predicate': '$eq', 'value': i % 10}}})
+    client.post(f'/insert_one/{t_id}', {'name': f'bench-{i}', 'doc': {'group': i % 10}})
+    client.post(f'/commit/{t_id}')
+
+
+def measure(port: int, clients: int, duration: float) -> dict:
+    stop = time.monotonic() + duration
+    counts = [0] * clients
+    latencies: list[float] = []
+
+    def worker(n: int) -> None:
+        client = Client(port)
+        while time.monotonic() < stop:
+            started = time.monotonic()
+            session(client, counts[n])
+            latencies.append(time.monotonic() - started)
+            counts[n] += 1
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        'clients': clients,
+        'sessions_per_s': round(sum(counts) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', default='1,2,4,8,16')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--records', type=int, default=5000)
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(port, workdir)
+        try:
+            client = Client(port)
+            t_id = client.begin()
+            for i in range(args.records):
+                client.post(f'/insert_one/{t_id}', {'name': f'seed-{i}', 'doc': {'group': i % 10}})
+            client.post(f'/commit/{t_id}')
+            results = [measure(port, int(n), args.duration) for n in args.clients.split(',')]
+        finally:
+            server.terminate()
+            server.wait()
+    print(json.dumps({'records': args.records, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Bytes per record, MVCC header and document included, for each record representation.
+
+    python -m bench.memory [--records N]
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from app.db.record import CompactRecord, Record
+
+
+def as_dict(_id: int, name: str, doc: dict, created_id: int) -> dict:
+    return {'_id': _id, 'name': name, 'doc': doc, 'created_id': created_id, 'expired_id': 0}
+
+
+def make_doc(i: int) -> dict:
+    return {'first': 'Alan', 'last': 'Turing', 'year': 1912 + i % 100, 'tags': ['a', 'b']}
+
+
+def measure(factory, n: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [factory(i, f'name-{i % 100}', make_doc(i), 1) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return round((after - before) / n, 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        'records': args.records,
+        'bytes_per_record': {
+            'dict': measure(as_dict, args.records),
+            'record': measure(Record, args.records),
+            'compact_record': measure(CompactRecord, args.records),
+        }
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Throughput and abort rate of the lock-based and optimistic transaction types under contention.
+
+Loads `--keys` counters, then for every transaction type runs
+`--clients` threads for `--duration` seconds, each looping over
+transactions that find `--reads` random counters by an indexed `key`,
+waits `--think-ms` (a client round trip) and increments one of them.
+Another `--scanners` threads loop over transactions that sum every
+counter with one unindexed find, which is where read locks hurt most.
+A transaction that fails is rolled back and counted as an abort.
+Fewer keys or more clients mean more contention. `lost_updates` checks
+that the counters add up to the number of commits.
+
+    python -m bench.occ [--types serializable,repeatable_read,optimistic] [--clients 8] [--keys 100]
+                        [--reads 4] [--think-ms 1] [--scanners 0] [--duration 5] [--lock-timeout 0.05]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from app.db.db import Database
+from app.db.index import IndexType
+from app.settings import settings
+from app.utils.meta_singleton import MetaSingleton
+
+
+def open_database(lock_timeout_s: float, keys: int) -> Database:
+    settings.LOCK_TIMEOUT_S = lock_timeout_s
+    MetaSingleton._instances.pop(Database, None)
+    db = Database()
+    db.create_index('key', 'key', IndexType.hash)
+    t_id = db.begin_transaction('read_committed')
+    db.insert_many(t_id, [(f'counter-{key}', {'key': key, 'v': 0}) for key in range(keys)])
+    db.commit(t_id)
+    return db
+
+
+def measure(transaction_type: str, args) -> dict:
+    db = open_database(args.lock_timeout, args.keys)
+    stop = time.monotonic() + args.duration
+    commits, aborts = [0] * args.clients, [0] * args.clients
+    scans, failed_scans = [0] * args.scanners, [0] * args.scanners
+    latencies: list[float] = []
+
+    def scanner(n: int) -> None:
+        while time.monotonic() < stop:
+            t_id = db.begin_transaction(transaction_type)
+            try:
+                sum(row['doc']['v'] for row in db.find(t_id, {'v': {'$gte': 0}}))
+                db.commit(t_id)
+                scans[n] += 1
+            except Exception:
+                if t_id in db.transactions:
+                    db.rollback(t_id)
+                failed_scans[n] += 1
+
+    def worker(n: int) -> None:
+        rng = random.Random(n)
+        mine = []
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            t_id = db.begin_transaction(transaction_type)
+            try:
+                docs = [doc for key in rng.sample(range(args.keys), args.reads)
+                        for doc in db.find(t_id, {'key': key}, 1)]
+                time.sleep(args.think_ms / 1000)
+                doc = rng.choice(docs)['doc']
+                db.update(t_id, {'key': doc['key']}, 1, dict(doc, v=doc['v'] + 1))
+                db.commit(t_id)
+                commits[n] += 1
+                mine.append(time.perf_counter() - started)
+            except Exception:
+                if t_id in db.transactions:
+                    db.rollback(t_id)
+                aborts[n] += 1
+        latencies.extend(mine)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.clients)]
+    threads += [threading.Thread(target=scanner, args=(n,)) for n in range(args.scanners)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    t_id = db.begin_transaction('read_committed')
+    total = sum(row['doc']['v'] for row in db.find(t_id, {}))
+    db.commit(t_id)
+    db.close()
+    latencies.sort()
+    attempts = sum(commits) + sum(aborts)
+    return {
+        'type': transaction_type,
+        'commits_per_s': round(sum(commits) / elapsed, 1),
+        'aborts_per_s': round(sum(aborts) / elapsed, 1),
+        'abort_rate': round(sum(aborts) / attempts, 3) if attempts else None,
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+        'scans_per_s': round(sum(scans) / elapsed, 1),
+        'failed_scans': sum(failed_scans),
+        'lost_updates': sum(commits) - total,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--types', default='serializable,repeatable_read,optimistic')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--keys', type=int, default=100)
+    parser.add_argument('--reads', type=int, default=4)
+    parser.add_argument('--think-ms', type=float, default=1)
+    parser.add_argument('--scanners', type=int, default=0)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--lock-timeout', type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for transaction_type in args.types.split(','):
+            os.chdir(tempfile.mkdtemp(dir=workdir))
+            results.append(measure(transaction_type, args))
+
+    config = {key: value for key, value in vars(args).items() if key != 'types'}
+    print(json.dumps(dict(config, results=results), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Full-scan latency against the partition count.
+
+Writes `--records` documents to a checkpoint in a scratch directory,
+then for every partition count reopens the database from it and times
+`--repeat` unindexed finds matching about 1% of the records, plus point
+reads by `_id`. With more than one partition the scan of the checkpoint
+segment is filtered by `min(partitions, --workers)` processes; the
+first scan, which starts them, is not timed.
+
+    python -m bench.partitions [--partitions 1,2,4,8] [--records 200000] [--repeat 5] [--workers 8]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from app.db.db import Database
+from app.settings import settings
+from app.utils.meta_singleton import MetaSingleton
+
+
+def open_database(partitions: int, workers: int) -> Database:
+    settings.PARTITIONS = partitions
+    settings.SCAN_WORKERS = workers
+    settings.PARALLEL_SCAN_MIN_RECORDS = 0
+    MetaSingleton._instances.pop(Database, None)
+    return Database()
+
+
+def measure(partitions: int, workers: int, records: int, repeat: int) -> dict:
+    db = open_database(partitions, workers)
+    try:
+        t_id = db.begin_transaction('read_committed')
+        query = {'group': 7}
+        list(db.find(t_id, query))
+        scans = []
+        for _ in range(repeat):
+            db.cache.clear()
+            started = time.perf_counter()
+            found = len(list(db.find(t_id, query)))
+            scans.append(time.perf_counter() - started)
+        ids = [random.randrange(records) + 1 for _ in range(10_000)]
+        started = time.perf_counter()
+        for _id in ids:
+            db.fetch_by_id(t_id, _id)
+        point = (time.perf_counter() - started) / len(ids)
+        db.commit(t_id)
+    finally:
+        db.close()
+    scans.sort()
+    return {
+        'partitions': partitions,
+        'found': found,
+        'scan_p50_ms': round(scans[len(scans) // 2] * 1000, 1),
+        'scan_min_ms': round(scans[0] * 1000, 1),
+        'get_us': round(point * 1e6, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--partitions', default='1,2,4,8')
+    parser.add_argument('--records', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        db = open_database(1, args.workers)
+        t_id = db.begin_transaction('read_committed')
+        db.insert_many(t_id, [(f'name-{i}', {'group': i % 100, 'first': 'Alan', 'last': 'Turing'})
+                              for i in range(args.records)])
+        db.commit(t_id)
+        db.checkpoint(full=True)
+        db.close()
+        results = [measure(int(n), args.workers, args.records, args.repeat) for n in args.partitions.split(',')]
+
+    print(json.dumps({'records': args.records, 'cpus': os.cpu_count(), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Per-operation latency and server CPU of the WebSocket session against REST.
+
+Starts the app with uvicorn in a scratch directory and runs `--ops`
+single-document inserts in one transaction for each mode:
+
+- rest: one keep-alive `POST /insert_one` per operation
+- ws_json, ws_binary: session requests, waiting for each reply
+- ws_json_pipelined, ws_binary_pipelined: up to `--window` requests in flight
+
+    python -m bench.session [--ops 5000] [--window 32]
+"""
+import argparse
+import collections
+import json
+import os
+import tempfile
+import time
+
+from websockets.sync.client import connect
+
+from app.utils import codec
+from bench.concurrency import Client, free_port, start_server
+
+
+def cpu_s(pid: int) -> float | None:
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def doc(i: int) -> dict:
+    return {'k': i, 'first': 'Alan', 'last': 'Turing', 'tags': ['a', 'b']}
+
+
+def rest(port: int, ops: int, window: int) -> list[float]:
+    client = Client(port)
+    t_id = client.begin()
+    latencies = []
+    for i in range(ops):
+        started = time.perf_counter()
+        client.post(f'/insert_one/{t_id}', {'name': f'rest-{i}', 'doc': doc(i)})
+        latencies.append(time.perf_counter() - started)
+    client.post(f'/commit/{t_id}')
+    return latencies
+
+
+def websocket(binary: bool):
+    dumps = codec.encode if binary else json.dumps
+    loads = codec.decode if binary else json.loads
+
+    def mode(port: int, ops: int, window: int) -> list[float]:
+        with connect(f'ws://127.0.0.1:{port}/api/v1/db/session', max_size=None) as ws:
+            ws.send(dumps({'id': 0, 'op': 'begin'}))
+            loads(ws.recv())
+            sent: dict[int, float] = {}
+            latencies = []
+            pending = collections.deque(range(1, ops + 1))
+            while pending or sent:
+                while pending and len(sent) < window:
+                    i = pending.popleft()
+                    sent[i] = time.perf_counter()
+                    ws.send(dumps({'id': i, 'op': 'insert', 'name': f'ws-{i}', 'doc': doc(i)}))
+                reply = loads(ws.recv())
+                if reply.get('error'):
+                    raise RuntimeError(reply['error'])
+                latencies.append(time.perf_counter() - sent.pop(reply['id']))
+            ws.send(dumps({'id': -1, 'op': 'commit'}))
+            loads(ws.recv())
+        return latencies
+
+    return mode
+
+
+def measure(name: str, mode, port: int, pid: int, ops: int, window: int) -> dict:
+    cpu = cpu_s(pid)
+    started = time.perf_counter()
+    latencies = sorted(mode(port, ops, window))
+    elapsed = time.perf_counter() - started
+    cpu = cpu_s(pid) - cpu if cpu is not None else None
+    return {
+        'mode': name,
+        'ops_per_s': round(ops / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        'server_cpu_us_per_op': round(cpu / ops * 1e6, 1) if cpu is not None else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ops', type=int, default=5000)
+    parser.add_argument('--window', type=int, default=32)
+    args = parser.parse_args()
+
+    modes = {
+        'rest': (rest, 1),
+        'ws_json': (websocket(binary=False), 1),
+        'ws_binary': (websocket(binary=True), 1),
+        'ws_json_pipelined': (websocket(binary=False), args.window),
+        'ws_binary_pipelined': (websocket(binary=True), args.window),
+    }
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(port, workdir)
+        try:
+            results = [measure(name, mode, port, server.pid, args.ops, window)
+                       for name, (mode, window) in modes.items()]
+        finally:
+            server.terminate()
+            server.wait()
+    print(json.dumps({'ops': args.ops, 'window': args.window, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
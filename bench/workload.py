@@ -0,0 +1,109 @@
+"""YCSB-style workload generation: key distributions, documents and operation mixes.
+
+Everything is derived from a seed, so a workload replays the same
+operations on every run and every commit.
+"""
+import bisect
+import itertools
+import random
+
+# operation mixes, fractions of the operations of a run
+WORKLOADS = {
+    'read_heavy': {'read': 0.95, 'update': 0.05},
+    'update_heavy': {'read': 0.5, 'update': 0.5},
+    'scan_heavy': {'scan': 0.95, 'insert': 0.05},
+    'insert_only': {'insert': 1.0},
+}
+
+FIELDS = 10
+
+
+class Uniform:
+    def __init__(self, count: int, rng: random.Random) -> None:
+        self.count = count
+        self.rng = rng
+
+    def next(self) -> int:
+        return self.rng.randrange(self.count)
+
+
+class Zipfian:
+    """Keys in `[0, count)` with the popularity of rank r proportional to 1 / r^theta.
+
+    Ranks are drawn as in YCSB's ZipfianGenerator (Gray et al., "Quickly
+    generating billion-record synthetic databases") and scrambled with a
+    hash so the hot keys are spread over the key space, not clustered at
+    its start.
+    """
+
+    def __init__(self, count: int, rng: random.Random, theta: float = 0.99) -> None:
+        self.count = count
+        self.rng = rng
+        self.theta = theta
+        self.zetan = sum(1 / i ** theta for i in range(1, count + 1))
+        self.alpha = 1 / (1 - theta)
+        self.eta = (1 - (2 / count) ** (1 - theta)) / (1 - (1 + 0.5 ** theta) / self.zetan)
+
+    def rank(self) -> int:
+        u = self.rng.random()
+        uz = u * self.zetan
+        if uz < 1:
+            return 0
+        if uz < 1 + 0.5 ** self.theta:
+            return 1
+        return min(int(self.count * (self.eta * u - self.eta + 1) ** self.alpha), self.count - 1)
+
+    def next(self) -> int:
+        # FNV-1a of the rank
+        h = 0xcbf29ce484222325
+        for byte in self.rank().to_bytes(8, 'little'):
+            h = ((h ^ byte) * 0x100000001b3) & 0xffffffffffffffff
+        return h % self.count
+
+
+DISTRIBUTIONS = {'uniform': Uniform, 'zipfian': Zipfian}
+
+
+def make_doc(key: int, size: int, rng: random.Random) -> dict:
+    """A document with an integer `key` and FIELDS string fields of about `size` bytes in total."""
+    width = max(size // FIELDS, 1)
+    doc = {'key': key}
+    for i in range(FIELDS):
+        doc[f'field{i}'] = rng.randbytes((width + 1) // 2).hex()[:width]
+    return doc
+
+
+def operations(workload: str, count: int, records: int, doc_size: int, distribution: str, max_scan: int,
+               seed: int, client: int = 0, clients: int = 1) -> list[tuple]:
+    """The `count` operations of one client, `(kind, key, arg)` tuples.
+
+    read: `arg` is None; update: `arg` is the new doc; scan: `arg` is the
+    number of keys from `key` on; insert: `key` is new and `arg` is its
+    doc. Clients insert disjoint keys past the `records` loaded ones.
+    """
+    rng = random.Random(seed * 1000 + client)
+    keys = DISTRIBUTIONS[distribution](records, rng)
+    kinds, weights = zip(*WORKLOADS[workload].items())
+    cumulative = list(itertools.accumulate(weights))
+    inserted = itertools.count(records + client, clients)
+    ops = []
+    for _ in range(count):
+        kind = kinds[min(bisect.bisect(cumulative, rng.random() * cumulative[-1]), len(kinds) - 1)]
+        if kind == 'insert':
+            key = next(inserted)
+            ops.append((kind, key, make_doc(key, doc_size, rng)))
+        elif kind == 'update':
+            key = keys.next()
+            ops.append((kind, key, make_doc(key, doc_size, rng)))
+        elif kind == 'scan':
+            ops.append((kind, keys.next(), rng.randint(1, max_scan)))
+        else:
+            ops.append((kind, keys.next(), None))
+    return ops
+
+
+def query(kind: str, key: int, arg) -> tuple[dict, int]:
+    """Query and limit of a read, update or scan."""
+    if kind == 'scan':
+        return {'key': {'$gte': key, '$lt': key + arg}}, arg
+    return {'key': key}, 1
@@ -0,0 +1,251 @@
+"""YCSB-style workloads against the engine in process and over HTTP.
+
+For every workload, mode and transaction type, loads `--records`
+documents of about `--doc-size` bytes with an ordered index on `key`
+into a fresh scratch directory, then runs `--ops` operations split over
+`--clients` threads, each operation in its own transaction of the type.
+Workloads (see `bench.workload.WORKLOADS`):
+
+- read_heavy: 95% reads, 5% updates
+- update_heavy: 50% reads, 50% updates
+- scan_heavy: 95% scans of up to `--max-scan` keys, 5% inserts
+- insert_only: inserts
+
+Modes:
+
+- inprocess: `Database` calls in a fresh spawned process per run
+- http: one `POST /batch` with `implicit` per operation against uvicorn
+
+Keys are drawn `--distribution` uniform or zipfian, operations are
+generated from `--seed` so every run replays the same ones. Prints, and
+with `--out` writes, JSON with throughput, p50/p99 latency overall and
+per operation kind, errors (rolled back operations) and peak RSS of the
+process running the engine.
+
+    python -m bench.ycsb [--workloads read_heavy,update_heavy,scan_heavy,insert_only] [--modes inprocess,http]
+                         [--types read_committed,...] [--records 10000] [--ops 10000] [--clients 1]
+                         [--doc-size 100] [--distribution zipfian] [--max-scan 100] [--seed 1] [--out FILE]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+
+from app.db.transaction import TransactionType
+from bench.concurrency import ROOT, Client, free_port, start_server
+from bench.workload import WORKLOADS, make_doc, operations, query
+
+LOAD_BATCH = 1000
+
+
+def load_batches(records: int, doc_size: int, seed: int):
+    rng = random.Random(seed)
+    for start in range(0, records, LOAD_BATCH):
+        yield [(f'user{key}', make_doc(key, doc_size, rng)) for key in range(start, min(start + LOAD_BATCH, records))]
+
+
+def percentile(latencies: list[float], q: float) -> float | None:
+    if not latencies:
+        return None
+    return round(latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1000, 3)
+
+
+def summarize(latencies: dict[str, list[float]], errors: int, elapsed: float) -> dict:
+    everything = sorted(latency for kind in latencies.values() for latency in kind)
+    return {
+        'ops': len(everything),
+        'errors': errors,
+        'ops_per_s': round(len(everything) / elapsed, 1),
+        'p50_ms': percentile(everything, 0.5),
+        'p99_ms': percentile(everything, 0.99),
+        'by_op': {kind: {'ops': len(values), 'p50_ms': percentile(sorted(values), 0.5),
+                         'p99_ms': percentile(sorted(values), 0.99)}
+                  for kind, values in sorted(latencies.items())},
+    }
+
+
+def drive(config: dict, execute) -> dict:
+    """Run the operations of every client on its own thread, `execute(client, op)` returns
+    False when the operation failed."""
+    clients = config['clients']
+    plans = [operations(config['workload'], config['ops'] // clients, config['records'], config['doc_size'],
+                        config['distribution'], config['max_scan'], config['seed'], client, clients)
+             for client in range(clients)]
+    latencies: dict[str, list[float]] = {}
+    errors = [0] * clients
+    lock = threading.Lock()
+
+    def worker(client: int) -> None:
+        mine: dict[str, list[float]] = {}
+        for op in plans[client]:
+            started = time.perf_counter()
+            ok = execute(client, op)
+            mine.setdefault(op[0], []).append(time.perf_counter() - started)
+            errors[client] += not ok
+        with lock:
+            for kind, values in mine.items():
+                latencies.setdefault(kind, []).extend(values)
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, sum(errors), time.perf_counter() - started)
+
+
+def run_in_process(config: dict) -> dict:
+    """One run in this process, which should be fresh: peak RSS covers the whole process."""
+    from app.db.db import Database
+    from app.db.index import IndexType
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        db = Database()
+        try:
+            db.create_index('key', 'key', IndexType.ordered)
+            started = time.perf_counter()
+            for batch in load_batches(config['records'], config['doc_size'], config['seed']):
+                t_id = db.begin_transaction(TransactionType.read_committed)
+                db.insert_many(t_id, batch)
+                db.commit(t_id)
+            load_s = time.perf_counter() - started
+
+            def execute(client: int, op: tuple) -> bool:
+                kind, key, arg = op
+                t_id = db.begin_transaction(config['type'])
+                try:
+                    if kind == 'insert':
+                        db.insert_many(t_id, [(f'user{key}', arg)])
+                    elif kind == 'update':
+                        db.update(t_id, *query(kind, key, arg), new_doc=arg)
+                    else:
+                        list(db.find(t_id, *query(kind, key, arg)))
+                    db.commit(t_id)
+                    return True
+                except Exception:
+                    db.rollback(t_id)
+                    return False
+
+            result = drive(config, execute)
+        finally:
+            db.close()
+            os.chdir(ROOT)
+    return dict(result, load_ops_per_s=round(config['records'] / load_s, 1),
+                peak_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1))
+
+
+def in_process(config: dict) -> dict:
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(run_in_process, (config,))
+
+
+def peak_rss_mb(pid: int) -> float | None:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def batch_command(kind: str, key: int, arg) -> dict:
+    if kind == 'insert':
+        return {'op': 'insert', 'name': f'user{key}', 'doc': arg}
+    q, limit = query(kind, key, arg)
+    if kind == 'update':
+        return {'op': 'update', 'filter': {'cond': None, 'query': q, 'limit': limit}, 'set': arg}
+    return {'op': 'find', 'filter': {'cond': None, 'query': q, 'limit': limit}}
+
+
+def over_http(config: dict) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(port, workdir)
+        try:
+            client = Client(port)
+            client.post('/index', {'name': 'key', 'field': 'key', 'type': 'ordered'})
+            started = time.perf_counter()
+            for batch in load_batches(config['records'], config['doc_size'], config['seed']):
+                t_id = client.begin()
+                client.post(f'/insert_many/{t_id}', [{'name': name, 'doc': doc} for name, doc in batch])
+                client.post(f'/commit/{t_id}')
+            load_s = time.perf_counter() - started
+
+            connections = [Client(port) for _ in range(config['clients'])]
+
+            def execute(client: int, op: tuple) -> bool:
+                reply = connections[client].post('/batch', {'commands': [batch_command(*op)], 'implicit': True,
+                                                            'type': config['type']})
+                return reply['error'] is None
+
+            result = drive(config, execute)
+            rss = peak_rss_mb(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+    return dict(result, load_ops_per_s=round(config['records'] / load_s, 1), peak_rss_mb=rss)
+
+
+MODES = {'inprocess': in_process, 'http': over_http}
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workloads', default=','.join(WORKLOADS))
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--types', default=','.join(t.value for t in TransactionType))
+    parser.add_argument('--records', type=int, default=10_000)
+    parser.add_argument('--ops', type=int, default=10_000)
+    parser.add_argument('--clients', type=int, default=1)
+    parser.add_argument('--doc-size', type=int, default=100)
+    parser.add_argument('--distribution', choices=['uniform', 'zipfian'], default='zipfian')
+    parser.add_argument('--max-scan', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out')
+    args = parser.parse_args()
+
+    results = []
+    for workload in args.workloads.split(','):
+        for mode in args.modes.split(','):
+            for transaction_type in args.types.split(','):
+                config = {'workload': workload, 'mode': mode, 'type': transaction_type, 'records': args.records,
+                          'ops': args.ops, 'clients': args.clients, 'doc_size': args.doc_size,
+                          'distribution': args.distribution, 'max_scan': args.max_scan, 'seed': args.seed}
+                result = MODES[mode](config)
+                results.append(dict(workload=workload, mode=mode, transaction_type=transaction_type, **result))
+
+    report = {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items() if key != 'out'},
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()